@@ -0,0 +1,138 @@
+# benchmarks/datos_sinteticos.py (Datos sintéticos deterministas para los benchmarks)
+import os
+import random
+from string import Template
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+CARPETA_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+TIPOS_CONTRIBUYENTE = ['SOCIEDAD ANONIMA CERRADA', 'SOCIEDAD ANONIMA', 'EMPRESA INDIVIDUAL DE RESP. LTDA',
+                       'PERSONA NATURAL CON NEGOCIO', 'PERSONA NATURAL SIN NEGOCIO']
+ESTADOS = ['ACTIVO', 'ACTIVO', 'ACTIVO', 'BAJA DE OFICIO', 'SUSPENSION TEMPORAL']
+CONDICIONES = ['HABIDO', 'HABIDO', 'HABIDO', 'NO HABIDO']
+CANALES = ['WEB', 'MAIL', 'CALL', 'REFERIDO']
+ADMINISTRADORES = ['ADM 01', 'ADM 02', 'ADM 03', 'ADM 04', 'ADM 05']
+
+_plantillas: Dict[str, Template] = {}
+
+
+def plantilla(nombre: str) -> Template:
+    """Carga (una sola vez) una plantilla HTML de la carpeta fixtures."""
+    if nombre not in _plantillas:
+        with open(os.path.join(CARPETA_FIXTURES, nombre), 'r', encoding='utf-8') as f:
+            _plantillas[nombre] = Template(f.read())
+    return _plantillas[nombre]
+
+
+def generar_rucs(cantidad: int, semilla: int = 0, prefijo: str = '20') -> List[str]:
+    """Genera RUCs de 11 dígitos únicos y reproducibles."""
+    rng = random.Random(semilla)
+    rucs = set()
+    while len(rucs) < cantidad:
+        rucs.add(f"{prefijo}{rng.randrange(10 ** 9):09d}")
+    return sorted(rucs)
+
+
+def html_formulario() -> str:
+    return plantilla('formulario.html').safe_substitute()
+
+
+def html_principal(ruc: str) -> str:
+    """Página de resultado de la consulta; los valores dependen solo del RUC."""
+    rng = random.Random(f"principal-{ruc}")
+    return plantilla('principal.html').safe_substitute(
+        ruc=ruc,
+        razon_social=f"EMPRESA SINTETICA {ruc[-6:]} S.A.C.",
+        tipo=rng.choice(TIPOS_CONTRIBUYENTE),
+        fecha_inscripcion=f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1995, 2024)}",
+        estado=rng.choice(ESTADOS),
+        condicion=rng.choice(CONDICIONES),
+        numero_domicilio=rng.randint(1, 9999),
+    )
+
+
+def periodos_trabajadores(ruc: str, periodos: int = 12) -> Optional[List[Tuple[str, int, int, int]]]:
+    """(Período, trabajadores, pensionistas, prestadores) por período; None si 'sin declaraciones'."""
+    rng = random.Random(f"trabajadores-{ruc}")
+    if rng.random() < 0.1:
+        return None
+    base = rng.choice([rng.randint(1, 49), rng.randint(50, 800)])
+    filas = []
+    anio, mes = 2025, 9
+    for _ in range(periodos):
+        trabajadores = max(0, base + rng.randint(-5, 5))
+        filas.append((f"{anio}-{mes:02d}", trabajadores, rng.randint(0, 3), rng.randint(0, 20)))
+        mes -= 1
+        if mes == 0:
+            anio, mes = anio - 1, 12
+    return filas
+
+
+def html_trabajadores(ruc: str, periodos: int = 12) -> str:
+    """Página de cantidad de trabajadores (a veces 'sin declaraciones')."""
+    valores = periodos_trabajadores(ruc, periodos)
+    if valores is None:
+        return plantilla('sin_declaraciones.html').safe_substitute()
+    filas = [f"          <tr><td>{periodo}</td><td>{trabajadores}</td><td>{pensionistas}</td><td>{prestadores}</td></tr>"
+             for periodo, trabajadores, pensionistas, prestadores in valores]
+    return plantilla('trabajadores.html').safe_substitute(filas="\n".join(filas))
+
+
+def filas_trabajadores(ruc: str, periodos: int = 12) -> List[Dict[str, str]]:
+    """Las filas que devolvería parse_trabajadores_html para html_trabajadores(ruc), sin generar el HTML."""
+    valores = periodos_trabajadores(ruc, periodos)
+    if valores is None:
+        return [{'RUC': ruc, 'Mensaje': 'Sin declaraciones presentadas'}]
+    return [{'Período': periodo, 'N° de Trabajadores': str(trabajadores), 'N° de Pensionistas': str(pensionistas),
+             'N° de Prestadores de Servicio': str(prestadores), 'RUC': ruc}
+            for periodo, trabajadores, pensionistas, prestadores in valores]
+
+
+def escribir_htmls(rucs: List[str], ruta_base: str, periodos: int = 12) -> str:
+    """Escribe los HTML principal y de trabajadores de cada RUC en '<ruta_base>/html_consultas'."""
+    carpeta = os.path.join(ruta_base, "html_consultas")
+    os.makedirs(carpeta, exist_ok=True)
+    for ruc in rucs:
+        with open(os.path.join(carpeta, f"RUC_{ruc}_principal.html"), 'w', encoding='utf-8') as f:
+            f.write(html_principal(ruc))
+        with open(os.path.join(carpeta, f"RUC_{ruc}_trabajadores.html"), 'w', encoding='utf-8') as f:
+            f.write(html_trabajadores(ruc, periodos))
+    return carpeta
+
+
+def escribir_workbooks(filas: int, ruta_base: str, fraccion_clientes: float = 0.3,
+                       columnas_extra_saeps: int = 20, semilla: int = 0) -> Dict[str, str]:
+    """
+    Genera los libros Buzon EPS ('RUC', 'CANAL') y Clientes Activos SAEPS ('Ruc', 'Adm SAC ACT' y
+    columnas de relleno para simular una base ancha).
+    Parte de los RUCs del buzón se repite en SAEPS para ejercitar los cruces.
+    """
+    rng = random.Random(semilla)
+    os.makedirs(ruta_base, exist_ok=True)
+    rucs_buzon = generar_rucs(filas, semilla=semilla)
+    cantidad_cruzados = int(filas * fraccion_clientes)
+    rucs_clientes = rng.sample(rucs_buzon, cantidad_cruzados) + generar_rucs(filas - cantidad_cruzados, semilla=semilla + 1, prefijo='10')
+
+    df_buzon = pd.DataFrame({
+        'RUC': rucs_buzon,
+        'CANAL': [rng.choice(CANALES) for _ in rucs_buzon],
+        'FECHA': ['2025-09-01'] * len(rucs_buzon),
+        'CORREO': [f"contacto{i}@demo.pe" for i in range(len(rucs_buzon))],
+    })
+    datos_clientes = {
+        'Ruc': rucs_clientes,
+        'Adm SAC ACT': [rng.choice(ADMINISTRADORES) for _ in rucs_clientes],
+    }
+    for i in range(columnas_extra_saeps):
+        datos_clientes[f'Campo {i + 1:02d}'] = [f"valor {i}-{j % 97}" for j in range(len(rucs_clientes))]
+    df_clientes = pd.DataFrame(datos_clientes)
+
+    rutas = {
+        'buzon': os.path.join(ruta_base, f"buzon_eps_{filas}.xlsx"),
+        'clientes': os.path.join(ruta_base, f"clientes_saeps_{filas}.xlsx"),
+    }
+    df_buzon.to_excel(rutas['buzon'], index=False)
+    df_clientes.to_excel(rutas['clientes'], index=False)
+    return rutas
\ No newline at end of file
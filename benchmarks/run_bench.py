@@ -0,0 +1,298 @@
+# benchmarks/run_bench.py (Escenarios reproducibles de rendimiento)
+"""
+Ejecuta los escenarios de benchmark y reporta RUCs/seg, tiempos por etapa y pico de RSS.
+Cada escenario corre en un subproceso propio para que el pico de memoria sea independiente.
+
+Ejemplos (desde la raíz del repositorio):
+    python benchmarks/run_bench.py                                   # entrada, parseo y reporte a 1k/10k/100k
+    python benchmarks/run_bench.py --escenarios entrada --tamanos 100000
+    python benchmarks/run_bench.py --escenarios scraping --rucs-scraping 100 --latencia-ms 200 --tasa-error 0.05
+
+Escenarios:
+    entrada   obtener_rucs_de_excels sobre los libros Buzon/SAEPS sintéticos
+    parseo    parse_principal_html + parse_trabajadores_html sobre HTML sintéticos
+    trabajadores  pestaña de trabajadores: DataFrame, tipos compactos y período más reciente por RUC
+    reporte   generar_reporte_desde_htmls completo (lectura de bases + parseo + Excel)
+    scraping  consultar_y_guardar_todo contra el servidor local (requiere Playwright)
+    arranque  tiempo hasta la primera consulta: bases y navegador en secuencia vs. en paralelo (requiere Playwright,
+              o --simular-navegador-s N para reemplazar el lanzamiento por una espera de N segundos)
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+DIRECTORIO_BENCH = os.path.dirname(os.path.abspath(__file__))
+RAIZ_REPO = os.path.dirname(DIRECTORIO_BENCH)
+sys.path.insert(0, RAIZ_REPO)
+sys.path.insert(0, DIRECTORIO_BENCH)
+
+ESCENARIOS = ['entrada', 'parseo', 'trabajadores', 'reporte', 'scraping', 'arranque']
+MARCA_RESULTADO = "RESULTADO_BENCH "
+
+
+def pico_rss_mb() -> float:
+    """Pico de memoria residente del proceso actual, en MB."""
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta KB, macOS bytes
+        return pico / (1024 * 1024) if sys.platform == 'darwin' else pico / 1024
+    except ImportError:
+        try:
+            import psutil
+            memoria = psutil.Process().memory_info()
+            return getattr(memoria, 'peak_wset', memoria.rss) / (1024 * 1024)
+        except ImportError:
+            return float('nan')
+
+
+def preparar_workbooks(tamano: int, directorio: str) -> Dict[str, str]:
+    """Genera (o reutiliza) los libros sintéticos del tamaño indicado."""
+    import datos_sinteticos
+    carpeta = os.path.join(directorio, f"bases_{tamano}")
+    rutas = {
+        'buzon': os.path.join(carpeta, f"buzon_eps_{tamano}.xlsx"),
+        'clientes': os.path.join(carpeta, f"clientes_saeps_{tamano}.xlsx"),
+    }
+    if all(os.path.isfile(r) for r in rutas.values()):
+        return rutas
+    return datos_sinteticos.escribir_workbooks(tamano, carpeta)
+
+
+# --- Escenarios (se ejecutan dentro del subproceso) ---
+
+def escenario_entrada(tamano: int, args) -> Dict[str, Any]:
+    import proceso_datos
+    rutas = preparar_workbooks(tamano, args.directorio)
+    inicio = time.perf_counter()
+    rucs = proceso_datos.obtener_rucs_de_excels(rutas['buzon'], rutas['clientes'])
+    duracion = time.perf_counter() - inicio
+    return {'rucs': tamano, 'rucs_a_procesar': len(rucs), 'duracion_s': duracion}
+
+
+def escenario_parseo(tamano: int, args) -> Dict[str, Any]:
+    import datos_sinteticos
+    import proceso_datos
+    from instrumentacion import medir
+    rucs = datos_sinteticos.generar_rucs(min(tamano, args.max_htmls), semilla=7)
+    htmls = [(ruc, datos_sinteticos.html_principal(ruc), datos_sinteticos.html_trabajadores(ruc)) for ruc in rucs]
+    inicio = time.perf_counter()
+    acumulador = proceso_datos.AcumuladorColumnas()
+    for ruc, principal, trabajadores in htmls:
+        with medir('parseo_principal'):
+            proceso_datos.parse_principal_html(principal)
+        with medir('parseo_trabajadores'):
+            proceso_datos.acumular_trabajadores_html(trabajadores, ruc, acumulador)
+    with medir('dataframe_trabajadores'):
+        df = acumulador.a_dataframe()
+    duracion = time.perf_counter() - inicio
+    return {'rucs': len(rucs), 'filas_trabajadores': len(df), 'duracion_s': duracion}
+
+
+def escenario_trabajadores(tamano: int, args) -> Dict[str, Any]:
+    import datos_sinteticos
+    import proceso_datos
+    from instrumentacion import medir
+    rucs = datos_sinteticos.generar_rucs(tamano, semilla=7)
+    inicio = time.perf_counter()
+    with medir('dataframe_trabajadores'):
+        acumulador = proceso_datos.AcumuladorColumnas()
+        for ruc in rucs:
+            filas = datos_sinteticos.filas_trabajadores(ruc)
+            acumulador.agregar(list(filas[0]), [list(fila.values()) for fila in filas])
+        df = acumulador.a_dataframe()
+        del acumulador
+        df['Período'] = df['Período'].astype(str).str.replace('-', '', regex=False)
+    with medir('convertir_df_a_numerico'):
+        df = proceso_datos.convertir_df_a_numerico(df)
+    memoria_sin_compactar = df.memory_usage(deep=True).sum()
+    with medir('compactar_df_trabajadores'):
+        df = proceso_datos.compactar_df_trabajadores(df)
+    memoria_compacta = df.memory_usage(deep=True).sum()
+    with medir('ultima_cantidad_por_ruc'):
+        cantidades = proceso_datos.ultima_cantidad_por_ruc(df)
+    duracion = time.perf_counter() - inicio
+    return {'rucs': tamano, 'filas_trabajadores': len(df), 'rucs_con_cantidad': len(cantidades),
+            'df_sin_compactar_mb': round(memoria_sin_compactar / 2 ** 20, 1),
+            'df_compacto_mb': round(memoria_compacta / 2 ** 20, 1), 'duracion_s': duracion}
+
+
+def escenario_reporte(tamano: int, args) -> Dict[str, Any]:
+    import datos_sinteticos
+    import proceso_datos
+    rutas = preparar_workbooks(tamano, args.directorio)
+    carpeta_salida = os.path.join(args.directorio, f"reporte_{tamano}")
+    rucs = proceso_datos.obtener_rucs_de_excels(rutas['buzon'], rutas['clientes'])[:args.max_htmls]
+    carpeta_html = os.path.join(carpeta_salida, "html_consultas")
+    if not os.path.isdir(carpeta_html) or len(os.listdir(carpeta_html)) < 2 * len(rucs):
+        datos_sinteticos.escribir_htmls(rucs, carpeta_salida)
+    ruta_reporte = os.path.join(carpeta_salida, "reporte_bench.xlsx")
+    inicio = time.perf_counter()
+    proceso_datos.generar_reporte_desde_htmls(
+        ruta_salida=ruta_reporte,
+        rucs_a_procesar=rucs,
+        ruta_buzon_eps=rutas['buzon'],
+        ruta_clientes_activos=rutas['clientes']
+    )
+    duracion = time.perf_counter() - inicio
+    return {'rucs': len(rucs), 'filas_bases': tamano, 'duracion_s': duracion}
+
+
+def escenario_scraping(tamano: int, args) -> Dict[str, Any]:
+    import datos_sinteticos
+    import servidor_sunat
+    configuracion = servidor_sunat.ConfiguracionServidor(args.latencia_ms, args.jitter_ms, args.tasa_error)
+    servidor, url = servidor_sunat.iniciar_servidor(0, configuracion)
+    # Configurar el scraper antes de importarlo
+    os.environ['SUNAT_URL_CONSULTA'] = url
+    os.environ.setdefault('SUNAT_CANAL_NAVEGADOR', args.canal_navegador)
+    import web_scraping
+
+    rucs = datos_sinteticos.generar_rucs(min(tamano, args.rucs_scraping), semilla=11)
+    carpeta_salida = os.path.join(args.directorio, "scraping")
+    exitos = 0
+    inicio = time.perf_counter()
+    try:
+        for ruc in rucs:
+            if web_scraping.consultar_y_guardar_todo(ruc, carpeta_salida):
+                exitos += 1
+    finally:
+        servidor.shutdown()
+    duracion = time.perf_counter() - inicio
+    return {'rucs': len(rucs), 'exitos': exitos, 'duracion_s': duracion, 'servidor': configuracion.contadores}
+
+
+def escenario_arranque(tamano: int, args) -> Dict[str, Any]:
+    """
+    Tiempo hasta la primera consulta: bases y navegador en secuencia vs. en paralelo (lote.preparar_arranque).
+    Con --simular-navegador-s el navegador no se abre: su lanzamiento es una espera fija y el resultado
+    lo indica en 'navegador' (no es un tiempo medido con un navegador real).
+    """
+    os.environ.setdefault('SUNAT_CANAL_NAVEGADOR', args.canal_navegador)
+    import lote
+    import proceso_datos
+    import web_scraping
+    rutas = preparar_workbooks(tamano, args.directorio)
+    if args.simular_navegador_s:
+        def iniciar_simulado(sesion):
+            if sesion.page is None:
+                time.sleep(args.simular_navegador_s)
+                sesion.page = object()
+        web_scraping.SesionNavegador.iniciar = iniciar_simulado
+
+    inicio = time.perf_counter()
+    proceso_datos.cargar_bases_entrada(rutas['buzon'], rutas['clientes'], estricto=True)
+    web_scraping._initialize_browser_edge()
+    secuencial = time.perf_counter() - inicio
+    web_scraping._cleanup()
+
+    bases, tiempos = lote.preparar_arranque(rutas['buzon'], rutas['clientes'])
+    web_scraping._cleanup()
+    navegador = f"simulado ({args.simular_navegador_s:g}s)" if args.simular_navegador_s else 'real'
+    return {'rucs': len(bases.buzon), 'secuencial_s': round(secuencial, 3),
+            'paralelo_s': round(tiempos['primera_consulta'], 3), 'duracion_s': tiempos['primera_consulta'],
+            'navegador': navegador}
+
+
+def ejecutar_interno(escenario: str, tamano: int, args):
+    """Corre un escenario en este proceso e imprime el resultado como JSON en la última línea."""
+    import instrumentacion
+    instrumentacion.reiniciar()
+    funcion = {
+        'entrada': escenario_entrada,
+        'parseo': escenario_parseo,
+        'trabajadores': escenario_trabajadores,
+        'reporte': escenario_reporte,
+        'scraping': escenario_scraping,
+        'arranque': escenario_arranque,
+    }[escenario]
+    resultado = funcion(tamano, args)
+    resultado.update({
+        'escenario': escenario,
+        'tamano': tamano,
+        'rucs_por_seg': (resultado['rucs'] / resultado['duracion_s']) if resultado['duracion_s'] else None,
+        'pico_rss_mb': round(pico_rss_mb(), 1),
+        'etapas': instrumentacion.resumen(),
+    })
+    sys.stdout.write("\n" + MARCA_RESULTADO + json.dumps(resultado, ensure_ascii=False) + "\n")
+
+
+def ejecutar_en_subproceso(escenario: str, tamano: int, args) -> Dict[str, Any]:
+    comando = [sys.executable, os.path.abspath(__file__), '--interno', escenario, str(tamano)] + args.reenviar
+    proceso = subprocess.run(comando, capture_output=True, text=True, encoding='utf-8', errors='replace')
+    for linea in reversed(proceso.stdout.splitlines()):
+        if linea.startswith(MARCA_RESULTADO):
+            return json.loads(linea[len(MARCA_RESULTADO):])
+    return {'escenario': escenario, 'tamano': tamano, 'error': (proceso.stderr or proceso.stdout).strip()[-2000:]}
+
+
+def imprimir_tabla(resultados: List[Dict[str, Any]]):
+    print(f"\n{'escenario':<10} {'tamaño':>8} {'rucs':>7} {'seg':>9} {'RUC/s':>9} {'pico MB':>8}")
+    for r in resultados:
+        if 'error' in r:
+            print(f"{r['escenario']:<10} {r['tamano']:>8} ❌ {r['error'].splitlines()[-1] if r['error'] else 'error'}")
+            continue
+        print(f"{r['escenario']:<10} {r['tamano']:>8} {r['rucs']:>7} {r['duracion_s']:>9.2f} "
+              f"{(r['rucs_por_seg'] or 0):>9.1f} {r['pico_rss_mb']:>8.1f}")
+        if 'secuencial_s' in r:
+            print(f"{'':<12}· Arranque con navegador {r['navegador']}: {r['secuencial_s']}s en secuencia -> "
+                  f"{r['paralelo_s']}s en paralelo")
+        if 'df_compacto_mb' in r:
+            print(f"{'':<12}· DataFrame trabajadores: {r['df_sin_compactar_mb']} MB -> {r['df_compacto_mb']} MB compacto")
+        for etapa in r['etapas'][:6]:
+            print(f"{'':<12}· {etapa['etapa']:<36} {etapa['total_s']:>9.3f}s  ({etapa['llamadas']} llamadas)")
+
+
+def crear_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmarks del validador de leads SUNAT.")
+    parser.add_argument("--escenarios", default="entrada,parseo,trabajadores,reporte", help=f"Lista separada por comas: {','.join(ESCENARIOS)}")
+    parser.add_argument("--tamanos", default="1000,10000,100000", help="Filas de los libros sintéticos")
+    parser.add_argument("--directorio", default=os.path.join(DIRECTORIO_BENCH, "_datos"), help="Carpeta de trabajo (se reutiliza entre corridas)")
+    parser.add_argument("--salida", default=None, help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--max-htmls", type=int, default=5000, help="Máximo de RUCs con HTML en parseo/reporte")
+    parser.add_argument("--rucs-scraping", type=int, default=50, help="RUCs a consultar en el escenario scraping")
+    parser.add_argument("--latencia-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--canal-navegador", default="", help="Canal de Playwright ('' = Chromium, 'msedge')")
+    parser.add_argument("--simular-navegador-s", type=float, default=0.0, help="Escenario arranque: simular el lanzamiento del navegador con una espera de N segundos (0 = navegador real)")
+    parser.add_argument("--interno", nargs=2, metavar=("ESCENARIO", "TAMANO"), help=argparse.SUPPRESS)
+    return parser
+
+
+if __name__ == "__main__":
+    args = crear_parser().parse_args()
+    args.directorio = os.path.abspath(args.directorio)
+
+    if args.interno:
+        ejecutar_interno(args.interno[0], int(args.interno[1]), args)
+        sys.exit(0)
+
+    # Opciones que se reenvían a cada subproceso
+    args.reenviar = [
+        '--directorio', args.directorio, '--max-htmls', str(args.max_htmls),
+        '--rucs-scraping', str(args.rucs_scraping), '--latencia-ms', str(args.latencia_ms),
+        '--jitter-ms', str(args.jitter_ms), '--tasa-error', str(args.tasa_error),
+        '--canal-navegador', args.canal_navegador, '--simular-navegador-s', str(args.simular_navegador_s),
+    ]
+    escenarios = [e.strip() for e in args.escenarios.split(',') if e.strip()]
+    tamanos = [int(t) for t in args.tamanos.split(',') if t.strip()]
+    desconocidos = set(escenarios) - set(ESCENARIOS)
+    if desconocidos:
+        crear_parser().error(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+    resultados = []
+    for escenario in escenarios:
+        for tamano in ([min(tamanos)] if escenario == 'scraping' else tamanos):
+            print(f"▶️ {escenario} @ {tamano}...", flush=True)
+            resultados.append(ejecutar_en_subproceso(escenario, tamano, args))
+
+    imprimir_tabla(resultados)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultados guardados en: {args.salida}")
\ No newline at end of file
@@ -0,0 +1,125 @@
+# benchmarks/servidor_sunat.py (Servidor HTTP local que imita la consulta RUC de SUNAT)
+"""
+Uso independiente:
+    python benchmarks/servidor_sunat.py --puerto 8765 --latencia-ms 300 --tasa-error 0.05
+
+Luego apuntar el scraper al servidor:
+    SUNAT_URL_CONSULTA=http://127.0.0.1:8765/cl-ti-itmrconsruc/jcrS00Alias
+    SUNAT_CANAL_NAVEGADOR=   (vacío = Chromium de Playwright si no hay Edge)
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import datos_sinteticos  # noqa: E402
+
+RUTA_CONSULTA = "/cl-ti-itmrconsruc/jcrS00Alias"
+
+
+class ConfiguracionServidor:
+    """Parámetros de comportamiento del servidor (latencia y errores simulados)."""
+    def __init__(self, latencia_ms: float = 0.0, jitter_ms: float = 0.0, tasa_error: float = 0.0,
+                 semilla: int = 0):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.tasa_error = tasa_error
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.contadores = {'formulario': 0, 'principal': 0, 'trabajadores': 0, 'errores': 0}
+
+    def esperar(self):
+        with self._lock:
+            demora = self.latencia_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if demora > 0:
+            time.sleep(demora / 1000)
+
+    def falla(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.tasa_error
+
+    def contar(self, clave: str):
+        with self._lock:
+            self.contadores[clave] += 1
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    configuracion: ConfiguracionServidor = ConfiguracionServidor()
+
+    def log_message(self, format, *args):
+        pass  # Silencioso: la salida la controla el benchmark
+
+    def _responder(self, codigo: int, cuerpo: str):
+        datos = cuerpo.encode('utf-8')
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        if self.path.split('?')[0] != RUTA_CONSULTA:
+            self._responder(404, "<html><body>No encontrado</body></html>")
+            return
+        self.configuracion.esperar()
+        self.configuracion.contar('formulario')
+        self._responder(200, datos_sinteticos.html_formulario())
+
+    def do_POST(self):
+        if self.path.split('?')[0] != RUTA_CONSULTA:
+            self._responder(404, "<html><body>No encontrado</body></html>")
+            return
+        largo = int(self.headers.get('Content-Length', 0) or 0)
+        campos = parse_qs(self.rfile.read(largo).decode('utf-8'))
+        accion = campos.get('accion', [''])[0]
+        ruc = campos.get('nroRuc', [''])[0].strip()
+
+        self.configuracion.esperar()
+        if self.configuracion.falla():
+            self.configuracion.contar('errores')
+            self._responder(503, "<html><body>Servicio no disponible</body></html>")
+            return
+
+        if accion == 'consPorRuc':
+            self.configuracion.contar('principal')
+            self._responder(200, datos_sinteticos.html_principal(ruc))
+        elif accion == 'getCantTrab':
+            self.configuracion.contar('trabajadores')
+            self._responder(200, datos_sinteticos.html_trabajadores(ruc))
+        else:
+            self._responder(400, "<html><body>Acción no válida</body></html>")
+
+
+def iniciar_servidor(puerto: int = 0, configuracion: ConfiguracionServidor = None):
+    """
+    Inicia el servidor en un hilo daemon y devuelve (servidor, url_consulta).
+    Con puerto 0 se elige un puerto libre.
+    """
+    manejador = type('Manejador', (_Manejador,), {'configuracion': configuracion or ConfiguracionServidor()})
+    servidor = ThreadingHTTPServer(('127.0.0.1', puerto), manejador)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    url = f"http://127.0.0.1:{servidor.server_address[1]}{RUTA_CONSULTA}"
+    return servidor, url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local que imita la consulta RUC de SUNAT.")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    args = parser.parse_args()
+
+    servidor, url = iniciar_servidor(args.puerto, ConfiguracionServidor(args.latencia_ms, args.jitter_ms, args.tasa_error))
+    print(f"🧪 Servidor SUNAT local escuchando en {url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        servidor.shutdown()
\ No newline at end of file
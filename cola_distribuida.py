@@ -0,0 +1,322 @@
+# cola_distribuida.py (Modo coordinador/trabajadores sobre una cola compartida en SQLite)
+"""
+El coordinador carga los RUCs a procesar en un archivo SQLite; los trabajadores (en este u otros
+equipos) toman RUCs con un lease, los consultan con consultar_y_guardar_todo y reportan el
+resultado. El coordinador devuelve a la cola los leases vencidos y, cuando no queda nada
+pendiente, genera el reporte final.
+
+La cola y la carpeta de HTML ('html_consultas') deben estar en una carpeta compartida que vean
+todos los equipos. Se usa el journal por defecto de SQLite (no WAL) porque WAL no funciona en
+carpetas de red. Los leases usan la hora de cada equipo: conviene tener los relojes sincronizados.
+La duración del lease la fija el coordinador en la tabla 'meta' de la cola, así que vale también
+para trabajadores lanzados en otros equipos.
+
+Uso:
+    python main.py --coordinador COLA.db --buzon B.xlsx --clientes C.xlsx --salida DIR/reporte.xlsx [--trabajadores-locales 2]
+    python main.py --trabajador COLA.db --carpeta DIR
+"""
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import proceso_datos as logica_datos
+import web_scraping as ws
+import instrumentacion
+
+PENDIENTE = 'pendiente'
+EN_CURSO = 'en_curso'
+OK = 'ok'
+FALLIDO = 'fallido'
+
+DURACION_LEASE_SEGUNDOS = 600
+MAX_INTENTOS = 3
+
+# Claves de la tabla 'meta' (las escribe el coordinador)
+META_DURACION_LEASE = 'duracion_lease_segundos'
+META_ENCOLADO = 'encolado_completo'
+
+
+class ColaRucs:
+    """
+    Cola de RUCs con leases en un archivo SQLite compartido.
+    Si no se indica 'duracion_lease_segundos', se usa la que dejó el coordinador en la cola
+    (o DURACION_LEASE_SEGUNDOS si aún no hay ninguna).
+    """
+    def __init__(self, ruta_db: str, duracion_lease_segundos: Optional[float] = None,
+                 max_intentos: int = MAX_INTENTOS):
+        self.ruta_db = ruta_db
+        self._duracion_lease_segundos = duracion_lease_segundos
+        self.max_intentos = max_intentos
+        # isolation_level=None: las transacciones se abren explícitamente con BEGIN IMMEDIATE
+        self._conexion = sqlite3.connect(ruta_db, timeout=60, isolation_level=None)
+        self._conexion.execute("""
+            CREATE TABLE IF NOT EXISTS trabajos (
+                ruc TEXT PRIMARY KEY,
+                estado TEXT NOT NULL,
+                intentos INTEGER NOT NULL DEFAULT 0,
+                trabajador TEXT,
+                lease_hasta REAL,
+                actualizado REAL,
+                error TEXT
+            )""")
+        self._conexion.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado)")
+        self._conexion.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+
+    def cerrar(self):
+        self._conexion.close()
+
+    # --- Configuración compartida (tabla meta) ---
+    def _leer_meta(self, clave: str) -> Optional[str]:
+        fila = self._conexion.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
+
+    def _escribir_meta(self, clave: str, valor: str):
+        with self._transaccion():
+            self._conexion.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", (clave, valor))
+
+    @property
+    def duracion_lease_segundos(self) -> float:
+        if self._duracion_lease_segundos is not None:
+            return self._duracion_lease_segundos
+        valor = self._leer_meta(META_DURACION_LEASE)
+        return float(valor) if valor is not None else DURACION_LEASE_SEGUNDOS
+
+    def fijar_duracion_lease(self, segundos: float):
+        """Guarda en la cola la duración del lease que usarán todos los trabajadores."""
+        self._duracion_lease_segundos = segundos
+        self._escribir_meta(META_DURACION_LEASE, repr(float(segundos)))
+
+    def marcar_encolado(self, completo: bool = True):
+        """El coordinador indica si ya terminó de encolar (antes de eso la cola vacía no significa 'terminado')."""
+        self._escribir_meta(META_ENCOLADO, '1' if completo else '0')
+
+    def encolado_completo(self) -> bool:
+        return self._leer_meta(META_ENCOLADO) == '1'
+
+    def encolar(self, rucs: List[str]) -> int:
+        """Agrega los RUCs que no estén ya en la cola. Devuelve cuántos se agregaron."""
+        ahora = time.time()
+        with self._transaccion():
+            antes = self._conexion.total_changes
+            self._conexion.executemany(
+                "INSERT OR IGNORE INTO trabajos (ruc, estado, actualizado) VALUES (?, ?, ?)",
+                [(ruc, PENDIENTE, ahora) for ruc in rucs])
+            return self._conexion.total_changes - antes
+
+    def tomar(self, trabajador: str, cantidad: int = 1) -> List[str]:
+        """Toma hasta 'cantidad' RUCs pendientes con un lease a nombre del trabajador."""
+        ahora = time.time()
+        duracion_lease = self.duracion_lease_segundos
+        with self._transaccion():
+            rucs = [fila[0] for fila in self._conexion.execute(
+                "SELECT ruc FROM trabajos WHERE estado = ? ORDER BY ruc LIMIT ?", (PENDIENTE, cantidad))]
+            self._conexion.executemany(
+                "UPDATE trabajos SET estado = ?, trabajador = ?, lease_hasta = ?, intentos = intentos + 1, "
+                "actualizado = ? WHERE ruc = ?",
+                [(EN_CURSO, trabajador, ahora + duracion_lease, ahora, ruc) for ruc in rucs])
+        return rucs
+
+    def completar(self, ruc: str, trabajador: str, exito: bool, error: Optional[str] = None) -> bool:
+        """
+        Registra el resultado de un RUC. Si falló y le quedan intentos, vuelve a pendiente.
+        Devuelve False si el lease ya no era de este trabajador (venció y se reasignó).
+        """
+        with self._transaccion():
+            fila = self._conexion.execute(
+                "SELECT intentos FROM trabajos WHERE ruc = ? AND estado = ? AND trabajador = ?",
+                (ruc, EN_CURSO, trabajador)).fetchone()
+            if fila is None:
+                return False
+            estado = OK if exito else (PENDIENTE if fila[0] < self.max_intentos else FALLIDO)
+            self._conexion.execute(
+                "UPDATE trabajos SET estado = ?, lease_hasta = NULL, actualizado = ?, error = ? WHERE ruc = ?",
+                (estado, time.time(), error, ruc))
+        return True
+
+    def expirar_leases(self) -> int:
+        """Devuelve a pendiente (o marca fallidos) los RUCs con lease vencido. Devuelve cuántos."""
+        ahora = time.time()
+        with self._transaccion():
+            vencidos = self._conexion.execute(
+                "SELECT ruc, intentos FROM trabajos WHERE estado = ? AND lease_hasta < ?", (EN_CURSO, ahora)).fetchall()
+            self._conexion.executemany(
+                "UPDATE trabajos SET estado = ?, trabajador = NULL, lease_hasta = NULL, actualizado = ?, "
+                "error = 'lease vencido' WHERE ruc = ?",
+                [(PENDIENTE if intentos < self.max_intentos else FALLIDO, ahora, ruc) for ruc, intentos in vencidos])
+        return len(vencidos)
+
+    def resumen(self) -> Dict[str, int]:
+        conteos = {PENDIENTE: 0, EN_CURSO: 0, OK: 0, FALLIDO: 0}
+        for estado, cantidad in self._conexion.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado"):
+            conteos[estado] = cantidad
+        return conteos
+
+    def terminado(self) -> bool:
+        """True si el coordinador ya encoló todo y no queda nada pendiente ni en curso."""
+        if not self.encolado_completo():
+            return False
+        r = self.resumen()
+        return r[PENDIENTE] == 0 and r[EN_CURSO] == 0
+
+    def rucs_ok(self) -> List[str]:
+        return [fila[0] for fila in self._conexion.execute("SELECT ruc FROM trabajos WHERE estado = ? ORDER BY ruc", (OK,))]
+
+    @contextmanager
+    def _transaccion(self):
+        """BEGIN IMMEDIATE ... COMMIT/ROLLBACK: toma el bloqueo de escritura entre procesos desde el inicio."""
+        self._conexion.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conexion.execute("ROLLBACK")
+            raise
+        self._conexion.execute("COMMIT")
+
+
+def formatear_resumen(resumen: Dict[str, Any]) -> str:
+    return (f"{resumen[OK]} ok, {resumen[FALLIDO]} fallidos, {resumen[EN_CURSO]} en curso, "
+            f"{resumen[PENDIENTE]} pendientes")
+
+
+# --- Trabajador ---
+
+def ejecutar_trabajador(ruta_cola: str, ruta_base: str, nombre: Optional[str] = None,
+                        usar_cache: bool = False, pausa_segundos: float = 1.0,
+                        espera_segundos: float = 5.0, salir_al_terminar: bool = True,
+                        max_edad_cache_segundos: Optional[float] = None,
+                        reciclar_cada: Optional[int] = None, limite_rss_mb: Optional[float] = None):
+    """
+    Toma RUCs de la cola de a uno y los consulta con su propio navegador, guardando el HTML en
+    '<ruta_base>/html_consultas'. Termina cuando el coordinador ya encoló todo y la cola quedó
+    vacía (o sigue esperando si 'salir_al_terminar' es False). Un trabajador que arranca antes
+    que el coordinador espera a que haya RUCs. 'reciclar_cada' y 'limite_rss_mb' configuran el
+    reciclaje de su navegador (ver SesionNavegador).
+    """
+    nombre = nombre or f"{socket.gethostname()}-{os.getpid()}"
+    cola = ColaRucs(ruta_cola)
+    sesion = ws.SesionNavegador(reciclar_cada, limite_rss_mb)
+    procesados = 0
+    avisado_espera = False
+    print(f"👷 Trabajador {nombre} conectado a {ruta_cola}")
+    try:
+        while True:
+            rucs = cola.tomar(nombre)
+            if not rucs:
+                if salir_al_terminar and cola.terminado():
+                    break
+                if not avisado_espera and not cola.encolado_completo():
+                    print(f"⏳ Trabajador {nombre}: esperando a que el coordinador encole los RUCs...")
+                    avisado_espera = True
+                time.sleep(espera_segundos)
+                continue
+            ruc = rucs[0]
+            desde_cache = usar_cache and ws.html_en_cache(ruc, ruta_base, max_edad_cache_segundos)
+            exito, error = False, None
+            try:
+                exito = ws.consultar_y_guardar_todo(ruc, ruta_base, usar_cache=usar_cache, sesion=sesion,
+                                                    max_edad_cache_segundos=max_edad_cache_segundos)
+            except Exception as e:
+                error = str(e)
+                print(f"❌ Error consultando el RUC {ruc}: {e}")
+            if not cola.completar(ruc, nombre, exito, error):
+                print(f"⚠️ El lease del RUC {ruc} venció antes de terminar; el resultado no se registró.")
+            procesados += 1
+            print(f"[{nombre}] RUC {ruc}: {'✅' if exito else '❌'} ({procesados} procesados)")
+            if not desde_cache and pausa_segundos:
+                time.sleep(pausa_segundos)  # Pequeña pausa para no saturar el servidor
+    finally:
+        sesion.cerrar()
+        cola.cerrar()
+    print(f"🏁 Trabajador {nombre} terminó: {procesados} RUCs procesados.")
+    return procesados
+
+
+# --- Coordinador ---
+
+def lanzar_trabajadores_locales(cantidad: int, ruta_cola: str, ruta_base: str, usar_cache: bool,
+                                max_edad_cache_segundos: Optional[float] = None,
+                                reciclar_cada: Optional[int] = None,
+                                limite_rss_mb: Optional[float] = None) -> List[subprocess.Popen]:
+    """Lanza 'cantidad' procesos trabajadores en este equipo (cada uno con su navegador)."""
+    ruta_main = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py')
+    comando = [sys.executable, ruta_main, '--trabajador', ruta_cola, '--carpeta', ruta_base]
+    if usar_cache:
+        comando.append('--usar-cache')
+        if max_edad_cache_segundos is not None:
+            comando += ['--max-edad-cache-horas', repr(max_edad_cache_segundos / 3600)]
+    if reciclar_cada is not None:
+        comando += ['--reciclar-cada', str(reciclar_cada)]
+    if limite_rss_mb is not None:
+        comando += ['--limite-rss-mb', repr(limite_rss_mb)]
+    return [subprocess.Popen(comando) for _ in range(cantidad)]
+
+
+def ejecutar_coordinador(ruta_cola: str, ruta_buzon_eps: str, ruta_clientes_activos: str, ruta_salida: str,
+                         ruta_base_bpm: Optional[str] = None, usar_cache: bool = False,
+                         trabajadores_locales: int = 0, duracion_lease_segundos: float = DURACION_LEASE_SEGUNDOS,
+                         intervalo_segundos: float = 10.0, reglas: Optional[List[Dict[str, Any]]] = None,
+                         delta: bool = False, max_edad_cache_segundos: Optional[float] = None,
+                         reciclar_cada: Optional[int] = None, limite_rss_mb: Optional[float] = None) -> List[str]:
+    """
+    Encola los RUCs de los Excel, espera a que los trabajadores terminen (devolviendo a la cola
+    los leases vencidos) y genera el reporte con los RUCs consultados con éxito.
+    Los trabajadores deben guardar el HTML en la carpeta del reporte (--carpeta <carpeta de --salida>).
+    Devuelve la lista de RUCs consultados con éxito.
+    """
+    ruta_directorio_base = os.path.dirname(os.path.abspath(ruta_salida))
+    instrumentacion.reiniciar()
+    bases = logica_datos.cargar_bases_entrada(ruta_buzon_eps, ruta_clientes_activos, ruta_base_bpm, estricto=True)
+    lista_rucs = logica_datos.obtener_rucs_de_excels(ruta_buzon_eps, ruta_clientes_activos, ruta_base_bpm, bases=bases)
+    if not lista_rucs:
+        raise ValueError("No hay RUCs para procesar.")
+
+    cola = ColaRucs(ruta_cola)
+    cola.fijar_duracion_lease(duracion_lease_segundos)
+    cola.marcar_encolado(False)
+    agregados = cola.encolar(lista_rucs)
+    cola.marcar_encolado()
+    print(f"📥 {agregados} RUCs agregados a la cola ({len(lista_rucs) - agregados} ya estaban).")
+
+    procesos = lanzar_trabajadores_locales(trabajadores_locales, ruta_cola, ruta_directorio_base, usar_cache,
+                                           max_edad_cache_segundos, reciclar_cada, limite_rss_mb)
+    try:
+        while True:
+            vencidos = cola.expirar_leases()
+            if vencidos:
+                print(f"⏱️ {vencidos} lease(s) vencidos devueltos a la cola.")
+            resumen = cola.resumen()
+            print(f"📊 Cola: {formatear_resumen(resumen)}")
+            if cola.terminado():
+                break
+            if procesos and all(p.poll() is not None for p in procesos) and resumen[EN_CURSO] == 0:
+                print("⚠️ Los trabajadores locales terminaron con RUCs pendientes; se esperan trabajadores externos.")
+                procesos = []
+            time.sleep(intervalo_segundos)
+
+        rucs_lista = set(lista_rucs)
+        rucs_ok = [ruc for ruc in cola.rucs_ok() if ruc in rucs_lista]
+        if rucs_ok:
+            with instrumentacion.medir('reporte_total'):
+                logica_datos.generar_reporte_desde_htmls(
+                    ruta_salida=ruta_salida,
+                    rucs_a_procesar=rucs_ok,
+                    ruta_buzon_eps=ruta_buzon_eps,
+                    ruta_clientes_activos=ruta_clientes_activos,
+                    ruta_base_bpm=ruta_base_bpm,
+                    bases=bases,
+                    reglas=reglas,
+                    delta=delta
+                )
+        else:
+            print("❌ No se pudo consultar exitosamente ningún RUC de la lista.")
+        return rucs_ok
+    finally:
+        for proceso in procesos:
+            proceso.wait()
+        cola.cerrar()
+        instrumentacion.guardar_metricas(ruta_salida)
\ No newline at end of file
@@ -0,0 +1,114 @@
+# delta.py (Reporte delta: RUCs nuevos o con datos SUNAT distintos a la corrida anterior)
+"""
+Se guarda un snapshot por RUC ('snapshot_sunat.json', junto a 'html_consultas') con el estado,
+la condición y la última cantidad de trabajadores, más una huella (hash) de esos valores.
+En cada reporte se compara la huella nueva con la guardada (un acceso a dict por RUC) y se
+escribe '<reporte>_delta.xlsx' solo con los RUCs nuevos o cambiados.
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Tuple
+
+import pandas as pd
+
+ARCHIVO_SNAPSHOT = 'snapshot_sunat.json'
+# Columnas de VALIDACION FINAL que definen si un RUC cambió
+CAMPOS_HUELLA = ['Estado del Contribuyente', 'Condición del Contribuyente', 'Cantidad de Trabajadores']
+NUEVO = 'NUEVO'
+CAMBIADO = 'CAMBIADO'
+SIN_CAMBIOS = 'SIN CAMBIOS'
+
+
+def ruta_snapshot(directorio_base: str) -> str:
+    return os.path.join(directorio_base, ARCHIVO_SNAPSHOT)
+
+
+def _texto(valor: Any) -> str:
+    """Valor normalizado para la huella: sin espacios, en mayúsculas y '' si está vacío."""
+    if valor is None or valor is pd.NA or (isinstance(valor, float) and valor != valor):
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    texto = str(valor).strip()
+    return '' if texto.lower() == 'nan' else texto.upper()
+
+
+def huella(valores) -> str:
+    return hashlib.sha1('\x1f'.join(valores).encode('utf-8')).hexdigest()[:16]
+
+
+def cargar_snapshot(ruta: str) -> Dict[str, Dict[str, Any]]:
+    """RUC -> {'huella', 'valores', 'actualizado'}; vacío si no existe o no se puede leer."""
+    if not os.path.isfile(ruta):
+        return {}
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠️ No se pudo leer el snapshot {ruta}, se considerarán todos los RUCs como nuevos: {e}")
+        return {}
+
+
+def guardar_snapshot(ruta: str, snapshot: Dict[str, Dict[str, Any]]):
+    """Escribe el snapshot de forma atómica (archivo temporal + reemplazo)."""
+    temporal = ruta + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def calcular_delta(df_valid: pd.DataFrame,
+                   snapshot: Dict[str, Dict[str, Any]]) -> Tuple[pd.DataFrame, Dict[str, Dict[str, Any]]]:
+    """
+    Compara las filas de VALIDACION FINAL con datos SUNAT contra el snapshot.
+    Devuelve (df_delta, snapshot_actualizado): df_delta tiene esas filas más 'CAMBIO' y los valores
+    anteriores; el snapshot actualizado conserva los RUCs que no aparecen en esta corrida.
+    """
+    normalizados = pd.DataFrame({campo: (df_valid[campo] if campo in df_valid.columns else pd.Series('', index=df_valid.index)).map(_texto)
+                                 for campo in CAMPOS_HUELLA})
+    # Las filas sin datos SUNAT (RUCs cruzados con clientes o BPM) no se comparan
+    con_datos = normalizados[CAMPOS_HUELLA[0]] != ''
+    df_delta = df_valid[con_datos].copy()
+    normalizados = normalizados[con_datos]
+
+    rucs = df_delta['RUC'].map(_texto).tolist()
+    filas_valores = list(normalizados.itertuples(index=False, name=None))
+    actualizado = time.strftime('%Y-%m-%d %H:%M:%S')
+    nuevo_snapshot = dict(snapshot)
+    cambios, anteriores = [], []
+    for ruc, valores in zip(rucs, filas_valores):
+        h = huella(valores)
+        previo = snapshot.get(ruc)
+        if previo is None:
+            cambios.append(NUEVO)
+        else:
+            cambios.append(SIN_CAMBIOS if previo.get('huella') == h else CAMBIADO)
+        anteriores.append(previo.get('valores', [''] * len(CAMPOS_HUELLA)) if previo else [''] * len(CAMPOS_HUELLA))
+        nuevo_snapshot[ruc] = {'huella': h, 'valores': list(valores), 'actualizado': actualizado}
+
+    df_delta.insert(0, 'CAMBIO', cambios)
+    for i, campo in enumerate(CAMPOS_HUELLA):
+        df_delta[f'{campo} (anterior)'] = [valores[i] for valores in anteriores]
+    return df_delta, nuevo_snapshot
+
+
+def generar_reporte_delta(df_valid: pd.DataFrame, ruta_reporte: str) -> Dict[str, int]:
+    """
+    Escribe '<reporte>_delta.xlsx' (hoja DELTA con RUCs nuevos y cambiados, hoja RESUMEN con los conteos)
+    y actualiza el snapshot de la carpeta del reporte. Devuelve los conteos por tipo de cambio.
+    """
+    ruta = ruta_snapshot(os.path.dirname(ruta_reporte))
+    df_delta, nuevo_snapshot = calcular_delta(df_valid, cargar_snapshot(ruta))
+    conteos = {tipo: int((df_delta['CAMBIO'] == tipo).sum()) for tipo in (NUEVO, CAMBIADO, SIN_CAMBIOS)}
+
+    ruta_delta = os.path.splitext(ruta_reporte)[0] + '_delta.xlsx'
+    with pd.ExcelWriter(ruta_delta, engine='openpyxl') as writer:
+        df_delta[df_delta['CAMBIO'] != SIN_CAMBIOS].to_excel(writer, sheet_name='DELTA', index=False)
+        pd.DataFrame({'CAMBIO': list(conteos), 'RUCs': list(conteos.values())}).to_excel(writer, sheet_name='RESUMEN', index=False)
+    guardar_snapshot(ruta, nuevo_snapshot)
+
+    print(f"🔁 Delta: {conteos[NUEVO]} nuevos, {conteos[CAMBIADO]} cambiados, {conteos[SIN_CAMBIOS]} sin cambios")
+    print(f"✅ Reporte delta guardado en: {ruta_delta}")
+    return conteos
\ No newline at end of file
@@ -3,21 +3,41 @@
 import customtkinter as ctk
 from tkinter import filedialog
 import proceso_datos as logica_datos # Renombrado para mayor claridad
-import web_scraping as ws
-import pandas as pd
+import lote
+import progreso
+import instrumentacion
+import planificador
 import sys
 import threading
+import queue
 import os
 import traceback
-import time
+
+# Antigüedad máxima del HTML reutilizable con "Reutilizar HTML ya descargados"
+MAX_EDAD_CACHE_HORAS = 24
 
 
 class TextRedirector:
-    """Redirige writes a una CTkTextbox de forma segura usando .after()."""
-    def __init__(self, textbox, tag=None, orig_stream=None):
+    """
+    Redirige writes a una CTkTextbox de forma segura usando .after().
+    Los mensajes se acumulan en una cola y un único tick periódico los inserta
+    en bloque, recortando las líneas más antiguas para que la consola no crezca sin límite.
+    """
+    def __init__(self, textbox, tag=None, orig_stream=None, max_lineas: int = 5000,
+                 intervalo_ms: int = 100, archivo_log=None):
         self.textbox = textbox
         self.tag = tag
         self.orig = orig_stream
+        self.max_lineas = max_lineas
+        self.intervalo_ms = intervalo_ms
+        self.archivo_log = archivo_log  # Archivo abierto (opcional) donde se guarda el log completo
+        self._cola = queue.SimpleQueue()
+        self._activo = True
+        # El primer tick se programa desde el hilo principal (quien crea el redirector)
+        try:
+            self.textbox.after(self.intervalo_ms, self._drenar)
+        except Exception:
+            pass
 
     def write(self, message):
         # Mantener también el comportamiento original (opcional)
@@ -26,19 +46,47 @@ class TextRedirector:
                 self.orig.write(message)
             except Exception:
                 pass
-        # Enviar al textbox en el hilo principal
-        def append():
+        if self.archivo_log:
+            try:
+                self.archivo_log.write(message)
+            except Exception:
+                pass
+        # Solo encolar: el hilo principal insertará el texto en el siguiente tick
+        self._cola.put(message)
+
+    def _drenar(self):
+        """Inserta todo lo acumulado en una sola operación (se ejecuta en el hilo principal)."""
+        partes = []
+        try:
+            while True:
+                partes.append(self._cola.get_nowait())
+        except queue.Empty:
+            pass
+
+        if partes:
             try:
                 self.textbox.configure(state="normal")
-                self.textbox.insert("end", message)
+                self.textbox.insert("end", "".join(partes))
+                # Ring buffer: eliminar las líneas más antiguas si se supera el máximo
+                total_lineas = int(self.textbox.index("end-1c").split(".")[0])
+                if total_lineas > self.max_lineas:
+                    self.textbox.delete("1.0", f"{total_lineas - self.max_lineas + 1}.0")
                 self.textbox.see("end")
                 self.textbox.configure(state="disabled")
             except Exception:
                 pass
-        try:
-            self.textbox.after(0, append)
-        except Exception:
-            append()
+
+        if self._activo:
+            try:
+                self.textbox.after(self.intervalo_ms, self._drenar)
+            except Exception:
+                pass
+
+    def detener(self):
+        """Vacía lo pendiente y deja de programar ticks (llamar desde el hilo principal)."""
+        self._activo = False
+        self._drenar()
+        self.flush()
 
     def flush(self):
         if self.orig:
@@ -46,6 +94,11 @@ class TextRedirector:
                 self.orig.flush()
             except Exception:
                 pass
+        if self.archivo_log:
+            try:
+                self.archivo_log.flush()
+            except Exception:
+                pass
 
 
 class App(ctk.CTk):
@@ -69,6 +122,22 @@ class App(ctk.CTk):
         # Guardar streams originales
         self._orig_stdout = sys.stdout
         self._orig_stderr = sys.stderr
+        self._redirectores = []
+        self._archivo_log = None
+
+        # Métricas del lote en curso (alimentadas por eventos de 'progreso')
+        self.metricas = progreso.MetricasLote()
+        self._proceso_activo = False
+
+        # Todas las consultas a SUNAT pasan por el planificador: las búsquedas individuales
+        # hechas mientras corre un lote tienen su propio trabajador (y navegador), así no esperan
+        # al RUC del lote en curso
+        self.planificador = planificador.PlanificadorConsultas(trabajadores=1, trabajadores_interactivos=1)
+        self.planificador.iniciar()
+        self._lote_activo = False
+        # Clientes Activos / BPM en memoria para las búsquedas individuales (se releen si el archivo cambia)
+        self.bases_cache = logica_datos.CacheBasesEntrada()
+        self.protocol("WM_DELETE_WINDOW", self._al_cerrar)
 
         # --- WIDGETS DE LA INTERFAZ ---
         self.crear_widgets()
@@ -130,6 +199,18 @@ class App(ctk.CTk):
         self.lbl_guardar = ctk.CTkLabel(left_frame, text="No seleccionado", text_color="#9aa7bf")
         self.lbl_guardar.pack(anchor="w", pady=(0,14))
 
+        # Opción: guardar el log completo de la consola junto al reporte
+        self.chk_log = ctk.CTkCheckBox(left_frame, text="Guardar log de consola en archivo")
+        self.chk_log.pack(anchor="w", pady=(0,8))
+
+        # Opción: reporte adicional solo con los RUCs nuevos o cambiados desde la corrida anterior
+        self.chk_delta = ctk.CTkCheckBox(left_frame, text="Generar reporte delta (nuevos/cambiados)")
+        self.chk_delta.pack(anchor="w", pady=(0,8))
+
+        # Opción: no volver a consultar los RUCs cuyo HTML se descargó hace poco (cuentan como "Cache")
+        self.chk_cache = ctk.CTkCheckBox(left_frame, text=f"Reutilizar HTML ya descargados (< {MAX_EDAD_CACHE_HORAS} h)")
+        self.chk_cache.pack(anchor="w", pady=(0,8))
+
         # Acción principal y estado
         self.btn_procesar = ctk.CTkButton(left_frame, text="Iniciar Proceso", command=self.iniciar_proceso, state="disabled", fg_color="#0afd83", hover_color="#0b8b89", corner_radius=8)
         self.btn_procesar.pack(fill="x", pady=(8,6))
@@ -137,6 +218,13 @@ class App(ctk.CTk):
         self.lbl_estado = ctk.CTkLabel(left_frame, text="Esperando selección...", height=40, text_color="#cfece9")
         self.lbl_estado.pack(fill="x", pady=(8,4))
 
+        # Panel de progreso: barra + contadores, throughput, latencias y ETA
+        self.barra_progreso = ctk.CTkProgressBar(left_frame, corner_radius=6)
+        self.barra_progreso.set(0)
+        self.barra_progreso.pack(fill="x", pady=(4,4))
+        self.lbl_progreso = ctk.CTkLabel(left_frame, text="", justify="left", anchor="w", text_color="#9aa7bf", font=ctk.CTkFont(size=11))
+        self.lbl_progreso.pack(fill="x", pady=(0,4))
+
         # --- Consola a la derecha ---
         console_header = ctk.CTkLabel(right_frame, text="Consola", anchor="w", font=ctk.CTkFont(size=14, weight="bold"))
         console_header.pack(fill="x", pady=(6,6), padx=8)
@@ -209,6 +297,16 @@ class App(ctk.CTk):
         except Exception:
             ruc_val = ""
 
+        # Con un lote en curso solo se permite la búsqueda individual (prioritaria)
+        if self._lote_activo:
+            if ruc_val and self.ruta_clientes_activos:
+                self.btn_procesar.configure(state="normal")
+                self.lbl_estado.configure(text="Lote en curso • búsqueda por RUC prioritaria disponible", text_color="#b8f0e9")
+            else:
+                self.btn_procesar.configure(state="disabled")
+                self.lbl_estado.configure(text="Procesando lote...", text_color="#fff")
+            return
+
         # Si hay un RUC ingresado, bloquear solo el botón de Leads Buzon EPS
         if ruc_val:
             self.btn_buzon.configure(state="disabled")
@@ -229,6 +327,18 @@ class App(ctk.CTk):
             self.btn_procesar.configure(state="disabled")
             self.lbl_estado.configure(text="Esperando selección...", text_color="#cfece9")
 
+    def _al_cerrar(self):
+        """Al cerrar la ventana, detiene el planificador y espera a que sus trabajadores cierren los navegadores."""
+        print("Cerrando navegadores del planificador...")
+        try:
+            self.planificador.detener(esperar_segundos=10)
+        except Exception:
+            traceback.print_exc()
+        # Los redirectores escriben en la consola que se va a destruir
+        sys.stdout = self._orig_stdout
+        sys.stderr = self._orig_stderr
+        self.destroy()
+
     def limpiar_consola(self):
         try:
             self.console.configure(state="normal")
@@ -257,16 +367,84 @@ class App(ctk.CTk):
         if not self.ruta_clientes_activos:
             return False
         try:
-            df_clientes = pd.read_excel(self.ruta_clientes_activos, dtype=str)
-            if 'Ruc' not in df_clientes.columns:
-                return False
-            rucs_clientes = set(df_clientes['Ruc'].dropna().apply(str.strip).unique())
-            return ruc in rucs_clientes
+            clientes = self.bases_cache.obtener(self.ruta_clientes_activos, 'Clientes Activos',
+                                                logica_datos.COLUMNAS_RUC_CLIENTES, logica_datos.CAMPOS_CLIENTES)
+            return ruc in clientes
         except Exception:
             return False
 
+    def _base_bpm(self):
+        """Base BPM en memoria (opcional: None si no se seleccionó o no se pudo leer)."""
+        try:
+            return self.bases_cache.obtener(self.ruta_base_bpm, 'Base BPM', logica_datos.COLUMNAS_RUC_BPM,
+                                            logica_datos.CAMPOS_BPM, obligatoria=False)
+        except Exception:
+            return None
+
+    def _bases_individuales(self) -> logica_datos.BasesEntrada:
+        """
+        Bases en memoria para el reporte de una búsqueda individual: no se releen los Excel por
+        cada RUC (con un lote de 100k filas eso tomaría casi un minuto). Las que falten quedan en None.
+        """
+        def obtener(ruta, nombre, columnas_ruc, campos):
+            try:
+                return self.bases_cache.obtener(ruta, nombre, columnas_ruc, campos, obligatoria=False)
+            except Exception:
+                return None
+        return logica_datos.BasesEntrada(
+            buzon=obtener(self.ruta_buzon_eps, 'Buzon EPS', logica_datos.COLUMNAS_RUC_BUZON, logica_datos.CAMPOS_BUZON),
+            clientes=obtener(self.ruta_clientes_activos, 'Clientes Activos', logica_datos.COLUMNAS_RUC_CLIENTES,
+                             logica_datos.CAMPOS_CLIENTES),
+            bpm=obtener(self.ruta_base_bpm, 'Base BPM', logica_datos.COLUMNAS_RUC_BPM, logica_datos.CAMPOS_BPM),
+        )
+
+    def _reporte_sin_consulta(self, ruc_val: str, ruta_salida: str) -> bool:
+        """
+        Si el RUC ya es cliente o ya fue gestionado en la Base BPM, genera el reporte sin consultar
+        SUNAT (igual que en el lote) y devuelve True; si no, devuelve False.
+        """
+        ya_cliente = self.ruc_existe_en_clientes_activos(ruc_val)
+        bpm = self._base_bpm()
+        en_bpm = not ya_cliente and bpm is not None and ruc_val in bpm
+        if not (ya_cliente or en_bpm):
+            return False
+        if ya_cliente:
+            print(f"⚠️ El RUC {ruc_val} ya existe en Clientes Activos (SAEPS)")
+        else:
+            print(f"⚠️ El RUC {ruc_val} ya fue gestionado en la Base BPM, no se consultará SUNAT")
+        clientes = self.bases_cache.obtener(self.ruta_clientes_activos, 'Clientes Activos',
+                                            logica_datos.COLUMNAS_RUC_CLIENTES, logica_datos.CAMPOS_CLIENTES)
+        logica_datos.generar_reporte_desde_htmls(
+            ruta_salida=ruta_salida,
+            rucs_a_procesar=[ruc_val],
+            bases=logica_datos.BasesEntrada(clientes=clientes, bpm=bpm),
+            ruc_ya_cliente=ya_cliente,  # Marcar que ya es cliente
+            ruc_en_bpm=en_bpm
+        )
+        return True
+
+    def _actualizar_progreso(self):
+        """Refresca el panel de progreso desde las métricas (tick periódico en el hilo principal)."""
+        try:
+            resumen = self.metricas.resumen()
+            self.barra_progreso.set(resumen['fraccion'])
+            texto = self.metricas.formatear()
+            if self.planificador.estadisticas()['interactiva']['enviadas']:
+                texto += "\n" + self.planificador.formatear_estadisticas()
+            self.lbl_progreso.configure(text=texto)
+        except Exception:
+            pass
+        if self._proceso_activo:
+            self.after(500, self._actualizar_progreso)
+
     def iniciar_proceso(self):
         """Lanza el proceso en un hilo y redirige stdout/stderr a la consola."""
+        if self._lote_activo:
+            self._iniciar_consulta_prioritaria()
+            return
+
+        self._lote_activo = not self.entry_ruc.get().strip()
+
         # Deshabilitar botones
         self.btn_procesar.configure(state="disabled")
         self.btn_buzon.configure(state="disabled")
@@ -274,14 +452,70 @@ class App(ctk.CTk):
         self.btn_guardar.configure(state="disabled")
         self.lbl_estado.configure(text="Procesando...", text_color="#fff")
 
+        # Log completo opcional (la consola solo conserva las últimas líneas)
+        self._archivo_log = None
+        if self.chk_log.get() and self.ruta_guardado:
+            ruta_log = os.path.splitext(self.ruta_guardado)[0] + "_consola.log"
+            try:
+                self._archivo_log = open(ruta_log, 'a', encoding='utf-8')
+            except Exception:
+                self._archivo_log = None
+
         # Redirigir outputs
-        sys.stdout = TextRedirector(self.console, orig_stream=self._orig_stdout)
-        sys.stderr = TextRedirector(self.console, orig_stream=self._orig_stderr)
+        self._redirectores = [
+            TextRedirector(self.console, orig_stream=self._orig_stdout, archivo_log=self._archivo_log),
+            TextRedirector(self.console, orig_stream=self._orig_stderr, archivo_log=self._archivo_log),
+        ]
+        sys.stdout, sys.stderr = self._redirectores
+
+        # Métricas en vivo
+        self.metricas.reiniciar()
+        progreso.suscribir(self.metricas.manejar_evento)
+        self._proceso_activo = True
+        self._actualizar_progreso()
 
         # Ejecutar en hilo para no bloquear la GUI
         thread = threading.Thread(target=self._run_proceso_thread, daemon=True)
         thread.start()
 
+    def _iniciar_consulta_prioritaria(self):
+        """Búsqueda individual mientras corre un lote: se encola como INTERACTIVA."""
+        ruc_val = self.entry_ruc.get().strip()
+        if not ruc_val:
+            return
+        self.btn_procesar.configure(state="disabled")
+        self.entry_ruc.delete(0, "end")
+        thread = threading.Thread(target=self._run_consulta_prioritaria, args=(ruc_val,), daemon=True)
+        thread.start()
+
+    def _run_consulta_prioritaria(self, ruc_val: str):
+        # Los eventos de esta búsqueda llevan clase 'interactiva': no cuentan en las métricas del lote
+        with progreso.contexto(clase=planificador.NOMBRES_CLASE[planificador.INTERACTIVA]):
+            self._consulta_prioritaria(ruc_val)
+
+    def _consulta_prioritaria(self, ruc_val: str):
+        try:
+            ruta_directorio_base = os.path.dirname(self.ruta_guardado) if self.ruta_guardado else os.getcwd()
+            # El reporte del lote se escribe en ruta_guardado; el individual va a un archivo propio
+            ruta_salida = os.path.splitext(self.ruta_guardado)[0] + f"_RUC_{ruc_val}.xlsx"
+            print(f"\n--- ⚡ Búsqueda prioritaria para RUC {ruc_val} (lote en curso) ---")
+            if self._reporte_sin_consulta(ruc_val, ruta_salida):
+                return
+            futuro = self.planificador.consultar(ruc_val, ruta_directorio_base, prioridad=planificador.INTERACTIVA)
+            if futuro.result():
+                logica_datos.generar_reporte_desde_htmls(
+                    ruta_salida=ruta_salida,
+                    rucs_a_procesar=[ruc_val],
+                    bases=self._bases_individuales()
+                )
+            else:
+                print(f"❌ No se pudo generar el reporte porque la consulta para {ruc_val} falló.")
+            print(self.planificador.formatear_estadisticas())
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            self.after(0, self.verificar_rutas)
+
     def _run_proceso_thread(self):
         try:
             ruc_val = self.entry_ruc.get().strip()
@@ -290,68 +524,44 @@ class App(ctk.CTk):
             if ruc_val:
                 # --- FLUJO 1: BÚSQUEDA DIRECTA DE UN SOLO RUC ---
                 print(f"--- Iniciando Búsqueda Directa para RUC: {ruc_val} ---")
-                
-                # Paso 0: Validar si el RUC existe en Clientes Activos
-                if self.ruc_existe_en_clientes_activos(ruc_val):
-                    print(f"⚠️ El RUC {ruc_val} ya existe en Clientes Activos (SAEPS)")
-                    print(f"✅ Generando reporte con resultado: Enviar Correo Administrador")
-                    # Generar reporte con el RUC marcado como "Enviar Correo Administrador"
-                    logica_datos.generar_reporte_desde_htmls(
-                        ruta_salida=self.ruta_guardado,
-                        rucs_a_procesar=[ruc_val],
-                        ruta_buzon_eps=self.ruta_buzon_eps,
-                        ruta_clientes_activos=self.ruta_clientes_activos,
-                        ruc_ya_cliente=True  # Marcar que ya es cliente
-                    )
-                else:
-                    # Paso 1: Consultar y guardar HTMLs
-                    exito = ws.consultar_y_guardar_todo(ruc_val, ruta_directorio_base)
-                    
-                    # Paso 2: Generar Excel inmediatamente si la consulta fue exitosa
-                    if exito:
-                        logica_datos.generar_reporte_desde_htmls(
-                            ruta_salida=self.ruta_guardado,
-                            rucs_a_procesar=[ruc_val], # Procesar solo el RUC actual
-                            ruta_buzon_eps=self.ruta_buzon_eps,
-                            ruta_clientes_activos=self.ruta_clientes_activos
-                        )
-                    else:
-                        print(f"❌ No se pudo generar el reporte porque la consulta para {ruc_val} falló.")
+                instrumentacion.reiniciar(clase=planificador.NOMBRES_CLASE[planificador.INTERACTIVA])
+                progreso.emitir('lote_inicio', total=1, clase=planificador.NOMBRES_CLASE[planificador.INTERACTIVA])
+                try:
+                    # Paso 0: Validar si el RUC existe en Clientes Activos o ya se gestionó en BPM
+                    if not self._reporte_sin_consulta(ruc_val, self.ruta_guardado):
+                        # Paso 1: Consultar y guardar HTMLs
+                        exito = self.planificador.consultar(ruc_val, ruta_directorio_base,
+                                                            prioridad=planificador.INTERACTIVA).result()
+
+                        # Paso 2: Generar Excel inmediatamente si la consulta fue exitosa
+                        if exito:
+                            logica_datos.generar_reporte_desde_htmls(
+                                ruta_salida=self.ruta_guardado,
+                                rucs_a_procesar=[ruc_val], # Procesar solo el RUC actual
+                                bases=self._bases_individuales()
+                            )
+                            instrumentacion.guardar_metricas(self.ruta_guardado)
+                        else:
+                            print(f"❌ No se pudo generar el reporte porque la consulta para {ruc_val} falló.")
+                finally:
+                    # Siempre cerrar el lote para que la barra y el cronómetro no queden "en curso"
+                    progreso.emitir('lote_fin')
 
             else:
                 # --- FLUJO 2: PROCESAMIENTO EN LOTE DESDE ARCHIVOS EXCEL ---
                 print(f"--- Iniciando Proceso en Lote desde Archivos Excel ---")
                 
-                # Paso 1: Obtener la lista de RUCs desde los archivos
-                lista_rucs = logica_datos.obtener_rucs_de_excels(
+                lote.ejecutar_lote(
                     ruta_buzon_eps=self.ruta_buzon_eps,
-                    ruta_clientes_activos=self.ruta_clientes_activos
+                    ruta_clientes_activos=self.ruta_clientes_activos,
+                    ruta_salida=self.ruta_guardado,
+                    ruta_base_bpm=self.ruta_base_bpm or None,
+                    planificador=self.planificador,
+                    delta=bool(self.chk_delta.get()),
+                    usar_cache=bool(self.chk_cache.get()),
+                    max_edad_cache_segundos=MAX_EDAD_CACHE_HORAS * 3600
                 )
 
-                if not lista_rucs:
-                    print("No se encontraron RUCs para procesar. Proceso detenido.")
-                    raise ValueError("No hay RUCs para procesar.")
-
-                # Paso 2: Consultar cada RUC de la lista
-                rucs_procesados_ok = []
-                for i, ruc in enumerate(lista_rucs, 1):
-                    print(f"\n[{i}/{len(lista_rucs)}] Procesando RUC: {ruc}")
-                    exito = ws.consultar_y_guardar_todo(ruc, ruta_directorio_base)
-                    if exito:
-                        rucs_procesados_ok.append(ruc)
-                    time.sleep(1) # Pequeña pausa para no saturar el servidor
-
-                # Paso 3: Generar un único reporte consolidado
-                if rucs_procesados_ok:
-                    logica_datos.generar_reporte_desde_htmls(
-                        ruta_salida=self.ruta_guardado,
-                        rucs_a_procesar=rucs_procesados_ok,
-                        ruta_buzon_eps=self.ruta_buzon_eps,
-                        ruta_clientes_activos=self.ruta_clientes_activos
-                    )
-                else:
-                    print("❌ No se pudo consultar exitosamente ningún RUC de la lista.")
-
             # Mensaje final de éxito
             self.after(0, lambda: self.lbl_estado.configure(text="Proceso completado ✔", text_color="#a7f3d0"))
 
@@ -364,8 +574,22 @@ class App(ctk.CTk):
             def _finalizar():
                 sys.stdout = self._orig_stdout
                 sys.stderr = self._orig_stderr
+                progreso.desuscribir(self.metricas.manejar_evento)
+                self._proceso_activo = False
+                self._actualizar_progreso()
+                for redirector in self._redirectores:
+                    redirector.detener()
+                self._redirectores = []
+                if self._archivo_log:
+                    try:
+                        self._archivo_log.close()
+                    except Exception:
+                        pass
+                    self._archivo_log = None
                 self.btn_procesar.configure(state="normal")
                 self.btn_buzon.configure(state="normal")
                 self.btn_clientes.configure(state="normal")
                 self.btn_guardar.configure(state="normal")
+                self._lote_activo = False
+                self.verificar_rutas()
             self.after(0, _finalizar)
\ No newline at end of file
@@ -0,0 +1,140 @@
+# instrumentacion.py (Medición de tiempos por etapa y perfilado opcional)
+import cProfile
+import csv
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+import progreso
+
+# Tiempos acumulados por etapa durante la ejecución actual: etapa -> [llamadas, total, máximo]
+_tiempos: Dict[str, List[float]] = {}
+# Eventos puntuales de la ejecución (p.ej. reciclajes del navegador y lecturas de memoria)
+_eventos: List[Dict[str, Any]] = []
+MAX_EVENTOS = 10000
+_lock = threading.Lock()
+_inicio_ejecucion = time.time()
+# Clase de consultas de la ejecución actual (p.ej. 'lote'): las mediciones hechas en hilos con otra
+# clase en progreso.contexto (búsquedas interactivas atendidas durante el lote) no se acumulan
+_clase_ejecucion: Optional[str] = None
+
+# Interruptor para ejecutar la etapa de reporte bajo cProfile (también vía variable de entorno)
+PERFILAR_REPORTE = os.environ.get("SUNAT_PERFILAR", "").strip().lower() in ("1", "true", "si", "sí")
+
+
+def reiniciar(clase: Optional[str] = None):
+    """
+    Descarta los tiempos acumulados (llamar al iniciar una nueva ejecución).
+    Con 'clase', solo se acumulan las mediciones de hilos sin clase o con esa misma clase.
+    """
+    global _inicio_ejecucion, _clase_ejecucion
+    with _lock:
+        _tiempos.clear()
+        _eventos.clear()
+        _inicio_ejecucion = time.time()
+        _clase_ejecucion = clase
+
+
+def _de_otra_clase() -> bool:
+    """True si el hilo actual atiende consultas de otra clase que la ejecución en curso."""
+    if _clase_ejecucion is None:
+        return False
+    clase = progreso.contexto_actual().get('clase')
+    return clase is not None and clase != _clase_ejecucion
+
+
+def registrar(etapa: str, duracion: float):
+    """Agrega una medición (en segundos) a la etapa indicada."""
+    if _de_otra_clase():
+        return
+    with _lock:
+        acumulado = _tiempos.setdefault(etapa, [0, 0.0, 0.0])
+        acumulado[0] += 1
+        acumulado[1] += duracion
+        acumulado[2] = max(acumulado[2], duracion)
+
+
+def registrar_evento(tipo: str, **datos: Any):
+    """Guarda un evento puntual con marca de tiempo (se incluye en el JSON de métricas)."""
+    if _de_otra_clase():
+        return
+    with _lock:
+        if len(_eventos) < MAX_EVENTOS:
+            _eventos.append({'tipo': tipo, 'hora': time.strftime('%H:%M:%S'), **datos})
+
+
+def eventos() -> List[Dict[str, Any]]:
+    with _lock:
+        return list(_eventos)
+
+
+@contextmanager
+def medir(etapa: str):
+    """Context manager que mide el tiempo del bloque y lo acumula en 'etapa'."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar(etapa, time.perf_counter() - inicio)
+
+
+def resumen() -> List[Dict[str, Any]]:
+    """Devuelve una fila por etapa con llamadas, total, promedio y máximo (segundos)."""
+    with _lock:
+        filas = []
+        for etapa, (llamadas, total, maximo) in _tiempos.items():
+            filas.append({
+                'etapa': etapa,
+                'llamadas': int(llamadas),
+                'total_s': round(total, 4),
+                'promedio_s': round(total / llamadas, 4) if llamadas else 0.0,
+                'max_s': round(maximo, 4),
+            })
+    return sorted(filas, key=lambda fila: fila['total_s'], reverse=True)
+
+
+def guardar_metricas(ruta_reporte: str) -> List[str]:
+    """
+    Escribe las métricas de la ejecución junto al reporte:
+    '<reporte>_metricas.json' y '<reporte>_metricas.csv'. Devuelve las rutas escritas.
+    """
+    base = os.path.splitext(ruta_reporte)[0]
+    filas = resumen()
+    rutas = []
+    try:
+        ruta_json = f"{base}_metricas.json"
+        with open(ruta_json, 'w', encoding='utf-8') as f:
+            json.dump({
+                'inicio': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(_inicio_ejecucion)),
+                'duracion_total_s': round(time.time() - _inicio_ejecucion, 3),
+                'etapas': filas,
+                'eventos': eventos(),
+            }, f, ensure_ascii=False, indent=2)
+        rutas.append(ruta_json)
+
+        ruta_csv = f"{base}_metricas.csv"
+        with open(ruta_csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=['etapa', 'llamadas', 'total_s', 'promedio_s', 'max_s'])
+            writer.writeheader()
+            writer.writerows(filas)
+        rutas.append(ruta_csv)
+        print(f"⏱️ Métricas de tiempos guardadas en: {os.path.basename(ruta_json)} / {os.path.basename(ruta_csv)}")
+    except Exception as e:
+        print(f"⚠️ No se pudieron guardar las métricas de tiempos: {e}")
+    return rutas
+
+
+def perfilar(funcion: Callable[..., Any], ruta_stats: str, *args, **kwargs) -> Any:
+    """Ejecuta 'funcion' bajo cProfile y guarda las estadísticas en 'ruta_stats' (formato pstats)."""
+    perfil = cProfile.Profile()
+    try:
+        return perfil.runcall(funcion, *args, **kwargs)
+    finally:
+        try:
+            perfil.dump_stats(ruta_stats)
+            print(f"🔬 Perfil de la etapa de reporte guardado en: {os.path.basename(ruta_stats)}")
+        except Exception as e:
+            print(f"⚠️ No se pudo guardar el perfil: {e}")
\ No newline at end of file
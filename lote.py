@@ -0,0 +1,174 @@
+# lote.py (Flujo de procesamiento en lote compartido por la GUI y la CLI)
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import proceso_datos as logica_datos
+import web_scraping as ws
+import progreso
+import instrumentacion
+import planificador as plan
+
+
+def preparar_arranque(ruta_buzon_eps: str, ruta_clientes_activos: str, ruta_base_bpm: Optional[str] = None,
+                      planificador: Optional[plan.PlanificadorConsultas] = None,
+                      bases: Optional[logica_datos.BasesEntrada] = None, lanzar_navegador: bool = True
+                      ) -> Tuple[Optional[logica_datos.BasesEntrada], Dict[str, float]]:
+    """
+    Abre el navegador mientras se leen las bases de entrada (cada libro en su propio hilo), para que
+    la primera consulta pueda empezar apenas se conoce la lista de RUCs.
+    Con 'planificador' el navegador lo abren sus trabajadores; sin él se abre la sesión global en este
+    hilo (Playwright sync no se comparte entre hilos) y las bases se leen en segundo plano.
+    Con 'lanzar_navegador' en False (p.ej. con cache, donde puede que no haga falta consultar SUNAT)
+    solo se leen las bases y el navegador se abre con la primera consulta real.
+    Devuelve (bases, tiempos) con los segundos de 'bases', 'navegador' y 'primera_consulta';
+    las bases quedan en None si su lectura falló.
+    """
+    inicio = time.perf_counter()
+    tiempos = {'bases': 0.0, 'navegador': 0.0}
+
+    def leer_bases() -> Optional[logica_datos.BasesEntrada]:
+        if bases is not None:
+            return bases
+        inicio_bases = time.perf_counter()
+        try:
+            return logica_datos.cargar_bases_entrada(ruta_buzon_eps, ruta_clientes_activos, ruta_base_bpm,
+                                                     estricto=True, paralelo=True)
+        except Exception:
+            return None  # obtener_rucs_de_excels reintentará la lectura y reportará el error
+        finally:
+            tiempos['bases'] = time.perf_counter() - inicio_bases
+
+    if not lanzar_navegador:
+        bases_leidas = leer_bases()
+    elif planificador is not None:
+        navegador_listo = planificador.precalentar()
+        bases_leidas = leer_bases()
+        tiempos['navegador'] = navegador_listo.result() or 0.0
+    else:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='arranque') as executor:
+            futuro_bases = executor.submit(leer_bases)
+            inicio_navegador = time.perf_counter()
+            try:
+                ws._initialize_browser_edge()
+                tiempos['navegador'] = time.perf_counter() - inicio_navegador
+            except (Exception, SystemExit) as e:
+                # Sin navegador aún se pueden atender los RUCs en cache; el resto reintentará al consultar
+                print(f"⚠️ No se pudo abrir el navegador por adelantado: {e}")
+            bases_leidas = futuro_bases.result()
+
+    tiempos['primera_consulta'] = time.perf_counter() - inicio
+    secuencial = tiempos['bases'] + tiempos['navegador']
+    instrumentacion.registrar('arranque_primera_consulta', tiempos['primera_consulta'])
+    instrumentacion.registrar_evento('arranque', **{f'{clave}_s': round(valor, 3) for clave, valor in tiempos.items()},
+                                     secuencial_s=round(secuencial, 3))
+    if lanzar_navegador:
+        print(f"⏱️ Primera consulta lista a los {tiempos['primera_consulta']:.1f}s (bases {tiempos['bases']:.1f}s "
+              f"y navegador {tiempos['navegador']:.1f}s en paralelo; estimado en secuencia: {secuencial:.1f}s)")
+    else:
+        print(f"⏱️ Bases leídas en {tiempos['bases']:.1f}s; el navegador se abrirá con la primera consulta a SUNAT")
+    return bases_leidas, tiempos
+
+
+def ejecutar_lote(ruta_buzon_eps: str, ruta_clientes_activos: str, ruta_salida: str,
+                  ruta_base_bpm: Optional[str] = None, usar_cache: bool = False, pausa_segundos: float = 1.0,
+                  perfilar: Optional[bool] = None,
+                  planificador: Optional[plan.PlanificadorConsultas] = None,
+                  reglas: Optional[List[Dict[str, Any]]] = None, delta: bool = False,
+                  bases: Optional[logica_datos.BasesEntrada] = None,
+                  max_edad_cache_segundos: Optional[float] = None) -> List[str]:
+    """
+    Obtiene los RUCs a procesar desde los Excel, consulta cada uno en SUNAT y genera
+    un único reporte consolidado. Devuelve la lista de RUCs consultados con éxito.
+    Las bases de entrada (incluida la Base BPM opcional) se leen una sola vez y se
+    comparten entre el filtrado de RUCs y el reporte.
+    El avance se publica como eventos en 'progreso' (lote_inicio, ruc_*, reporte_*, lote_fin)
+    y los tiempos por etapa se guardan junto al reporte ('<reporte>_metricas.json/.csv').
+    Si 'perfilar' es True (o SUNAT_PERFILAR=1), la etapa de reporte corre bajo cProfile.
+    Con un 'planificador', los RUCs se encolan como LOTE y las consultas interactivas
+    enviadas al mismo planificador se atienden antes que los RUCs pendientes del lote.
+    'reglas' reemplaza las reglas de RESULTADO (ver reglas.py); con 'delta' también se genera
+    el reporte de RUCs nuevos o cambiados respecto de la corrida anterior (ver delta.py).
+    'bases' permite pasar las bases de entrada ya cargadas (p.ej. el modo vigilancia mantiene
+    Clientes Activos y BPM en memoria entre archivos). Las bases se leen mientras se abre el
+    navegador (ver preparar_arranque).
+    Con 'usar_cache', los RUCs cuyo HTML ya está en 'html_consultas' no se vuelven a consultar;
+    'max_edad_cache_segundos' limita la antigüedad de ese HTML (None = sin límite).
+    """
+    ruta_directorio_base = os.path.dirname(ruta_salida) if ruta_salida else os.getcwd()
+    if perfilar is None:
+        perfilar = instrumentacion.PERFILAR_REPORTE
+    # Las búsquedas interactivas atendidas durante el lote no se mezclan con sus tiempos por etapa
+    instrumentacion.reiniciar(clase=plan.NOMBRES_CLASE[plan.LOTE])
+
+    # Paso 1: Obtener la lista de RUCs desde los archivos (con el navegador abriéndose en paralelo)
+    # Con cache puede que ningún RUC requiera SUNAT: el navegador se abre recién en la primera consulta real
+    bases, _ = preparar_arranque(ruta_buzon_eps, ruta_clientes_activos, ruta_base_bpm, planificador, bases,
+                                 lanzar_navegador=not usar_cache)
+    lista_rucs = logica_datos.obtener_rucs_de_excels(
+        ruta_buzon_eps=ruta_buzon_eps,
+        ruta_clientes_activos=ruta_clientes_activos,
+        ruta_base_bpm=ruta_base_bpm,
+        bases=bases
+    )
+
+    if not lista_rucs:
+        print("No se encontraron RUCs para procesar. Proceso detenido.")
+        if planificador is None:
+            ws._cleanup()  # Cerrar el navegador abierto por adelantado
+        raise ValueError("No hay RUCs para procesar.")
+
+    # Con la clase, las métricas del lote ignoran las consultas interactivas que se atiendan en paralelo
+    progreso.emitir('lote_inicio', total=len(lista_rucs), clase=plan.NOMBRES_CLASE[plan.LOTE])
+    try:
+        # Paso 2: Consultar cada RUC de la lista
+        rucs_procesados_ok = []
+        if planificador is not None:
+            futuros = [(ruc, planificador.consultar(ruc, ruta_directorio_base, prioridad=plan.LOTE, usar_cache=usar_cache,
+                                                    max_edad_cache_segundos=max_edad_cache_segundos))
+                       for ruc in lista_rucs]
+            for i, (ruc, futuro) in enumerate(futuros, 1):
+                try:
+                    exito = futuro.result()
+                except BaseException as e:
+                    print(f"❌ Error consultando el RUC {ruc}: {e}")
+                    exito = False
+                print(f"[{i}/{len(lista_rucs)}] RUC {ruc}: {'✅' if exito else '❌'}")
+                if exito:
+                    rucs_procesados_ok.append(ruc)
+        else:
+            for i, ruc in enumerate(lista_rucs, 1):
+                print(f"\n[{i}/{len(lista_rucs)}] Procesando RUC: {ruc}")
+                desde_cache = usar_cache and ws.html_en_cache(ruc, ruta_directorio_base, max_edad_cache_segundos)
+                exito = ws.consultar_y_guardar_todo(ruc, ruta_directorio_base, usar_cache=usar_cache,
+                                                    max_edad_cache_segundos=max_edad_cache_segundos)
+                if exito:
+                    rucs_procesados_ok.append(ruc)
+                if not desde_cache:
+                    time.sleep(pausa_segundos) # Pequeña pausa para no saturar el servidor
+
+        # Paso 3: Generar un único reporte consolidado
+        if rucs_procesados_ok:
+            parametros_reporte = dict(
+                ruta_salida=ruta_salida,
+                rucs_a_procesar=rucs_procesados_ok,
+                ruta_buzon_eps=ruta_buzon_eps,
+                ruta_clientes_activos=ruta_clientes_activos,
+                ruta_base_bpm=ruta_base_bpm,
+                bases=bases,
+                reglas=reglas,
+                delta=delta
+            )
+            with instrumentacion.medir('reporte_total'):
+                if perfilar:
+                    ruta_stats = os.path.splitext(ruta_salida)[0] + "_reporte.prof"
+                    instrumentacion.perfilar(logica_datos.generar_reporte_desde_htmls, ruta_stats, **parametros_reporte)
+                else:
+                    logica_datos.generar_reporte_desde_htmls(**parametros_reporte)
+        else:
+            print("❌ No se pudo consultar exitosamente ningún RUC de la lista.")
+    finally:
+        instrumentacion.guardar_metricas(ruta_salida)
+        progreso.emitir('lote_fin')
+
+    return rucs_procesados_ok
\ No newline at end of file
@@ -1,5 +1,6 @@
 # main.py
 import sys
+import argparse
 
 def iniciar_aplicacion_principal():
     """
@@ -10,7 +11,239 @@ def iniciar_aplicacion_principal():
     app.mainloop()
 
 
+def cargar_reglas(args):
+    """Reglas de RESULTADO desde --reglas (None = reglas por defecto de reglas.py)."""
+    if not args.reglas:
+        return None
+    import reglas
+    return reglas.cargar_reglas(args.reglas)
+
+
+def max_edad_cache_segundos(args) -> float:
+    """Antigüedad máxima del HTML reutilizable de 'html_consultas' (--max-edad-cache-horas)."""
+    return args.max_edad_cache_horas * 3600
+
+
+def ejecutar_lote_sin_gui(args):
+    """
+    Ejecuta el procesamiento en lote desde la línea de comandos (sin GUI),
+    mostrando periódicamente las mismas métricas que el panel de progreso.
+    """
+    import lote
+    import progreso
+    import web_scraping as ws
+
+    # Reciclaje del navegador en lotes largos
+    if args.reciclar_cada is not None:
+        ws._sesion.reciclar_cada = args.reciclar_cada
+    if args.limite_rss_mb is not None:
+        ws._sesion.limite_rss_mb = args.limite_rss_mb
+
+    metricas = progreso.MetricasLote()
+
+    def mostrar_metricas(evento, datos):
+        metricas.manejar_evento(evento, datos)
+        if evento in ('ruc_fin', 'ruc_cache'):
+            if metricas.resumen()['procesados'] % args.metricas_cada == 0:
+                print(f"\n📈 {metricas.formatear()}")
+        elif evento == 'lote_fin':
+            print(f"\n📈 {metricas.formatear()}")
+
+    progreso.suscribir(mostrar_metricas)
+    try:
+        lote.ejecutar_lote(
+            ruta_buzon_eps=args.buzon,
+            ruta_clientes_activos=args.clientes,
+            ruta_salida=args.salida,
+            ruta_base_bpm=args.bpm,
+            usar_cache=args.usar_cache,
+            max_edad_cache_segundos=max_edad_cache_segundos(args),
+            perfilar=args.perfilar or None,
+            reglas=cargar_reglas(args),
+            delta=args.delta
+        )
+    finally:
+        progreso.desuscribir(mostrar_metricas)
+
+
+def ejecutar_servicio(args):
+    """Inicia el servicio HTTP/JSON de consulta individual de RUCs."""
+    import servicio
+    servicio.ejecutar_servicio(
+        ruta_base=args.carpeta,
+        puerto=args.puerto,
+        host=args.host,
+        ruta_clientes_activos=args.clientes,
+        ruta_buzon_eps=args.buzon,
+        ruta_base_bpm=args.bpm,
+        trabajadores=args.navegadores,
+        max_edad_cache_horas=args.max_edad_cache_horas,
+        reglas=cargar_reglas(args),
+        reciclar_cada=args.reciclar_cada,
+        limite_rss_mb=args.limite_rss_mb
+    )
+
+
+def ejecutar_coordinador(args):
+    """Encola los RUCs en la cola compartida, espera a los trabajadores y genera el reporte."""
+    import cola_distribuida
+    cola_distribuida.ejecutar_coordinador(
+        ruta_cola=args.coordinador,
+        ruta_buzon_eps=args.buzon,
+        ruta_clientes_activos=args.clientes,
+        ruta_salida=args.salida,
+        ruta_base_bpm=args.bpm,
+        usar_cache=args.usar_cache,
+        max_edad_cache_segundos=max_edad_cache_segundos(args),
+        trabajadores_locales=args.trabajadores_locales,
+        duracion_lease_segundos=args.lease_segundos,
+        reglas=cargar_reglas(args),
+        delta=args.delta,
+        reciclar_cada=args.reciclar_cada,
+        limite_rss_mb=args.limite_rss_mb
+    )
+
+
+def ejecutar_trabajador(args):
+    """Consulta RUCs de la cola compartida hasta que se vacíe."""
+    import cola_distribuida
+    cola_distribuida.ejecutar_trabajador(
+        ruta_cola=args.trabajador,
+        ruta_base=args.carpeta,
+        usar_cache=args.usar_cache,
+        max_edad_cache_segundos=max_edad_cache_segundos(args),
+        reciclar_cada=args.reciclar_cada,
+        limite_rss_mb=args.limite_rss_mb
+    )
+
+
+def ejecutar_vigilancia(args):
+    """Procesa cada libro Buzon EPS que llegue a la carpeta vigilada (modo desatendido)."""
+    import vigilancia
+    vigilancia.ejecutar_vigilancia(
+        carpeta_entrada=args.vigilar,
+        bandeja_salida=args.bandeja_salida,
+        ruta_clientes_activos=args.clientes,
+        ruta_base_bpm=args.bpm,
+        intervalo_segundos=args.intervalo,
+        usar_cache=not args.sin_cache,
+        max_edad_cache_horas=args.max_edad_cache_horas,
+        reglas=cargar_reglas(args),
+        delta=args.delta,
+        una_vez=args.una_vez,
+        reciclar_cada=args.reciclar_cada,
+        limite_rss_mb=args.limite_rss_mb
+    )
+
+
+def ejecutar_reclasificacion(args):
+    """Recalcula VALIDACION FINAL de un reporte anterior con las bases y reglas actuales (sin SUNAT)."""
+    import proceso_datos
+    proceso_datos.reclasificar_reporte(
+        ruta_reporte_previo=args.reclasificar,
+        ruta_salida=args.salida,
+        ruta_buzon_eps=args.buzon,
+        ruta_clientes_activos=args.clientes,
+        ruta_base_bpm=args.bpm,
+        reglas=cargar_reglas(args)
+    )
+
+
+def entero_positivo(valor: str) -> int:
+    """Tipo de argparse: entero >= 1."""
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"se esperaba un entero, no '{valor}'")
+    if numero < 1:
+        raise argparse.ArgumentTypeError(f"debe ser 1 o mayor (se recibió {numero})")
+    return numero
+
+
+def crear_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Validador de leads SUNAT. Sin argumentos abre la GUI.")
+    parser.add_argument("--buzon", help="Excel de Leads Buzon EPS (columna RUC)")
+    parser.add_argument("--clientes", help="Excel de Clientes Activos SAEPS (columna Ruc)")
+    parser.add_argument("--salida", help="Ruta del reporte Excel a generar")
+    parser.add_argument("--bpm", help="Excel Base BPM (opcional): sus RUCs no se vuelven a consultar")
+    parser.add_argument("--perfilar", action="store_true", help="Ejecutar la etapa de reporte bajo cProfile (<reporte>_reporte.prof)")
+    parser.add_argument("--reciclar-cada", type=int, default=None, help="Reciclar el contexto del navegador cada N RUCs (0 = nunca)")
+    parser.add_argument("--limite-rss-mb", type=float, default=None, help="Reciclar si la memoria del navegador supera este valor (MB)")
+    parser.add_argument("--metricas-cada", type=entero_positivo, default=10, help="Mostrar métricas cada N RUCs procesados")
+    parser.add_argument("--reglas", help="JSON con las reglas de RESULTADO (ver reglas.py)")
+    parser.add_argument("--delta", action="store_true", help="Generar también <reporte>_delta.xlsx con los RUCs nuevos o cambiados desde la corrida anterior")
+    parser.add_argument("--usar-cache", action="store_true", help="Reutilizar el HTML ya descargado en 'html_consultas' (lote, --coordinador, --trabajador)")
+    parser.add_argument("--max-edad-cache-horas", type=float, default=24.0, help="Antigüedad máxima del HTML en cache (--usar-cache, --vigilar, --servicio)")
+    # Modo distribuido: coordinador + trabajadores sobre una cola SQLite compartida
+    parser.add_argument("--coordinador", metavar="COLA_DB", help="Encolar los RUCs en COLA_DB, esperar a los trabajadores y generar el reporte")
+    parser.add_argument("--trabajador", metavar="COLA_DB", help="Consultar RUCs de COLA_DB guardando el HTML en --carpeta")
+    parser.add_argument("--trabajadores-locales", type=int, default=0, help="Procesos trabajadores a lanzar junto al coordinador")
+    parser.add_argument("--lease-segundos", type=float, default=600.0, help="Tiempo máximo de un trabajador con un RUC antes de devolverlo a la cola")
+    # Modo vigilancia de carpeta (desatendido)
+    parser.add_argument("--vigilar", metavar="CARPETA_ENTRADA", help="Procesar cada libro Buzon EPS que llegue a esta carpeta")
+    parser.add_argument("--bandeja-salida", help="Carpeta donde dejar los reportes terminados y el estado (modo --vigilar)")
+    parser.add_argument("--intervalo", type=float, default=10.0, help="Segundos entre revisiones de la carpeta vigilada")
+    parser.add_argument("--sin-cache", action="store_true", help="En modo --vigilar, volver a consultar RUCs ya descargados")
+    parser.add_argument("--una-vez", action="store_true", help="En modo --vigilar, terminar cuando la carpeta de entrada quede vacía")
+    # Reclasificación sin consultar SUNAT
+    parser.add_argument("--reclasificar", metavar="REPORTE_PREVIO", help="Recalcular VALIDACION FINAL de un reporte anterior con --buzon/--clientes/--bpm actuales")
+    # Servicio HTTP/JSON
+    parser.add_argument("--servicio", action="store_true", help="Iniciar el servicio local GET /ruc/<ruc>")
+    parser.add_argument("--carpeta", default=".", help="Carpeta base de 'html_consultas' para el servicio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8080)
+    parser.add_argument("--navegadores", type=int, default=2, help="Navegadores pre-calentados del servicio")
+    return parser
+
+
 if __name__ == "__main__":
+    args = crear_parser().parse_args()
+
+    if args.servicio:
+        ejecutar_servicio(args)
+        sys.exit(0)
+
+    if args.trabajador:
+        ejecutar_trabajador(args)
+        sys.exit(0)
+
+    if args.coordinador:
+        if not (args.buzon and args.clientes and args.salida):
+            crear_parser().error("--buzon, --clientes y --salida son obligatorios con --coordinador")
+        try:
+            ejecutar_coordinador(args)
+        except Exception as e:
+            print(f"Error en el coordinador: {e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.vigilar:
+        if not (args.bandeja_salida and args.clientes):
+            crear_parser().error("--bandeja-salida y --clientes son obligatorios con --vigilar")
+        ejecutar_vigilancia(args)
+        sys.exit(0)
+
+    if args.reclasificar:
+        if not args.salida:
+            crear_parser().error("--salida es obligatorio con --reclasificar")
+        try:
+            ejecutar_reclasificacion(args)
+        except Exception as e:
+            print(f"Error al reclasificar: {e}")
+            sys.exit(1)
+        sys.exit(0)
+
+    if args.buzon or args.clientes or args.salida:
+        # Modo sin GUI: requiere los tres archivos
+        if not (args.buzon and args.clientes and args.salida):
+            crear_parser().error("--buzon, --clientes y --salida son obligatorios en modo sin GUI")
+        try:
+            ejecutar_lote_sin_gui(args)
+        except Exception as e:
+            print(f"Error en el proceso en lote: {e}")
+            sys.exit(1)
+        sys.exit(0)
+
     # Arrancar la app principal directamente
     try:
         iniciar_aplicacion_principal()
@@ -0,0 +1,306 @@
+# planificador.py (Planificador de consultas SUNAT con clases de prioridad)
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import web_scraping as ws
+import progreso
+from progreso import percentil
+
+# Clases de prioridad (menor número = más prioritaria)
+INTERACTIVA = 0
+LOTE = 1
+NOMBRES_CLASE = {INTERACTIVA: 'interactiva', LOTE: 'lote'}
+
+
+class _Trabajo:
+    __slots__ = ('ruc', 'ruta_base', 'usar_cache', 'max_edad_cache_segundos', 'prioridad', 'prioridad_origen',
+                 'futuro', 'encolado', 'inicio')
+
+    def __init__(self, ruc: str, ruta_base: str, usar_cache: bool, prioridad: int,
+                 max_edad_cache_segundos: Optional[float] = None):
+        self.ruc = ruc
+        self.ruta_base = ruta_base
+        self.usar_cache = usar_cache
+        self.max_edad_cache_segundos = max_edad_cache_segundos
+        self.prioridad = prioridad
+        # Clase con la que se envió: sus eventos de progreso la conservan aunque se promueva
+        self.prioridad_origen = prioridad
+        self.futuro: Future = Future()
+        self.encolado = time.monotonic()
+        self.inicio: Optional[float] = None
+
+
+class _EstadisticasClase:
+    def __init__(self):
+        self.enviadas = 0
+        self.completadas = 0
+        self.fallidas = 0
+        self.esperas: Deque[float] = deque(maxlen=1000)
+        self.totales: Deque[float] = deque(maxlen=1000)
+
+
+class PlanificadorConsultas:
+    """
+    Cola de consultas delante del scraper. Cada trabajador es un hilo con su propia
+    SesionNavegador (Playwright sync no se comparte entre hilos).
+    Las consultas INTERACTIVA se atienden antes que las de LOTE con el siguiente trabajador libre;
+    para no dejar sin servicio al lote, tras 'max_interactivas_seguidas' interactivas
+    consecutivas se atiende una de lote si hay pendientes.
+    'trabajadores_interactivos' agrega trabajadores que solo atienden INTERACTIVA: así una
+    búsqueda individual no espera a que termine el RUC del lote en curso (ni su pausa).
+    Los eventos de progreso de cada consulta llevan la clase ('lote'/'interactiva').
+    'reciclar_cada' y 'limite_rss_mb' se pasan a la SesionNavegador de cada trabajador.
+    """
+    def __init__(self, trabajadores: int = 1, pausa_lote_segundos: float = 1.0,
+                 max_interactivas_seguidas: int = 5, trabajadores_interactivos: int = 0,
+                 reciclar_cada: Optional[int] = None, limite_rss_mb: Optional[float] = None):
+        self.trabajadores = trabajadores
+        self.reciclar_cada = reciclar_cada
+        self.limite_rss_mb = limite_rss_mb
+        self.trabajadores_interactivos = trabajadores_interactivos
+        self.pausa_lote_segundos = pausa_lote_segundos
+        self.max_interactivas_seguidas = max_interactivas_seguidas
+        self._colas: Dict[int, Deque[_Trabajo]] = {INTERACTIVA: deque(), LOTE: deque()}
+        self._pendientes: Dict[Tuple[str, str], _Trabajo] = {}
+        self._condicion = threading.Condition()
+        self._interactivas_seguidas = 0
+        self._estadisticas = {INTERACTIVA: _EstadisticasClase(), LOTE: _EstadisticasClase()}
+        self._hilos: List[threading.Thread] = []
+        self._navegadores_listos = 0
+        self._activo = False
+        # Pedidos de pre-calentamiento a trabajadores ya iniciados (ver precalentar)
+        self._solicitud_precalentar = 0
+        self._precalentando = 0
+        self._precalentado: Optional[Future] = None
+        self._duracion_precalentado = 0.0
+        self._precalentado_ok = True
+
+    # --- Ciclo de vida ---
+    def iniciar(self, precalentar: bool = False):
+        """Lanza los trabajadores. Con 'precalentar', espera a que todos tengan el navegador abierto."""
+        if self._activo:
+            return
+        self._activo = True
+        listos = threading.Semaphore(0)
+        hilos = [(f"scraper-{i + 1}", False) for i in range(self.trabajadores)]
+        hilos += [(f"scraper-interactivo-{i + 1}", True) for i in range(self.trabajadores_interactivos)]
+        for nombre, solo_interactiva in hilos:
+            hilo = threading.Thread(target=self._trabajador, args=(listos, precalentar, solo_interactiva),
+                                    name=nombre, daemon=True)
+            hilo.start()
+            self._hilos.append(hilo)
+        if precalentar:
+            for _ in hilos:
+                listos.acquire()
+
+    def precalentar(self) -> Future:
+        """
+        Pide a los trabajadores que abran su navegador sin bloquear (los inicia si hace falta), para
+        lanzarlo mientras se hace otro trabajo (p.ej. leer las bases de entrada). El Future se completa
+        cuando todos lo atendieron, con los segundos que tardó el más lento (None si alguno falló).
+        Un trabajador ocupado lo atiende al terminar su consulta actual. Los trabajadores solo
+        interactivos no se pre-calientan (abren su navegador con la primera búsqueda individual).
+        """
+        self.iniciar()
+        with self._condicion:
+            if self._precalentado is not None and not self._precalentado.done():
+                return self._precalentado
+            self._precalentado = Future()
+            self._precalentando = self.trabajadores
+            self._duracion_precalentado = 0.0
+            self._precalentado_ok = True
+            self._solicitud_precalentar += 1
+            self._condicion.notify_all()
+            return self._precalentado
+
+    def detener(self, esperar_segundos: Optional[float] = None):
+        """
+        Detiene los trabajadores al terminar su consulta actual y cancela lo pendiente (un
+        pre-calentamiento en curso se completa con None). Con 'esperar_segundos', espera (hasta ese tiempo en total) a que cada trabajador cierre su navegador.
+        """
+        with self._condicion:
+            self._activo = False
+            for cola in self._colas.values():
+                while cola:
+                    cola.popleft().futuro.cancel()
+            self._pendientes.clear()
+            # Quien espera el pre-calentamiento (p.ej. preparar_arranque) no debe quedar bloqueado
+            if self._precalentado is not None and not self._precalentado.done():
+                self._precalentado.set_result(None)
+            self._condicion.notify_all()
+        if esperar_segundos is not None:
+            limite = time.monotonic() + esperar_segundos
+            for hilo in self._hilos:
+                hilo.join(max(0.0, limite - time.monotonic()))
+            self._hilos = [hilo for hilo in self._hilos if hilo.is_alive()]
+
+    # --- Envío de consultas ---
+    def consultar(self, ruc: str, ruta_base: str, prioridad: int = LOTE, usar_cache: bool = False,
+                  max_edad_cache_segundos: Optional[float] = None) -> Future:
+        """
+        Encola la consulta del RUC y devuelve un Future con el resultado de consultar_y_guardar_todo.
+        Si el RUC ya está pendiente, se reutiliza ese trabajo (y se promueve si la nueva prioridad es mayor).
+        """
+        clave = (ruc, ruta_base)
+        with self._condicion:
+            trabajo = self._pendientes.get(clave)
+            if trabajo is not None:
+                if prioridad < trabajo.prioridad and trabajo.inicio is None:
+                    self._colas[trabajo.prioridad].remove(trabajo)
+                    # La consulta se cuenta en la clase que finalmente la atiende
+                    self._estadisticas[trabajo.prioridad].enviadas -= 1
+                    self._estadisticas[prioridad].enviadas += 1
+                    trabajo.prioridad = prioridad
+                    self._colas[prioridad].append(trabajo)
+                    self._condicion.notify_all()
+                return trabajo.futuro
+            trabajo = _Trabajo(ruc, ruta_base, usar_cache, prioridad, max_edad_cache_segundos)
+            self._pendientes[clave] = trabajo
+            self._colas[prioridad].append(trabajo)
+            self._estadisticas[prioridad].enviadas += 1
+            # notify_all: un trabajador solo interactivo no puede atender una consulta de lote
+            self._condicion.notify_all()
+        return trabajo.futuro
+
+    def _siguiente(self, solo_interactiva: bool = False) -> Optional[_Trabajo]:
+        """Elige el próximo trabajo (llamar con la condición adquirida)."""
+        interactivas, lote = self._colas[INTERACTIVA], self._colas[LOTE]
+        if solo_interactiva:
+            return interactivas.popleft() if interactivas else None
+        if interactivas and (not lote or self._interactivas_seguidas < self.max_interactivas_seguidas):
+            self._interactivas_seguidas += 1
+            return interactivas.popleft()
+        if lote:
+            self._interactivas_seguidas = 0
+            return lote.popleft()
+        return None
+
+    def _abrir_navegador(self, sesion: ws.SesionNavegador) -> bool:
+        """Abre el navegador de la sesión si aún no está abierto. Devuelve False si no se pudo."""
+        if sesion.page:
+            return True
+        try:
+            sesion.iniciar()
+            with self._condicion:
+                self._navegadores_listos += 1
+            return True
+        except BaseException as e:
+            print(f"❌ No se pudo pre-calentar el navegador de {threading.current_thread().name}: {e}")
+            return False
+
+    def _atender_precalentado(self, sesion: ws.SesionNavegador):
+        inicio = time.monotonic()
+        ok = self._abrir_navegador(sesion)
+        with self._condicion:
+            self._duracion_precalentado = max(self._duracion_precalentado, time.monotonic() - inicio)
+            self._precalentado_ok = self._precalentado_ok and ok
+            self._precalentando -= 1
+            if self._precalentando <= 0 and not self._precalentado.done():
+                self._precalentado.set_result(self._duracion_precalentado if self._precalentado_ok else None)
+
+    def _trabajador(self, listos: threading.Semaphore, precalentar: bool, solo_interactiva: bool = False):
+        sesion = ws.SesionNavegador(self.reciclar_cada, self.limite_rss_mb)
+        if precalentar:
+            self._abrir_navegador(sesion)
+        listos.release()
+
+        precalentados_atendidos = 0
+        while True:
+            with self._condicion:
+                # Un pedido de pre-calentamiento se atiende antes que la siguiente consulta
+                while True:
+                    precalentar_ahora = (not solo_interactiva
+                                         and precalentados_atendidos < self._solicitud_precalentar)
+                    trabajo = None if precalentar_ahora else self._siguiente(solo_interactiva)
+                    if precalentar_ahora or trabajo is not None or not self._activo:
+                        break
+                    self._condicion.wait()
+                if precalentar_ahora:
+                    precalentados_atendidos = self._solicitud_precalentar
+                elif trabajo is None:
+                    break
+                else:
+                    trabajo.inicio = time.monotonic()
+
+            if precalentar_ahora:
+                self._atender_precalentado(sesion)
+                continue
+
+            desde_cache = trabajo.usar_cache and ws.html_en_cache(trabajo.ruc, trabajo.ruta_base,
+                                                                  trabajo.max_edad_cache_segundos)
+            exito = False
+            try:
+                with progreso.contexto(clase=NOMBRES_CLASE[trabajo.prioridad_origen]):
+                    exito = ws.consultar_y_guardar_todo(trabajo.ruc, trabajo.ruta_base,
+                                                        usar_cache=trabajo.usar_cache, sesion=sesion,
+                                                        max_edad_cache_segundos=trabajo.max_edad_cache_segundos)
+                trabajo.futuro.set_result(exito)
+            except BaseException as e:
+                trabajo.futuro.set_exception(e)
+            finally:
+                self._registrar_fin(trabajo, exito)
+
+            # Pequeña pausa para no saturar el servidor (solo consultas reales del lote)
+            if trabajo.prioridad == LOTE and not desde_cache and self.pausa_lote_segundos:
+                time.sleep(self.pausa_lote_segundos)
+
+        sesion.cerrar()
+
+    def _registrar_fin(self, trabajo: _Trabajo, exito: bool):
+        fin = time.monotonic()
+        with self._condicion:
+            self._pendientes.pop((trabajo.ruc, trabajo.ruta_base), None)
+            estadisticas = self._estadisticas[trabajo.prioridad]
+            if exito:
+                estadisticas.completadas += 1
+            else:
+                estadisticas.fallidas += 1
+            estadisticas.esperas.append(trabajo.inicio - trabajo.encolado)
+            estadisticas.totales.append(fin - trabajo.encolado)
+        progreso.emitir('consulta_planificada', ruc=trabajo.ruc, clase=NOMBRES_CLASE[trabajo.prioridad],
+                        espera=trabajo.inicio - trabajo.encolado, total=fin - trabajo.encolado, exito=exito)
+
+    # --- Métricas ---
+    def estadisticas(self) -> Dict[str, Any]:
+        """Latencia de espera y total (p50/p95) por clase, pendientes y participación en lo atendido."""
+        with self._condicion:
+            atendidas_total = sum(e.completadas + e.fallidas for e in self._estadisticas.values())
+            resumen: Dict[str, Any] = {
+                'trabajadores': self.trabajadores,
+                'trabajadores_interactivos': self.trabajadores_interactivos,
+                'navegadores_listos': self._navegadores_listos,
+                'en_curso': sum(1 for t in self._pendientes.values() if t.inicio is not None),
+            }
+            for prioridad, e in self._estadisticas.items():
+                atendidas = e.completadas + e.fallidas
+                esperas, totales = list(e.esperas), list(e.totales)
+                resumen[NOMBRES_CLASE[prioridad]] = {
+                    'enviadas': e.enviadas,
+                    'completadas': e.completadas,
+                    'fallidas': e.fallidas,
+                    'en_cola': len(self._colas[prioridad]),
+                    'espera_p50': percentil(esperas, 50),
+                    'espera_p95': percentil(esperas, 95),
+                    'total_p50': percentil(totales, 50),
+                    'total_p95': percentil(totales, 95),
+                    'participacion': (atendidas / atendidas_total) if atendidas_total else None,
+                }
+        return resumen
+
+    def formatear_estadisticas(self) -> str:
+        r = self.estadisticas()
+
+        def seg(valor):
+            return f"{valor:.1f}s" if valor is not None else '--'
+
+        lineas = []
+        for nombre in NOMBRES_CLASE.values():
+            c = r[nombre]
+            participacion = f"{c['participacion'] * 100:.0f}%" if c['participacion'] is not None else '--'
+            lineas.append(f"{nombre}: {c['completadas']} ok / {c['fallidas']} fallidas, en cola {c['en_cola']}, "
+                          f"espera p50 {seg(c['espera_p50'])} p95 {seg(c['espera_p95'])}, "
+                          f"total p95 {seg(c['total_p95'])}, participación {participacion}")
+        return "\n".join(lineas)
\ No newline at end of file
@@ -1,46 +1,293 @@
 # proceso_datos.py (Versión con lectura de Excel y generación directa, sinergia duh)
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from bs4 import BeautifulSoup
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional, Tuple
+import progreso
+from instrumentacion import medir
+from reglas import aplicar_reglas
+from delta import generar_reporte_delta
+
+# Nombres posibles de la columna de cantidad de trabajadores en la tabla de SUNAT
+COLUMNAS_CANTIDAD_TRABAJADORES = ['N° de Trabajadores', 'N° Trabajadores', 'N° de Trabajadores', 'Numero de Trabajadores', 'N de Trabajadores', 'Nº de Trabajadores', 'Nro. Trabajadores', 'Trabajadores']
+
+# --- Bases de entrada indexadas por RUC ---
+
+# Columnas candidatas de RUC y campos que se extraen de cada Excel de entrada
+COLUMNAS_RUC_BUZON = ['RUC']
+COLUMNAS_RUC_CLIENTES = ['Ruc']
+COLUMNAS_RUC_BPM = ['RUC', 'Ruc', 'ruc', 'NRO RUC', 'Nro RUC', 'N° RUC', 'Número de RUC']
+CAMPOS_BUZON = {'CANAL': ['CANAL', 'Canal', 'canal']}
+CAMPOS_CLIENTES = {'ADM SAC': ['Adm SAC ACT', 'Adm SAC', 'Adm_SAC', 'ADM SAC ACT']}
+CAMPOS_BPM = {
+    'BPM ASESOR': ['Asesor', 'ASESOR', 'Ejecutivo', 'EJECUTIVO', 'Responsable', 'RESPONSABLE', 'Asignado a', 'ASIGNADO'],
+    'BPM ESTADO': ['Estado BPM', 'ESTADO BPM', 'Estado', 'ESTADO', 'Etapa', 'ETAPA'],
+    'BPM FECHA': ['Fecha Asignación', 'Fecha Asignacion', 'FECHA ASIGNACION', 'Fecha', 'FECHA'],
+}
+
+
+class BaseEntrada:
+    """
+    RUCs de un Excel de entrada indexados en memoria: conjunto de RUCs (búsqueda O(1))
+    y, por cada campo, un mapa RUC -> valor. Ante RUCs repetidos gana la última fila.
+    """
+    def __init__(self, nombre: str, campos: List[str]):
+        self.nombre = nombre
+        self.rucs: set = set()
+        self.valores: Dict[str, Dict[str, Optional[str]]] = {campo: {} for campo in campos}
+
+    def agregar_bloque(self, rucs: List[Optional[str]], valores: Dict[str, List[Optional[str]]]):
+        """Agrega un bloque de filas (columnas paralelas). Las filas sin RUC se ignoran."""
+        indices = [i for i, ruc in enumerate(rucs) if ruc is not None]
+        rucs_bloque = [rucs[i].strip() for i in indices]
+        self.rucs.update(rucs_bloque)
+        for campo, columna in valores.items():
+            self.valores[campo].update(zip(rucs_bloque, (columna[i] for i in indices)))
+
+    def __contains__(self, ruc: str) -> bool:
+        return ruc in self.rucs
+
+    def __len__(self) -> int:
+        return len(self.rucs)
+
+    def valor(self, ruc: str, campo: str, defecto: Any = '') -> Any:
+        """Valor del campo para el RUC; 'defecto' si el RUC no está o el valor está vacío."""
+        valor = self.valores.get(campo, {}).get(ruc)
+        return defecto if valor is None else valor
+
+    def mapa(self, campo: str) -> Dict[str, Optional[str]]:
+        return self.valores.get(campo, {})
+
+    def subconjunto(self, rucs: List[str]) -> 'BaseEntrada':
+        """Copia de la base con solo los RUCs indicados (los que no estén se omiten)."""
+        base = BaseEntrada(self.nombre, list(self.valores))
+        base.rucs = {ruc for ruc in rucs if ruc in self.rucs}
+        base.valores = {campo: {ruc: mapa[ruc] for ruc in base.rucs if ruc in mapa}
+                        for campo, mapa in self.valores.items()}
+        return base
+
+
+# Lectura en streaming: filas por bloque y valores que pandas (read_excel con dtype=str) trata como vacíos
+TAMANO_BLOQUE_FILAS = 5000
+VALORES_VACIOS_EXCEL = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+                        '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
+
+def _texto_celda(valor: Any) -> Optional[str]:
+    """Convierte una celda de openpyxl al texto que devolvería pandas con dtype=str (None si está vacía)."""
+    if valor is None:
+        return None
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    texto = str(valor)
+    return None if texto in VALORES_VACIOS_EXCEL else texto
+
+
+class LectorColumnasExcel:
+    """
+    Lee solo algunas columnas de la primera hoja de un Excel, en bloques de filas, sin cargar el libro
+    completo en memoria (openpyxl en modo read_only). 'candidatas' es clave -> nombres posibles de la
+    columna; se usa el primero presente en la cabecera. Los .xls se leen con pandas (solo esas columnas).
+    Uso:
+        with LectorColumnasExcel(ruta, {'ruc': ['RUC']}) as lector:
+            for bloque in lector.bloques():  # bloque: clave -> lista de valores (texto o None)
+                ...
+    """
+    def __init__(self, ruta_excel: str, candidatas: Dict[str, List[str]],
+                 tamano_bloque: int = TAMANO_BLOQUE_FILAS):
+        self.ruta_excel = ruta_excel
+        self.candidatas = candidatas
+        self.tamano_bloque = tamano_bloque
+        self.columnas: Dict[str, Optional[str]] = {}
+        self._libro = None
+        self._hoja = None
+        self._fila_cabecera = 1
+        self._indices: Dict[str, int] = {}
+
+    def __enter__(self) -> 'LectorColumnasExcel':
+        if os.path.splitext(self.ruta_excel)[1].lower() == '.xls':
+            cabecera = [str(c) for c in pd.read_excel(self.ruta_excel, nrows=0).columns]
+        else:
+            from openpyxl import load_workbook
+            self._libro = load_workbook(self.ruta_excel, read_only=True, data_only=True)
+            self._hoja = self._libro.worksheets[0]
+            cabecera = []
+            # La cabecera es la primera fila con algún valor
+            for numero, fila in enumerate(self._hoja.iter_rows(values_only=True), start=1):
+                if any(valor is not None for valor in fila):
+                    self._fila_cabecera = numero
+                    cabecera = ['' if valor is None else str(valor) for valor in fila]
+                    break
+        for clave, nombres in self.candidatas.items():
+            self.columnas[clave] = next((c for c in nombres if c in cabecera), None)
+            if self.columnas[clave] is not None:
+                self._indices[clave] = cabecera.index(self.columnas[clave])
+        return self
+
+    def __exit__(self, *_):
+        if self._libro is not None:
+            self._libro.close()
+            self._libro = None
+
+    def bloques(self) -> Iterator[Dict[str, List[Optional[str]]]]:
+        claves = list(self._indices)
+        if not claves:
+            return
+        if self._hoja is None:
+            yield from self._bloques_pandas(claves)
+            return
+        indices = [self._indices[clave] for clave in claves]
+        bloque: Dict[str, List[Optional[str]]] = {clave: [] for clave in claves}
+        filas_bloque = 0
+        for fila in self._hoja.iter_rows(min_row=self._fila_cabecera + 1, max_col=max(indices) + 1,
+                                         values_only=True):
+            ancho = len(fila)
+            for clave, indice in zip(claves, indices):
+                bloque[clave].append(_texto_celda(fila[indice]) if indice < ancho else None)
+            filas_bloque += 1
+            if filas_bloque >= self.tamano_bloque:
+                yield bloque
+                bloque = {clave: [] for clave in claves}
+                filas_bloque = 0
+        if filas_bloque:
+            yield bloque
+
+    def _bloques_pandas(self, claves: List[str]) -> Iterator[Dict[str, List[Optional[str]]]]:
+        nombres = [self.columnas[clave] for clave in claves]
+        df = pd.read_excel(self.ruta_excel, dtype=str, usecols=lambda c: str(c) in nombres)
+        df.columns = [str(c) for c in df.columns]
+        for inicio in range(0, len(df), self.tamano_bloque):
+            parte = df.iloc[inicio:inicio + self.tamano_bloque]
+            yield {clave: [None if pd.isna(v) else v for v in parte[self.columnas[clave]]] for clave in claves}
+
+
+def cargar_base_entrada(ruta_excel: str, nombre: str, columnas_ruc: List[str],
+                        campos: Dict[str, List[str]]) -> BaseEntrada:
+    """
+    Lee un Excel de entrada y construye su BaseEntrada.
+    Solo se leen la columna de RUC y las de los campos (por bloques, con memoria acotada);
+    se indexan los campos cuya columna exista. Lanza ValueError si no hay columna de RUC.
+    """
+    clave_ruc = '__ruc__'
+    with medir(f'lectura_excel_{nombre.lower().replace(" ", "_")}'):
+        with LectorColumnasExcel(ruta_excel, {clave_ruc: columnas_ruc, **campos}) as lector:
+            if lector.columnas[clave_ruc] is None:
+                raise ValueError(f"No se encontró la columna '{columnas_ruc[0]}' en el archivo {nombre}.")
+            base = BaseEntrada(nombre, [campo for campo in campos if lector.columnas[campo]])
+            for bloque in lector.bloques():
+                base.agregar_bloque(bloque[clave_ruc], {campo: bloque[campo] for campo in base.valores})
+    return base
+
+
+class BasesEntrada:
+    """Las tres bases de entrada (cualquiera puede faltar) cargadas una sola vez por ejecución."""
+    def __init__(self, buzon: Optional[BaseEntrada] = None, clientes: Optional[BaseEntrada] = None,
+                 bpm: Optional[BaseEntrada] = None):
+        self.buzon = buzon
+        self.clientes = clientes
+        self.bpm = bpm
+
+
+def cargar_bases_entrada(ruta_buzon_eps: Optional[str], ruta_clientes_activos: Optional[str],
+                         ruta_base_bpm: Optional[str] = None, estricto: bool = False,
+                         paralelo: bool = False) -> BasesEntrada:
+    """
+    Carga e indexa las bases de entrada que tengan ruta.
+    Con 'estricto', un error en Buzon EPS o Clientes Activos se propaga; si no, esa base queda en None.
+    La Base BPM es siempre opcional: si falla, se avisa y se continúa sin ella.
+    Con 'paralelo', cada libro se lee en su propio hilo (el tiempo total es el del libro más lento
+    en vez de la suma, en la medida en que la lectura espera disco o descompresión).
+    """
+    def cargar(ruta, nombre, columnas_ruc, campos, obligatoria):
+        if not ruta:
+            return None
+        try:
+            return cargar_base_entrada(ruta, nombre, columnas_ruc, campos)
+        except Exception as e:
+            if obligatoria:
+                raise
+            if nombre == 'Base BPM':
+                print(f"⚠️ No se pudo usar la Base BPM: {e}")
+            return None
+
+    especificaciones = {
+        'buzon': (ruta_buzon_eps, 'Buzon EPS', COLUMNAS_RUC_BUZON, CAMPOS_BUZON, estricto),
+        'clientes': (ruta_clientes_activos, 'Clientes Activos', COLUMNAS_RUC_CLIENTES, CAMPOS_CLIENTES, estricto),
+        'bpm': (ruta_base_bpm, 'Base BPM', COLUMNAS_RUC_BPM, CAMPOS_BPM, False),
+    }
+    if not paralelo:
+        return BasesEntrada(**{clave: cargar(*argumentos) for clave, argumentos in especificaciones.items()})
+    with ThreadPoolExecutor(max_workers=len(especificaciones), thread_name_prefix='lector-excel') as executor:
+        futuros = {clave: executor.submit(cargar, *argumentos) for clave, argumentos in especificaciones.items()}
+    return BasesEntrada(**{clave: futuro.result() for clave, futuro in futuros.items()})
+
+
+class CacheBasesEntrada:
+    """
+    Bases de entrada en memoria entre ejecuciones (GUI, modo vigilancia): cada base se vuelve
+    a leer solo si cambia la ruta o la fecha de modificación del archivo.
+    """
+    def __init__(self):
+        self._bases: Dict[str, Tuple[str, float, Optional[BaseEntrada]]] = {}  # nombre -> (ruta, mtime, base)
+        self._lock = threading.Lock()
+
+    def obtener(self, ruta: Optional[str], nombre: str, columnas_ruc: List[str],
+                campos: Dict[str, List[str]], obligatoria: bool = True) -> Optional[BaseEntrada]:
+        """
+        Devuelve la base cargada. Si el archivo no existe o falla la lectura, propaga el error
+        o (no obligatoria) avisa y devuelve None; se vuelve a intentar en la siguiente llamada.
+        """
+        if not ruta:
+            return None
+        with self._lock:
+            en_cache = self._bases.get(nombre)
+            try:
+                mtime = os.path.getmtime(ruta)
+                if en_cache is not None and en_cache[:2] == (ruta, mtime):
+                    return en_cache[2]
+                base = cargar_base_entrada(ruta, nombre, columnas_ruc, campos)
+            except Exception as e:
+                if obligatoria:
+                    raise
+                print(f"⚠️ No se pudo usar la {nombre}: {e}")
+                self._bases.pop(nombre, None)
+                return None
+            self._bases[nombre] = (ruta, mtime, base)
+            print(f"📚 {nombre} cargada en memoria ({len(base)} RUCs).")
+            return base
 
-def obtener_rucs_de_excels(ruta_buzon_eps: str, ruta_clientes_activos: str) -> List[str]:
+
+def obtener_rucs_de_excels(ruta_buzon_eps: str, ruta_clientes_activos: str,
+                           ruta_base_bpm: Optional[str] = None,
+                           bases: Optional[BasesEntrada] = None) -> List[str]:
     """
     Lee dos archivos Excel y devuelve una lista de RUCs que están en el primer archivo (Buzon EPS)
     pero NO están en el segundo archivo (Clientes Activos SAEPS).
+    Si se indica la Base BPM, también se excluyen los RUCs ya trabajados en BPM.
+    'bases' permite reutilizar bases ya cargadas (p.ej. para el reporte final).
     """
-    # Nombres de columna esperados
-    COLUMNA_RUC_BUZON = 'RUC'  # Columna en el primer Excel
-    COLUMNA_RUC_CLIENTES = 'Ruc'  # Columna en el segundo Excel
-
     try:
-        # Leer el primer archivo (LEADS MAIL EPS)
-        df_buzon = pd.read_excel(ruta_buzon_eps, dtype=str)
-        if COLUMNA_RUC_BUZON not in df_buzon.columns:
-            print(f"⚠️ Advertencia: No se encontró la columna '{COLUMNA_RUC_BUZON}' en el archivo Buzon EPS.")
-            return []
-        
-        # Leer el segundo archivo (BASE SAEPS)
-        df_clientes = pd.read_excel(ruta_clientes_activos, dtype=str)
-        if COLUMNA_RUC_CLIENTES not in df_clientes.columns:
-            print(f"⚠️ Advertencia: No se encontró la columna '{COLUMNA_RUC_CLIENTES}' en el archivo Clientes Activos.")
+        if bases is None:
+            bases = cargar_bases_entrada(ruta_buzon_eps, ruta_clientes_activos, ruta_base_bpm, estricto=True)
+        if bases.buzon is None or bases.clientes is None:
+            print("⚠️ Advertencia: Faltan los archivos Buzon EPS o Clientes Activos.")
             return []
 
-        # Obtener RUCs del primer archivo (limpiando nulos y espacios)
-        rucs_buzon = set(df_buzon[COLUMNA_RUC_BUZON].dropna().apply(str.strip).unique())
-        
-        # Obtener RUCs del segundo archivo (limpiando nulos y espacios)
-        rucs_clientes = set(df_clientes[COLUMNA_RUC_CLIENTES].dropna().apply(str.strip).unique())
-        
-        # Encontrar RUCs que están en el primer archivo pero NO en el segundo
-        rucs_a_procesar = rucs_buzon - rucs_clientes
+        # Encontrar RUCs que están en el primer archivo pero NO en el segundo (ni en BPM)
+        rucs_a_procesar = bases.buzon.rucs - bases.clientes.rucs
+        rucs_en_bpm = rucs_a_procesar & bases.bpm.rucs if bases.bpm is not None else set()
+        rucs_a_procesar -= rucs_en_bpm
 
         # Filtrar solo RUCs válidos (11 dígitos numéricos)
         rucs_validos = [ruc for ruc in rucs_a_procesar if ruc.isdigit() and len(ruc) == 11]
         
         print(f"\nAnálisis de RUCs:")
-        print(f"📊 RUCs en Buzón EPS: {len(rucs_buzon)}")
-        print(f"📊 RUCs en Base SAEPS: {len(rucs_clientes)}")
+        print(f"📊 RUCs en Buzón EPS: {len(bases.buzon)}")
+        print(f"📊 RUCs en Base SAEPS: {len(bases.clientes)}")
+        if bases.bpm is not None:
+            print(f"📊 RUCs en Base BPM: {len(bases.bpm)} ({len(rucs_en_bpm)} ya gestionados, no se consultarán)")
         print(f"🎯 RUCs únicos a procesar: {len(rucs_validos)}")
         
         return sorted(rucs_validos)  # Ordenamos la lista para procesamiento consistente
@@ -48,6 +295,9 @@ def obtener_rucs_de_excels(ruta_buzon_eps: str, ruta_clientes_activos: str) -> L
     except FileNotFoundError as e:
         print(f"❌ Error: No se pudo encontrar el archivo {e.filename}. Verifica las rutas.")
         return []
+    except ValueError as e:
+        print(f"⚠️ Advertencia: {e}")
+        return []
     except Exception as e:
         print(f"❌ Error leyendo los archivos Excel: {e}")
         return []
@@ -80,22 +330,69 @@ def parse_principal_html(html_content: str) -> Dict[str, Any]:
                 datos[clave] = valor
     return datos
 
-def parse_trabajadores_html(html_content: str, ruc: str = '') -> List[Dict[str, Any]]:
+class AcumuladorColumnas:
+    """
+    Filas acumuladas por columna (una lista por encabezado) para construir el DataFrame columna a columna,
+    sin un dict por fila. Las columnas que faltan en un bloque de filas quedan en NaN, como en
+    pd.DataFrame(lista_de_dicts); el orden de columnas es el de primera aparición.
+    """
+    __slots__ = ('columnas', 'total_filas')
+    FALTANTE = float('nan')
+
+    def __init__(self):
+        self.columnas: Dict[str, List[Any]] = {}
+        self.total_filas = 0
+
+    def agregar(self, encabezados: List[str], filas: List[List[Any]]):
+        """Agrega filas alineadas con 'encabezados' (ante encabezados repetidos gana el último)."""
+        if not filas:
+            return
+        posiciones = {encabezado: i for i, encabezado in enumerate(encabezados)}
+        for encabezado, i in posiciones.items():
+            columna = self.columnas.get(encabezado)
+            if columna is None:
+                columna = self.columnas[encabezado] = [self.FALTANTE] * self.total_filas
+            columna.extend([fila[i] for fila in filas])
+        self.total_filas += len(filas)
+        for columna in self.columnas.values():
+            if len(columna) < self.total_filas:
+                columna.extend([self.FALTANTE] * (self.total_filas - len(columna)))
+
+    def __len__(self) -> int:
+        return self.total_filas
+
+    def a_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.columnas)
+
+    def filas(self) -> List[Dict[str, Any]]:
+        """Las filas como dicts (para consultas de un solo RUC)."""
+        nombres = list(self.columnas)
+        return [dict(zip(nombres, valores)) for valores in zip(*self.columnas.values())]
+
+def acumular_trabajadores_html(html_content: str, ruc: str, acumulador: AcumuladorColumnas) -> int:
+    """Parsea la tabla de trabajadores y agrega sus filas (con el RUC) al acumulador. Devuelve las filas agregadas."""
     if 'no existen declaraciones presentadas' in html_content.lower():
-        return [{'RUC': ruc, 'Mensaje': 'Sin declaraciones presentadas'}]
+        acumulador.agregar(['RUC', 'Mensaje'], [[ruc, 'Sin declaraciones presentadas']])
+        return 1
     soup = BeautifulSoup(html_content, 'html.parser')
     table = soup.find('table')
     if not table:
-        return [{'RUC': ruc, 'Mensaje': 'No se encontró tabla de trabajadores'}]
+        acumulador.agregar(['RUC', 'Mensaje'], [[ruc, 'No se encontró tabla de trabajadores']])
+        return 1
     headers = [th.get_text(strip=True) for th in table.find_all('th')]
     rows = []
     for tr in table.find('tbody').find_all('tr'):
         cols = [td.get_text(strip=True) for td in tr.find_all('td')]
         if len(cols) == len(headers):
-            row_data = {header: col for header, col in zip(headers, cols)}
-            row_data['RUC'] = ruc
-            rows.append(row_data)
-    return rows
+            cols.append(ruc)
+            rows.append(cols)
+    acumulador.agregar(headers + ['RUC'], rows)
+    return len(rows)
+
+def parse_trabajadores_html(html_content: str, ruc: str = '') -> List[Dict[str, Any]]:
+    acumulador = AcumuladorColumnas()
+    acumular_trabajadores_html(html_content, ruc, acumulador)
+    return acumulador.filas()
 
 # --- Función Principal de Generación de Excel (MODIFICADA) ---
 
@@ -144,23 +441,294 @@ def convertir_df_a_numerico(df: pd.DataFrame) -> pd.DataFrame:
     
     return df_converted
 
+def leer_datos_ruc(ruc: str, carpeta_html: str) -> Dict[str, Any]:
+    """
+    Lee y parsea los HTML guardados de un RUC ('RUC_<ruc>_principal.html' y '_trabajadores.html').
+    Devuelve {'principal': dict, 'trabajadores': list}; 'principal' vacío si no existe el HTML.
+    """
+    datos: Dict[str, Any] = {'principal': {}, 'trabajadores': []}
+    ruta_principal = os.path.join(carpeta_html, f"RUC_{ruc}_principal.html")
+    ruta_trabajadores = os.path.join(carpeta_html, f"RUC_{ruc}_trabajadores.html")
+    if os.path.isfile(ruta_principal):
+        with open(ruta_principal, 'r', encoding='utf-8') as f:
+            datos['principal'] = parse_principal_html(f.read())
+    if os.path.isfile(ruta_trabajadores):
+        with open(ruta_trabajadores, 'r', encoding='utf-8') as f:
+            datos['trabajadores'] = parse_trabajadores_html(f.read(), ruc=ruc)
+    return datos
+
+# Columnas candidatas de la pestaña de trabajadores
+COLUMNAS_PERIODO_TRABAJADORES = ['Período', 'Periodo', 'PERIODO']
+COLUMNAS_RUC_TRABAJADORES = ['RUC', 'Ruc', 'Ruc.', 'ruc']
+LIMITE_INT32 = 2 ** 31 - 1
+
+def compactar_df_trabajadores(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Tipos compactos para la pestaña de trabajadores (una fila por RUC y período):
+    RUC int64 (categórico si hay valores no numéricos), Período y cantidades Int32 nullable
+    y columnas de texto repetitivo como categóricas.
+    Modifica y devuelve el mismo DataFrame.
+    """
+    if df.empty:
+        return df
+    for columna in df.columns:
+        serie = df[columna]
+        if columna in COLUMNAS_RUC_TRABAJADORES:
+            numerico = pd.to_numeric(serie, errors='coerce')
+            df[columna] = numerico.astype('int64') if numerico.notna().all() else serie.astype(str).astype('category')
+            continue
+        if columna in COLUMNAS_PERIODO_TRABAJADORES:
+            serie = pd.to_numeric(serie, errors='coerce')
+        elif not pd.api.types.is_numeric_dtype(serie):
+            # Texto repetitivo (p.ej. 'Mensaje'): categórico
+            if serie.nunique() <= len(serie) // 2:
+                df[columna] = serie.astype('category')
+            continue
+        validos = serie.dropna()
+        if (validos % 1 == 0).all() and (validos.abs() <= LIMITE_INT32).all():
+            df[columna] = serie.astype('Int32')
+    return df
+
+def ultima_cantidad_por_ruc(df_trabajadores: pd.DataFrame) -> Dict[str, Any]:
+    """
+    RUC (texto) -> cantidad de trabajadores del período más reciente, en una sola pasada groupby/idxmax
+    (sin copiar ni ordenar el DataFrame). Vacío si faltan las columnas de RUC, período o cantidad.
+    """
+    def primera(candidatas):
+        return next((c for c in candidatas if c in df_trabajadores.columns), None)
+
+    ruc_col = primera(COLUMNAS_RUC_TRABAJADORES)
+    period_col = primera(COLUMNAS_PERIODO_TRABAJADORES)
+    trabajadores_col = primera(COLUMNAS_CANTIDAD_TRABAJADORES)
+    if not (ruc_col and period_col and trabajadores_col):
+        return {}
+    periodos = pd.to_numeric(df_trabajadores[period_col], errors='coerce')
+    con_periodo = periodos.notna()
+    if not con_periodo.any():
+        return {}
+    # Índice de la fila con el período más reciente de cada RUC
+    indices = periodos[con_periodo].groupby(df_trabajadores.loc[con_periodo, ruc_col], observed=True, sort=False).idxmax()
+    rucs = indices.index.astype(str).str.strip()
+    return dict(zip(rucs, df_trabajadores.loc[indices.to_numpy(), trabajadores_col].tolist()))
+
+def preparar_pestanas_sunat(df_principal: pd.DataFrame,
+                            df_trabajadores: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Normaliza las pestañas Principal_SUNAT y Trabajadores_SUNAT tal como se escriben en el reporte:
+    'Período' como número (AAAAMM) y columnas numéricas donde sea posible.
+    """
+    # Antes de convertir columnas a numérico, limpiar la columna 'Período' en la pestaña de trabajadores
+    if 'Período' in df_trabajadores.columns:
+        try:
+            # Reemplazar guiones y espacios, p.ej. '2025-09' -> '202509'
+            df_trabajadores['Período'] = df_trabajadores['Período'].astype(str).str.replace('-', '', regex=False).str.replace(' ', '', regex=False)
+            # Conversión estricta: transformar a numérico, forzando valores no válidos a NaN
+            # y luego convertir a Int32 nullable para poder mantener NA si existen valores inválidos.
+            df_trabajadores['Período'] = pd.to_numeric(df_trabajadores['Período'], errors='coerce').astype('Int32')
+        except Exception as e:
+            print(f"⚠️ No se pudo normalizar la columna 'Período': {e}")
+
+    # Convertir columnas a numérico donde sea posible
+    with medir('convertir_df_a_numerico'):
+        df_principal = convertir_df_a_numerico(df_principal)
+        df_trabajadores = compactar_df_trabajadores(convertir_df_a_numerico(df_trabajadores))
+    return df_principal, df_trabajadores
+
+def validacion_final_de_ruc(ruc: str, datos: Dict[str, Any], bases: BasesEntrada,
+                            reglas: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Fila de VALIDACION FINAL de un solo RUC (servicio), calculada con construir_validacion_final
+    igual que en el reporte. 'datos' es lo que devuelve leer_datos_ruc (vacío si no se consultó SUNAT).
+    El RUC se trata como un lead del Buzon EPS y las bases se reducen a ese RUC.
+    """
+    buzon = bases.buzon.subconjunto([ruc]) if bases.buzon is not None else BaseEntrada('Buzon EPS', list(CAMPOS_BUZON))
+    buzon.rucs.add(ruc)
+    bases_ruc = BasesEntrada(buzon=buzon,
+                             clientes=bases.clientes.subconjunto([ruc]) if bases.clientes is not None else None,
+                             bpm=bases.bpm.subconjunto([ruc]) if bases.bpm is not None else None)
+    df_principal, df_trabajadores = preparar_pestanas_sunat(
+        pd.DataFrame([datos['principal'] or {'Número de RUC': ruc}]), pd.DataFrame(datos['trabajadores']))
+    df_valid = construir_validacion_final(df_principal, df_trabajadores, bases_ruc, reglas)
+    fila = df_valid.iloc[0].to_dict() if not df_valid.empty else {'RUC': ruc}
+    return {campo: ('' if pd.isna(valor) else valor.item() if hasattr(valor, 'item') else valor)
+            for campo, valor in fila.items()}
+
+def construir_validacion_final(df_principal: pd.DataFrame, df_trabajadores: pd.DataFrame,
+                               bases: BasesEntrada, reglas: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+    """
+    Construye la pestaña VALIDACION FINAL a partir de los datos SUNAT ya parseados
+    (pestañas Principal_SUNAT y Trabajadores_SUNAT) y las bases de entrada.
+    'reglas' permite reemplazar las reglas de RESULTADO (por defecto reglas.REGLAS_RESULTADO).
+    """
+    rucs_cruzados_inter: List[str] = []
+    rucs_cruzados_bpm: List[str] = []
+    # Determinar nombres de columna candidatos
+    def first_column(df, candidates):
+        if df is None or df.empty:
+            return None
+        for c in candidates:
+            if c in df.columns:
+                return c
+        return None
+
+    ruc_col = first_column(df_principal, ['Número de RUC', 'RUC', 'Ruc'])
+    razon_col = first_column(df_principal, ['Razón Social', 'Razon Social', 'Razón_social'])
+    tipo_col = first_column(df_principal, ['Tipo Contribuyente', 'Tipo de Contribuyente', 'TipoContribuyente'])
+
+    # Base de RUCs desde la pestaña principal
+    if ruc_col is None:
+        df_valid = pd.DataFrame(columns=['RUC', 'CANAL', 'ADM SAC', 'Razón Social', 'Tipo Contibuyente'])
+    else:
+        df_valid = df_principal[[ruc_col]].copy()
+        df_valid = df_valid.rename(columns={ruc_col: 'RUC'})
+
+        # Añadir Razón Social y Tipo Contibutiente si existen
+        if razon_col:
+            df_valid['Razón Social'] = df_principal[razon_col].astype(str)
+        else:
+            df_valid['Razón Social'] = ''
+
+        if tipo_col:
+            df_valid['Tipo Contibuyente'] = df_principal[tipo_col].astype(str)
+        else:
+            df_valid['Tipo Contibuyente'] = ''
+
+        # Nuevas columnas: Estado del Contribuyente y Condición del Contribuyente
+        estado_col = first_column(df_principal, ['Estado del Contribuyente', 'Estado del Contribuyente ' , 'Estado'])
+        condicion_col = first_column(df_principal, ['Condición del Contribuyente', 'Condicion del Contribuyente', 'Condición'])
+
+        if estado_col:
+            df_valid['Estado del Contribuyente'] = df_principal[estado_col].astype(str)
+        else:
+            df_valid['Estado del Contribuyente'] = ''
+
+        if condicion_col:
+            df_valid['Condición del Contribuyente'] = df_principal[condicion_col].astype(str)
+        else:
+            df_valid['Condición del Contribuyente'] = ''
+
+        # Lookup CANAL (Buzon EPS) y ADM SAC (Clientes Activos) en las bases indexadas
+        df_valid['CANAL'] = ''
+        df_valid['ADM SAC'] = ''
+        rucs_valid = df_valid['RUC'].astype(str)
+
+        # Mapear CANAL
+        if bases.buzon is not None and 'CANAL' in bases.buzon.valores:
+            df_valid['CANAL'] = rucs_valid.map(bases.buzon.mapa('CANAL')).fillna('')
+
+        # Mapear ADM SAC (si no existe en clientes, marcar como NUEVO)
+        if bases.clientes is not None and 'ADM SAC' in bases.clientes.valores:
+            df_valid['ADM SAC'] = rucs_valid.map(bases.clientes.mapa('ADM SAC')).fillna('NUEVO')
+        else:
+            # Si no hay base de clientes, marcar todos como NUEVO
+            df_valid['ADM SAC'] = 'NUEVO'
+
+        # --- Nueva columna: Cantidad de Trabajadores (período más reciente por RUC) ---
+        try:
+            df_valid['RUC'] = df_valid['RUC'].astype(str).str.strip()
+            mapping_trab = ultima_cantidad_por_ruc(df_trabajadores)
+            df_valid['Cantidad de Trabajadores'] = df_valid['RUC'].map(mapping_trab).fillna('')
+        except Exception as e:
+            print(f"⚠️ No se pudo obtener 'Cantidad de Trabajadores': {e}")
+
+        # --- Agregar filas extra para RUCs que estaban en ambos inputs iniciales ---
+        # Estos RUCs se obtienen como la intersección entre los RUCs del buzon y los RUCs de clientes activos.
+        # Para cada uno, añadimos una fila con CANAL tomado del primer excel y ADM SAC tomado del segundo.
+        # Resultado para estas filas será forzado más abajo a 'Enviar Correo Administrador'.
+        # Igual con los RUCs del buzón ya gestionados en la Base BPM (no se consultaron en SUNAT).
+        try:
+            if bases.buzon is not None and bases.clientes is not None:
+                rucs_cruzados_inter = sorted(bases.buzon.rucs & bases.clientes.rucs)
+            if bases.buzon is not None and bases.bpm is not None:
+                rucs_cruzados_bpm = sorted((bases.buzon.rucs & bases.bpm.rucs) - set(rucs_cruzados_inter))
+
+            # Evitar duplicados respecto a lo ya presente en df_valid
+            existing = set(df_valid['RUC'].astype(str).str.strip().unique())
+            rows_extra = []
+            for r in rucs_cruzados_inter + rucs_cruzados_bpm:
+                if r in existing:
+                    continue
+                rows_extra.append({
+                    'RUC': r,
+                    'CANAL': bases.buzon.valor(r, 'CANAL', ''),
+                    'ADM SAC': bases.clientes.valor(r, 'ADM SAC', '') if bases.clientes is not None and r in bases.clientes else 'NUEVO',
+                    'Razón Social': '',
+                    'Tipo Contibuyente': '',
+                    'Estado del Contribuyente': '',
+                    'Condición del Contribuyente': '',
+                    'Cantidad de Trabajadores': ''
+                })
+
+            if rows_extra:
+                df_extra = pd.DataFrame(rows_extra)
+                df_valid = pd.concat([df_valid, df_extra], ignore_index=True)
+        except Exception as e:
+            print(f"⚠️ No se pudo agregar filas extra de RUCs cruzados: {e}")
+
+    # Asegurar orden de columnas
+    desired_cols = ['RUC', 'CANAL', 'ADM SAC', 'Razón Social', 'Tipo Contibuyente', 'Estado del Contribuyente', 'Condición del Contribuyente', 'Cantidad de Trabajadores']
+    for c in desired_cols:
+        if c not in df_valid.columns:
+            df_valid[c] = ''
+    df_valid = df_valid[desired_cols]
+
+    # --- Nueva columna: RESULTADO (reglas de negocio en reglas.py) ---
+    # Los RUCs cruzados con Clientes Activos y los ya gestionados en BPM
+    # se resuelven por las reglas que usan los conjuntos 'clientes' y 'bpm'.
+    try:
+        df_valid['RESULTADO'] = aplicar_reglas(df_valid, reglas, {'clientes': set(rucs_cruzados_inter),
+                                                                  'bpm': set(rucs_cruzados_bpm)})
+    except Exception as e:
+        print(f"⚠️ No se pudo calcular la columna 'RESULTADO': {e}")
+
+    # Datos de asignación de la Base BPM (solo si se proporcionó)
+    if bases.bpm is not None:
+        try:
+            rucs_valid = df_valid['RUC'].astype(str).str.strip()
+            for campo in bases.bpm.valores:
+                df_valid[campo] = rucs_valid.map(bases.bpm.mapa(campo)).fillna('')
+        except Exception as e:
+            print(f"⚠️ No se pudieron agregar los datos de la Base BPM: {e}")
+
+    # Asegurar que la columna RUC sea numérica (Int64 nullable) en la pestaña de validación
+    try:
+        # Limpiar espacios y convertir a numérico
+        df_valid['RUC'] = pd.to_numeric(df_valid['RUC'].astype(str).str.strip(), errors='coerce').astype('Int64')
+    except Exception as e:
+        print(f"⚠️ No se pudo convertir 'RUC' a numérico en VALIDACION FINAL: {e}")
+
+    return df_valid
+
 def generar_reporte_desde_htmls(ruta_salida: str, rucs_a_procesar: Optional[List[str]] = None,
                                 ruta_buzon_eps: Optional[str] = None,
                                 ruta_clientes_activos: Optional[str] = None,
-                                ruc_ya_cliente: bool = False):
+                                ruc_ya_cliente: bool = False,
+                                ruta_base_bpm: Optional[str] = None,
+                                bases: Optional[BasesEntrada] = None,
+                                reglas: Optional[List[Dict[str, Any]]] = None,
+                                delta: bool = False, ruc_en_bpm: bool = False):
     """
     Genera un reporte Excel a partir de los HTMLs.
     Si se provee 'rucs_a_procesar', solo incluirá esos RUCs en el reporte.
-    Si 'ruc_ya_cliente' es True, genera un reporte sin consultar SUNAT (RUC ya existe en clientes).
+    Si 'ruc_ya_cliente' es True, genera un reporte sin consultar SUNAT (RUC ya existe en clientes);
+    igual con 'ruc_en_bpm' (RUC ya gestionado en la Base BPM).
+    'bases' permite reutilizar las bases de entrada ya cargadas en obtener_rucs_de_excels.
+    'reglas' reemplaza las reglas de RESULTADO (ver reglas.py).
+    Con 'delta', además escribe '<reporte>_delta.xlsx' con los RUCs nuevos o cambiados (ver delta.py).
     """
     print("\nIniciando la generación del reporte final desde archivos HTML...")
+    progreso.emitir('reporte_inicio', ruta_salida=ruta_salida)
     directorio_salida = os.path.dirname(ruta_salida)
     carpeta_html = os.path.join(directorio_salida, 'html_consultas')
+    if bases is None:
+        bases = cargar_bases_entrada(ruta_buzon_eps if ruta_buzon_eps and os.path.isfile(ruta_buzon_eps) else None,
+                                     ruta_clientes_activos if ruta_clientes_activos and os.path.isfile(ruta_clientes_activos) else None,
+                                     ruta_base_bpm if ruta_base_bpm and os.path.isfile(ruta_base_bpm) else None)
 
-    # Si el RUC ya es cliente, generar un reporte sin datos SUNAT
-    if ruc_ya_cliente and rucs_a_procesar:
+    # Si el RUC ya es cliente (o ya fue gestionado en BPM), generar un reporte sin datos SUNAT
+    if (ruc_ya_cliente or ruc_en_bpm) and rucs_a_procesar:
         ruc_cliente = rucs_a_procesar[0]
-        print(f"Generando reporte para RUC ya cliente: {ruc_cliente}")
+        print(f"Generando reporte para RUC {'ya cliente' if ruc_ya_cliente else 'gestionado en BPM'}: {ruc_cliente}")
         
         # Crear DataFrames vacíos para las pestañas SUNAT
         df_principal = pd.DataFrame()
@@ -171,23 +739,9 @@ def generar_reporte_desde_htmls(ruta_salida: str, rucs_a_procesar: Optional[List
         
         try:
             # Obtener info del RUC desde Clientes Activos
-            df_clientes = None
-            adm_val = ''
-            if ruta_clientes_activos and os.path.isfile(ruta_clientes_activos):
-                try:
-                    df_clientes = pd.read_excel(ruta_clientes_activos, dtype=str)
-                    if 'Ruc' in df_clientes.columns:
-                        df_clientes['Ruc'] = df_clientes['Ruc'].astype(str).str.strip()
-                        # Buscar ADM SAC
-                        for cand in ['Adm SAC ACT', 'Adm SAC', 'Adm_SAC', 'ADM SAC ACT']:
-                            if cand in df_clientes.columns:
-                                try:
-                                    adm_val = df_clientes.loc[df_clientes['Ruc'] == ruc_cliente, cand].iloc[0]
-                                except Exception:
-                                    adm_val = ''
-                                break
-                except Exception:
-                    df_clientes = None
+            adm_val = '' if ruc_ya_cliente else 'NUEVO'
+            if ruc_ya_cliente and bases.clientes is not None:
+                adm_val = bases.clientes.valor(ruc_cliente, 'ADM SAC', '')
             
             # Crear DataFrame de validación
             df_valid = pd.DataFrame({
@@ -201,8 +755,14 @@ def generar_reporte_desde_htmls(ruta_salida: str, rucs_a_procesar: Optional[List
                 'Cantidad de Trabajadores': ['']
             })
             
-            # Asignar RESULTADO = 'Enviar Correo Administrador' para RUCs que ya son clientes
-            df_valid['RESULTADO'] = 'Enviar Correo Administrador'
+            # RESULTADO para RUCs que ya son clientes ('Enviar Correo Administrador' con las reglas por defecto)
+            # o ya gestionados en BPM ('Gestionado en BPM')
+            df_valid['RESULTADO'] = aplicar_reglas(df_valid, reglas, {
+                'clientes': {ruc_cliente} if ruc_ya_cliente else set(),
+                'bpm': {ruc_cliente} if ruc_en_bpm else set()})
+            if ruc_en_bpm and bases.bpm is not None:
+                for campo in bases.bpm.valores:
+                    df_valid[campo] = [bases.bpm.valor(ruc_cliente, campo, '')]
             
             # Convertir RUC a Int64
             df_valid['RUC'] = pd.to_numeric(df_valid['RUC'].astype(str).str.strip(), errors='coerce').astype('Int64')
@@ -217,13 +777,14 @@ def generar_reporte_desde_htmls(ruta_salida: str, rucs_a_procesar: Optional[List
             df_trabajadores.to_excel(writer, sheet_name='Trabajadores_SUNAT', index=False)
         
         print(f"✅ Reporte final guardado exitosamente en: {ruta_salida}")
+        progreso.emitir('reporte_fin', ruta_salida=ruta_salida)
         return
 
     if not os.path.isdir(carpeta_html):
         raise FileNotFoundError(f"Error: No se encontró la carpeta 'html_consultas'.")
 
     archivos_html = [f for f in os.listdir(carpeta_html) if f.lower().endswith('.html')]
-    datos_principales, datos_trabajadores = [], []
+    datos_principales, datos_trabajadores = [], AcumuladorColumnas()
 
     for nombre_archivo in archivos_html:
         try:
@@ -237,315 +798,95 @@ def generar_reporte_desde_htmls(ruta_salida: str, rucs_a_procesar: Optional[List
                 continue
 
             ruta_completa = os.path.join(carpeta_html, nombre_archivo)
-            with open(ruta_completa, 'r', encoding='utf-8') as f:
+            with medir('lectura_html'), open(ruta_completa, 'r', encoding='utf-8') as f:
                 contenido = f.read()
             
             if nombre_archivo.endswith('_principal.html'):
-                datos_principales.append(parse_principal_html(contenido))
+                with medir('parseo_principal'):
+                    datos_principales.append(parse_principal_html(contenido))
             elif nombre_archivo.endswith('_trabajadores.html'):
-                datos_trabajadores.extend(parse_trabajadores_html(contenido, ruc=ruc))
+                with medir('parseo_trabajadores'):
+                    acumular_trabajadores_html(contenido, ruc, datos_trabajadores)
         except Exception as e:
             print(f"⚠️ Error procesando el archivo {nombre_archivo}: {e}")
 
     if not datos_principales and not datos_trabajadores:
         print("⚠️ No se encontraron datos para generar el reporte.")
+        progreso.emitir('reporte_fin', ruta_salida=None)
         return
 
     # Convertir a DataFrames
-    df_principal = pd.DataFrame(datos_principales)
-    df_trabajadores = pd.DataFrame(datos_trabajadores)
-    
-    # Antes de convertir columnas a numérico, limpiar la columna 'Período' en la pestaña de trabajadores
-    if 'Período' in df_trabajadores.columns:
-        try:
-            # Reemplazar guiones y espacios, p.ej. '2025-09' -> '202509'
-            df_trabajadores['Período'] = df_trabajadores['Período'].astype(str).str.replace('-', '', regex=False).str.replace(' ', '', regex=False)
-            # Conversión estricta: transformar a numérico, forzando valores no válidos a NaN
-            # y luego convertir a Int64 nullable para poder mantener NA si existen valores inválidos.
-            df_trabajadores['Período'] = pd.to_numeric(df_trabajadores['Período'], errors='coerce').astype('Int64')
-        except Exception as e:
-            print(f"⚠️ No se pudo normalizar la columna 'Período': {e}")
-
-    # Convertir columnas a numérico donde sea posible
-    df_principal = convertir_df_a_numerico(df_principal)
-    df_trabajadores = convertir_df_a_numerico(df_trabajadores)
+    df_principal, df_trabajadores = preparar_pestanas_sunat(pd.DataFrame(datos_principales),
+                                                            datos_trabajadores.a_dataframe())
+    del datos_trabajadores
     
     print(f"Procesamiento finalizado. Se incluirán {len(df_principal)} registros en la pestaña principal.")
 
     # Guardar con tipos de datos correctos
-    with pd.ExcelWriter(ruta_salida, engine='openpyxl') as writer:
+    df_valid = None
+    writer = pd.ExcelWriter(ruta_salida, engine='openpyxl')
+    try:
         # --- Generar pestaña de VALIDACION FINAL ---
         try:
-            # Determinar nombres de columna candidatos
-            def first_column(df, candidates):
-                if df is None or df.empty:
-                    return None
-                for c in candidates:
-                    if c in df.columns:
-                        return c
-                return None
-
-            ruc_col = first_column(df_principal, ['Número de RUC', 'RUC', 'Ruc'])
-            razon_col = first_column(df_principal, ['Razón Social', 'Razon Social', 'Razón_social'])
-            tipo_col = first_column(df_principal, ['Tipo Contribuyente', 'Tipo de Contribuyente', 'TipoContribuyente'])
-
-            # Base de RUCs desde la pestaña principal
-            if ruc_col is None:
-                df_valid = pd.DataFrame(columns=['RUC', 'CANAL', 'ADM SAC', 'Razón Social', 'Tipo Contibuyente'])
-            else:
-                df_valid = df_principal[[ruc_col]].copy()
-                df_valid = df_valid.rename(columns={ruc_col: 'RUC'})
-
-                # Añadir Razón Social y Tipo Contibutiente si existen
-                if razon_col:
-                    df_valid['Razón Social'] = df_principal[razon_col].astype(str)
-                else:
-                    df_valid['Razón Social'] = ''
-
-                if tipo_col:
-                    df_valid['Tipo Contibuyente'] = df_principal[tipo_col].astype(str)
-                else:
-                    df_valid['Tipo Contibuyente'] = ''
-
-                # Nuevas columnas: Estado del Contribuyente y Condición del Contribuyente
-                estado_col = first_column(df_principal, ['Estado del Contribuyente', 'Estado del Contribuyente ' , 'Estado'])
-                condicion_col = first_column(df_principal, ['Condición del Contribuyente', 'Condicion del Contribuyente', 'Condición'])
-
-                if estado_col:
-                    df_valid['Estado del Contribuyente'] = df_principal[estado_col].astype(str)
-                else:
-                    df_valid['Estado del Contribuyente'] = ''
-
-                if condicion_col:
-                    df_valid['Condición del Contribuyente'] = df_principal[condicion_col].astype(str)
-                else:
-                    df_valid['Condición del Contribuyente'] = ''
-
-                # Preparar CANAL desde el primer excel (RUCS Buzon EPS)
-                df_buzon = None
-                canal_col = None
-                if ruta_buzon_eps and os.path.isfile(ruta_buzon_eps):
-                    try:
-                        df_buzon = pd.read_excel(ruta_buzon_eps, dtype=str)
-                        canal_col = None
-                        for cand in ['CANAL', 'Canal', 'canal']:
-                            if cand in df_buzon.columns:
-                                canal_col = cand
-                                break
-                        # Normalizar columna RUC del buzon
-                        if 'RUC' in df_buzon.columns:
-                            df_buzon['RUC'] = df_buzon['RUC'].astype(str).str.strip()
-                    except Exception:
-                        df_buzon = None
-
-                # Preparar ADM SAC desde el segundo excel (Clientes Activos)
-                df_clientes = None
-                adm_col = None
-                if ruta_clientes_activos and os.path.isfile(ruta_clientes_activos):
-                    try:
-                        df_clientes = pd.read_excel(ruta_clientes_activos, dtype=str)
-                        for cand in ['Adm SAC ACT', 'Adm SAC', 'Adm_SAC', 'ADM SAC ACT']:
-                            if cand in df_clientes.columns:
-                                adm_col = cand
-                                break
-                        # Normalizar columna Ruc del clientes
-                        if 'Ruc' in df_clientes.columns:
-                            df_clientes['Ruc'] = df_clientes['Ruc'].astype(str).str.strip()
-                    except Exception:
-                        df_clientes = None
-
-                # Lookup CANAL and ADM SAC
-                # Inicializar columnas
-                df_valid['CANAL'] = ''
-                df_valid['ADM SAC'] = ''
-
-                # Mapear CANAL
-                if df_buzon is not None and canal_col is not None:
-                    # Crear mapping de RUC -> CANAL
-                    try:
-                        mapping_canal = df_buzon.set_index(df_buzon['RUC'])[canal_col].to_dict()
-                        df_valid['CANAL'] = df_valid['RUC'].astype(str).map(mapping_canal).fillna('')
-                    except Exception:
-                        df_valid['CANAL'] = ''
-
-                # Mapear ADM SAC (si no existe en clientes, marcar como NUEVO)
-                if df_clientes is not None and adm_col is not None:
-                    try:
-                        mapping_adm = df_clientes.set_index(df_clientes['Ruc'])[adm_col].to_dict()
-                        df_valid['ADM SAC'] = df_valid['RUC'].astype(str).map(mapping_adm)
-                        df_valid['ADM SAC'] = df_valid['ADM SAC'].fillna('NUEVO')
-                    except Exception:
-                        df_valid['ADM SAC'] = 'NUEVO'
-                else:
-                    # Si no hay dataframe de clientes, marcar todos como NUEVO
-                    df_valid['ADM SAC'] = 'NUEVO'
-
-                # --- Nueva columna: Cantidad de Trabajadores ---
-                try:
-                    # Determinar nombres de columna para período y trabajadores
-                    period_col = first_column(df_trabajadores, ['Período', 'Periodo', 'PERIODO'])
-                    trabajadores_col = None
-                    if not df_trabajadores.empty:
-                        for cand in ['N° de Trabajadores', 'N° Trabajadores', 'N° de Trabajadores', 'Numero de Trabajadores', 'N de Trabajadores', 'Nº de Trabajadores', 'Nro. Trabajadores', 'Trabajadores']:
-                            if cand in df_trabajadores.columns:
-                                trabajadores_col = cand
-                                break
-
-                    if period_col and trabajadores_col:
-                        # Trabajar con copia y normalizar nombres de columna RUC en df_trabajadores
-                        df_trab_trunc = df_trabajadores.copy()
-
-                        # Localizar columna RUC en df_trab_trunc
-                        ruc_col_candidates = ['RUC', 'Ruc', 'Ruc.', 'ruc']
-                        ruc_col_trab = None
-                        for cand in ruc_col_candidates:
-                            if cand in df_trab_trunc.columns:
-                                ruc_col_trab = cand
-                                break
-
-                        if ruc_col_trab is None:
-                            # No se encontró columna RUC en trabajadores
-                            df_valid['Cantidad de Trabajadores'] = ''
-                        else:
-                            # Normalizar RUCs como strings sin espacios
-                            df_trab_trunc[ruc_col_trab] = df_trab_trunc[ruc_col_trab].astype(str).str.strip()
-                            # Renombrar a 'RUC' para facilitar el merge/mapping
-                            if ruc_col_trab != 'RUC':
-                                df_trab_trunc = df_trab_trunc.rename(columns={ruc_col_trab: 'RUC'})
-
-                            # Asegurar que periodo sea numérico y eliminar filas sin periodo válido
-                            df_trab_trunc[period_col] = pd.to_numeric(df_trab_trunc[period_col], errors='coerce')
-                            df_trab_trunc = df_trab_trunc.dropna(subset=[period_col])
-
-                            if df_trab_trunc.empty or trabajadores_col not in df_trab_trunc.columns:
-                                df_valid['Cantidad de Trabajadores'] = ''
-                            else:
-                                # Ordenar por periodo descendente y quedarnos con la primera entrada por RUC
-                                latest = df_trab_trunc.sort_values(by=period_col, ascending=False).drop_duplicates(subset=['RUC'], keep='first')
-                                # Normalizar df_valid RUCs
-                                df_valid['RUC'] = df_valid['RUC'].astype(str).str.strip()
-                                # Crear mapping RUC -> cantidad
-                                mapping_trab = latest.set_index('RUC')[trabajadores_col].to_dict()
-                                df_valid['Cantidad de Trabajadores'] = df_valid['RUC'].map(mapping_trab).fillna('')
-                    else:
-                        # Si no hay datos, dejar en blanco
-                        df_valid['Cantidad de Trabajadores'] = ''
-                except Exception as e:
-                    print(f"⚠️ No se pudo obtener 'Cantidad de Trabajadores': {e}")
-
-                # --- Agregar filas extra para RUCs que estaban en ambos inputs iniciales ---
-                # Estos RUCs se obtienen como la intersección entre los RUCs del buzon y los RUCs de clientes activos.
-                # Para cada uno, añadimos una fila con CANAL tomado del primer excel y ADM SAC tomado del segundo.
-                # Resultado para estas filas será forzado más abajo a 'Enviar Correo Administrador'.
-                rucs_cruzados_inter = []
-                try:
-                    if df_buzon is not None and df_clientes is not None:
-                        # Normalizar nombres de columna de RUC en ambos dataframes
-                        buzon_ruc_col = 'RUC' if 'RUC' in df_buzon.columns else None
-                        clientes_ruc_col = 'Ruc' if 'Ruc' in df_clientes.columns else None
-
-                        if buzon_ruc_col and clientes_ruc_col:
-                            set_buzon = set(df_buzon[buzon_ruc_col].dropna().astype(str).str.strip())
-                            set_clientes = set(df_clientes[clientes_ruc_col].dropna().astype(str).str.strip())
-                            inter = sorted(set_buzon & set_clientes)
-                            rucs_cruzados_inter = inter
-
-                            # Evitar duplicados respecto a lo ya presente en df_valid
-                            existing = set(df_valid['RUC'].astype(str).str.strip().unique())
-                            rows_extra = []
-                            for r in inter:
-                                if r in existing:
-                                    continue
-                                # Obtener CANAL desde df_buzon
-                                canal_val = ''
-                                if canal_col and df_buzon is not None and 'RUC' in df_buzon.columns:
-                                    try:
-                                        canal_val = df_buzon.loc[df_buzon[buzon_ruc_col].astype(str).str.strip() == r, canal_col].iloc[0]
-                                    except Exception:
-                                        canal_val = ''
-
-                                # Obtener ADM SAC desde df_clientes
-                                adm_val = ''
-                                if adm_col and df_clientes is not None and clientes_ruc_col in df_clientes.columns:
-                                    try:
-                                        adm_val = df_clientes.loc[df_clientes[clientes_ruc_col].astype(str).str.strip() == r, adm_col].iloc[0]
-                                    except Exception:
-                                        adm_val = ''
-
-                                rows_extra.append({
-                                    'RUC': r,
-                                    'CANAL': canal_val if pd.notna(canal_val) else '',
-                                    'ADM SAC': adm_val if pd.notna(adm_val) else '',
-                                    'Razón Social': '',
-                                    'Tipo Contibuyente': '',
-                                    'Estado del Contribuyente': '',
-                                    'Condición del Contribuyente': '',
-                                    'Cantidad de Trabajadores': ''
-                                })
-
-                            if rows_extra:
-                                df_extra = pd.DataFrame(rows_extra)
-                                df_valid = pd.concat([df_valid, df_extra], ignore_index=True)
-                except Exception as e:
-                    print(f"⚠️ No se pudo agregar filas extra de RUCs cruzados: {e}")
-
-            # Asegurar orden de columnas
-            desired_cols = ['RUC', 'CANAL', 'ADM SAC', 'Razón Social', 'Tipo Contibuyente', 'Estado del Contribuyente', 'Condición del Contribuyente', 'Cantidad de Trabajadores']
-            for c in desired_cols:
-                if c not in df_valid.columns:
-                    df_valid[c] = ''
-            df_valid = df_valid[desired_cols]
-
-            # --- Nueva columna: RESULTADO ---
-            try:
-                # Asumo la precedencia: 1) Tipo Contribuyente == 'PERSONA NATURAL SIN NEGOCIO' -> Derivar a Mary Huanay
-                # 2) ADM SAC != 'NUEVO' -> Enviar Correo a Líder
-                # 3) Sino, usar Cantidad de Trabajadores: <50 -> Asignar Nuevo, >=50 -> Enviar Correo a Líder
-                tipo_ser = df_valid['Tipo Contibuyente'].astype(str).str.strip().str.upper()
-                adm_ser = df_valid['ADM SAC'].astype(str).str.strip()
-                # Convertir cantidad a numérico, NaN -> treated as 0 for decision
-                cantidad_num = pd.to_numeric(df_valid['Cantidad de Trabajadores'], errors='coerce')
-                cantidad_num_filled = cantidad_num.fillna(0)
-
-                df_valid['RESULTADO'] = ''
-
-                # 1) Tipo Contribuyente special case
-                mask_tipo = tipo_ser == 'PERSONA NATURAL SIN NEGOCIO'
-                df_valid.loc[mask_tipo, 'RESULTADO'] = 'Derivar a Mary Huanay'
-
-                # 2) ADM SAC not NEW (aplica solo donde no se haya asignado RESULTADO)
-                mask_remaining = df_valid['RESULTADO'] == ''
-                mask_adm = adm_ser.str.upper() != 'NUEVO'
-                df_valid.loc[mask_remaining & mask_adm, 'RESULTADO'] = 'Enviar Correo a Líder'
-
-                # 3) Basado en cantidad de trabajadores para los restantes
-                mask_remaining = df_valid['RESULTADO'] == ''
-                df_valid.loc[mask_remaining & (cantidad_num_filled < 50), 'RESULTADO'] = 'Asignar Nuevo'
-                df_valid.loc[mask_remaining & (cantidad_num_filled >= 50), 'RESULTADO'] = 'Enviar Correo a Líder'
-            except Exception as e:
-                print(f"⚠️ No se pudo calcular la columna 'RESULTADO': {e}")
-
-            # Si existen RUCs que se agregaron por estar en ambos inputs iniciales,
-            # forzamos su RESULTADO a 'Enviar Correo Administrador'.
-            try:
-                if 'rucs_cruzados_inter' in locals() and rucs_cruzados_inter:
-                    mask_cruzados = df_valid['RUC'].astype(str).str.strip().isin(rucs_cruzados_inter)
-                    df_valid.loc[mask_cruzados, 'RESULTADO'] = 'Enviar Correo Administrador'
-            except Exception as e:
-                print(f"⚠️ No se pudo forzar RESULTADO para rucs cruzados: {e}")
-
-            # Asegurar que la columna RUC sea numérica (Int64 nullable) en la pestaña de validación
-            try:
-                # Limpiar espacios y convertir a numérico
-                df_valid['RUC'] = pd.to_numeric(df_valid['RUC'].astype(str).str.strip(), errors='coerce').astype('Int64')
-            except Exception as e:
-                print(f"⚠️ No se pudo convertir 'RUC' a numérico en VALIDACION FINAL: {e}")
+            with medir('validacion_final'):
+                df_valid = construir_validacion_final(df_principal, df_trabajadores, bases, reglas)
+
+            with medir('escritura_hojas_excel'):
+                # Escribir la hoja de validación PRIMERO para que sea la primera pestaña
+                df_valid.to_excel(writer, sheet_name='VALIDACION FINAL', index=False)
+                # Luego escribir las demás pestañas (referencia de origen)
+                df_principal.to_excel(writer, sheet_name='Principal_SUNAT', index=False)
+                df_trabajadores.to_excel(writer, sheet_name='Trabajadores_SUNAT', index=False)
+        except Exception as e:
+            print(f"⚠️ No se pudo generar la pestaña 'VALIDACION FINAL': {e}")
+    finally:
+        # El libro se escribe a disco al cerrar el ExcelWriter (etapa aparte de las anteriores)
+        with medir('guardado_excel'):
+            writer.close()
+    print(f"✅ Reporte final guardado exitosamente en: {ruta_salida}")
 
-            # Escribir la hoja de validación PRIMERO para que sea la primera pestaña
+    if delta and df_valid is not None:
+        try:
+            with medir('reporte_delta'):
+                generar_reporte_delta(df_valid, ruta_salida)
+        except Exception as e:
+            print(f"⚠️ No se pudo generar el reporte delta: {e}")
+    progreso.emitir('reporte_fin', ruta_salida=ruta_salida)
+
+def reclasificar_reporte(ruta_reporte_previo: str, ruta_salida: str,
+                         ruta_buzon_eps: Optional[str] = None,
+                         ruta_clientes_activos: Optional[str] = None,
+                         ruta_base_bpm: Optional[str] = None,
+                         reglas: Optional[List[Dict[str, Any]]] = None,
+                         bases: Optional[BasesEntrada] = None):
+    """
+    Recalcula VALIDACION FINAL sin consultar SUNAT ni volver a parsear HTML: toma las pestañas
+    Principal_SUNAT y Trabajadores_SUNAT de un reporte anterior y les aplica las bases de entrada
+    actuales y las reglas indicadas. Las pestañas SUNAT se copian tal cual al nuevo reporte.
+    """
+    print(f"\nReclasificando a partir de: {ruta_reporte_previo}")
+    progreso.emitir('reporte_inicio', ruta_salida=ruta_salida)
+    with medir('lectura_reporte_previo'):
+        hojas = pd.read_excel(ruta_reporte_previo, sheet_name=['Principal_SUNAT', 'Trabajadores_SUNAT'])
+    df_principal = hojas['Principal_SUNAT']
+    df_trabajadores = compactar_df_trabajadores(hojas['Trabajadores_SUNAT'])
+    if bases is None:
+        bases = cargar_bases_entrada(ruta_buzon_eps, ruta_clientes_activos, ruta_base_bpm)
+
+    with medir('validacion_final'):
+        df_valid = construir_validacion_final(df_principal, df_trabajadores, bases, reglas)
+    writer = pd.ExcelWriter(ruta_salida, engine='openpyxl')
+    try:
+        with medir('escritura_hojas_excel'):
             df_valid.to_excel(writer, sheet_name='VALIDACION FINAL', index=False)
-            # Luego escribir las demás pestañas (referencia de origen)
             df_principal.to_excel(writer, sheet_name='Principal_SUNAT', index=False)
             df_trabajadores.to_excel(writer, sheet_name='Trabajadores_SUNAT', index=False)
-        except Exception as e:
-            print(f"⚠️ No se pudo generar la pestaña 'VALIDACION FINAL': {e}")
-    print(f"✅ Reporte final guardado exitosamente en: {ruta_salida}")
\ No newline at end of file
+    finally:
+        with medir('guardado_excel'):
+            writer.close()
+
+    conteo = df_valid['RESULTADO'].value_counts() if 'RESULTADO' in df_valid.columns else pd.Series(dtype=int)
+    for resultado, cantidad in conteo.items():
+        print(f"📊 {resultado or '(sin resultado)'}: {cantidad}")
+    print(f"✅ Reporte reclasificado guardado en: {ruta_salida}")
+    progreso.emitir('reporte_fin', ruta_salida=ruta_salida)
\ No newline at end of file
@@ -0,0 +1,198 @@
+# progreso.py (Eventos de progreso del lote y métricas en vivo)
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+# --- Bus de eventos ---
+# Las etapas (scraping, reporte) emiten eventos y quien quiera mostrarlos (GUI, CLI) se suscribe.
+_suscriptores: List[Callable[[str, Dict[str, Any]], None]] = []
+_lock_suscriptores = threading.Lock()
+# Datos que se agregan a los eventos emitidos desde el hilo actual (ver contexto)
+_contexto_hilo = threading.local()
+
+
+def suscribir(callback: Callable[[str, Dict[str, Any]], None]):
+    """Registra un callback(evento, datos) que recibirá todos los eventos emitidos."""
+    with _lock_suscriptores:
+        if callback not in _suscriptores:
+            _suscriptores.append(callback)
+
+
+def desuscribir(callback: Callable[[str, Dict[str, Any]], None]):
+    """Elimina un callback previamente registrado."""
+    with _lock_suscriptores:
+        if callback in _suscriptores:
+            _suscriptores.remove(callback)
+
+
+@contextmanager
+def contexto(**datos: Any):
+    """
+    Agrega 'datos' a todos los eventos emitidos desde este hilo dentro del bloque
+    (p.ej. clase='interactiva' para que las métricas del lote ignoren una consulta prioritaria).
+    """
+    previo = getattr(_contexto_hilo, 'datos', {})
+    _contexto_hilo.datos = {**previo, **datos}
+    try:
+        yield
+    finally:
+        _contexto_hilo.datos = previo
+
+
+def contexto_actual() -> Dict[str, Any]:
+    """Datos agregados con contexto() en el hilo actual."""
+    return getattr(_contexto_hilo, 'datos', {})
+
+
+def emitir(evento: str, **datos: Any):
+    """
+    Emite un evento a todos los suscriptores.
+    Un suscriptor que falle nunca debe interrumpir el proceso que emite.
+    """
+    datos = {**contexto_actual(), **datos}
+    with _lock_suscriptores:
+        callbacks = list(_suscriptores)
+    for callback in callbacks:
+        try:
+            callback(evento, datos)
+        except Exception:
+            pass
+
+
+def percentil(valores: List[float], p: float) -> Optional[float]:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, int(round(p / 100 * (len(ordenados) - 1)))))
+    return ordenados[indice]
+
+
+class MetricasLote:
+    """
+    Acumula los eventos de un lote y calcula contadores, throughput, latencias y ETA.
+    Es seguro llamarla desde el hilo de proceso y leerla desde el hilo de la GUI.
+
+    Eventos que entiende:
+      lote_inicio(total), ruc_inicio(ruc), ruc_cache(ruc), ruc_fin(ruc, exito, duracion),
+      reporte_inicio(), reporte_fin(), lote_fin()
+    Si lote_inicio trae 'clase' (p.ej. 'lote'), se ignoran los eventos de otra clase
+    (consultas interactivas atendidas mientras corre el lote).
+    """
+    def __init__(self, total: int = 0, ventana_segundos: float = 300.0):
+        self._lock = threading.Lock()
+        self.ventana_segundos = ventana_segundos
+        self.reiniciar(total)
+
+    def reiniciar(self, total: int = 0):
+        with self._lock:
+            self.total = total
+            self.completados = 0
+            self.fallidos = 0
+            self.en_cache = 0
+            self.en_curso: Dict[str, float] = {}
+            self.etapa = 'En espera'
+            self.inicio: Optional[float] = None
+            self.fin: Optional[float] = None
+            self.clase: Optional[str] = None
+            # Latencias por RUC (solo consultas reales, no cache) y marcas de tiempo de finalización
+            self._latencias: deque = deque(maxlen=1000)
+            self._finalizados: deque = deque()
+
+    # --- Entrada de eventos ---
+    def manejar_evento(self, evento: str, datos: Dict[str, Any]):
+        ahora = time.monotonic()
+        with self._lock:
+            if evento == 'lote_inicio':
+                self.clase = datos.get('clase')
+            elif self.clase and datos.get('clase', self.clase) != self.clase:
+                return
+            if evento == 'lote_inicio':
+                self.total = int(datos.get('total', 0))
+                self.inicio = ahora
+                self.fin = None
+                self.etapa = 'Consultando SUNAT'
+            elif evento == 'ruc_inicio':
+                self.en_curso[datos.get('ruc', '')] = ahora
+            elif evento == 'ruc_cache':
+                self.en_curso.pop(datos.get('ruc', ''), None)
+                self.en_cache += 1
+                self._finalizados.append(ahora)
+            elif evento == 'ruc_fin':
+                inicio_ruc = self.en_curso.pop(datos.get('ruc', ''), None)
+                duracion = datos.get('duracion')
+                if duracion is None and inicio_ruc is not None:
+                    duracion = ahora - inicio_ruc
+                if datos.get('exito'):
+                    self.completados += 1
+                else:
+                    self.fallidos += 1
+                if duracion is not None:
+                    self._latencias.append(float(duracion))
+                self._finalizados.append(ahora)
+            elif evento == 'reporte_inicio':
+                self.etapa = 'Generando reporte'
+            elif evento == 'reporte_fin':
+                self.etapa = 'Reporte generado'
+            elif evento == 'lote_fin':
+                self.fin = ahora
+                self.etapa = 'Finalizado'
+
+    # --- Lectura ---
+    def resumen(self) -> Dict[str, Any]:
+        """Devuelve una foto de las métricas actuales."""
+        with self._lock:
+            ahora = self.fin or time.monotonic()
+            while self._finalizados and ahora - self._finalizados[0] > self.ventana_segundos:
+                self._finalizados.popleft()
+
+            procesados = self.completados + self.fallidos + self.en_cache
+            transcurrido = (ahora - self.inicio) if self.inicio else 0.0
+
+            # Throughput móvil sobre la ventana (o sobre todo el lote si aún es más corto)
+            ventana = min(self.ventana_segundos, transcurrido) if transcurrido else 0.0
+            rucs_por_min = (len(self._finalizados) / ventana * 60) if ventana > 0 else 0.0
+
+            restantes = max(self.total - procesados, 0)
+            eta_segundos = (restantes / rucs_por_min * 60) if rucs_por_min > 0 else None
+            tasa_exito = (self.completados + self.en_cache) / procesados if procesados else None
+
+            latencias = list(self._latencias)
+            return {
+                'total': self.total,
+                'procesados': procesados,
+                'completados': self.completados,
+                'fallidos': self.fallidos,
+                'en_cache': self.en_cache,
+                'en_curso': len(self.en_curso),
+                'rucs_por_min': rucs_por_min,
+                'tasa_exito': tasa_exito,
+                'latencia_p50': percentil(latencias, 50),
+                'latencia_p95': percentil(latencias, 95),
+                'eta_segundos': eta_segundos,
+                'transcurrido_segundos': transcurrido,
+                'fraccion': (procesados / self.total) if self.total else 0.0,
+                'etapa': self.etapa,
+            }
+
+    def formatear(self) -> str:
+        """Texto compacto con las métricas (usado por la GUI y por la CLI)."""
+        r = self.resumen()
+
+        def seg(valor):
+            if valor is None:
+                return '--'
+            valor = int(valor)
+            return f"{valor // 3600:d}:{valor % 3600 // 60:02d}:{valor % 60:02d}"
+
+        def lat(valor):
+            return f"{valor:.1f}s" if valor is not None else '--'
+
+        exito = f"{r['tasa_exito'] * 100:.0f}%" if r['tasa_exito'] is not None else '--'
+        return (
+            f"{r['etapa']} • {r['procesados']}/{r['total']}\n"
+            f"OK {r['completados']} | Fallidos {r['fallidos']} | Cache {r['en_cache']} | En curso {r['en_curso']}\n"
+            f"{r['rucs_por_min']:.1f} RUC/min | Éxito {exito} | p50 {lat(r['latencia_p50'])} | p95 {lat(r['latencia_p95'])}\n"
+            f"Transcurrido {seg(r['transcurrido_segundos'])} | ETA {seg(r['eta_segundos'])}"
+        )
\ No newline at end of file
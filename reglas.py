@@ -0,0 +1,101 @@
+# reglas.py (Reglas de negocio de la columna RESULTADO, definidas como datos)
+"""
+Cada regla es {'resultado': texto, 'condiciones': [[columna, operador, valor], ...]}.
+Se evalúan en orden y gana la primera regla cuyas condiciones se cumplen todas; las filas
+que no cumplen ninguna quedan con RESULTADO vacío.
+
+Operadores:
+    '==', '!='            texto, sin distinguir mayúsculas ni espacios al inicio/fin
+    '<', '<=', '>', '>='  numérico (lo no numérico cuenta como 0)
+    'en', 'no_en'         la columna (p.ej. RUC) está en un conjunto con nombre: 'clientes'
+                          (RUCs que ya son clientes) o 'bpm' (RUCs ya gestionados en BPM)
+
+Las reglas pueden leerse de un JSON con la misma estructura (cargar_reglas) para ajustar
+umbrales sin tocar el código.
+"""
+import json
+from typing import Any, Dict, List, Optional, Set
+
+import pandas as pd
+
+RESULTADO_BPM = 'Gestionado en BPM'
+
+REGLAS_RESULTADO: List[Dict[str, Any]] = [
+    # RUCs que estaban en Buzon EPS y en Clientes Activos
+    {'resultado': 'Enviar Correo Administrador', 'condiciones': [['RUC', 'en', 'clientes']]},
+    # RUCs del buzón ya trabajados en la Base BPM
+    {'resultado': RESULTADO_BPM, 'condiciones': [['RUC', 'en', 'bpm']]},
+    {'resultado': 'Derivar a Mary Huanay', 'condiciones': [['Tipo Contibuyente', '==', 'PERSONA NATURAL SIN NEGOCIO']]},
+    {'resultado': 'Enviar Correo a Líder', 'condiciones': [['ADM SAC', '!=', 'NUEVO']]},
+    {'resultado': 'Asignar Nuevo', 'condiciones': [['Cantidad de Trabajadores', '<', 50]]},
+    {'resultado': 'Enviar Correo a Líder', 'condiciones': [['Cantidad de Trabajadores', '>=', 50]]},
+]
+
+OPERADORES_TEXTO = {'==', '!='}
+OPERADORES_NUMERICOS = {'<', '<=', '>', '>='}
+OPERADORES_CONJUNTO = {'en', 'no_en'}
+
+
+def validar_reglas(reglas: List[Dict[str, Any]]):
+    """Lanza ValueError si alguna regla no tiene la estructura esperada."""
+    operadores = OPERADORES_TEXTO | OPERADORES_NUMERICOS | OPERADORES_CONJUNTO
+    for i, regla in enumerate(reglas, start=1):
+        if 'resultado' not in regla or not isinstance(regla.get('condiciones'), list):
+            raise ValueError(f"Regla {i}: se esperaba {{'resultado': ..., 'condiciones': [...]}}")
+        for condicion in regla['condiciones']:
+            if len(condicion) != 3 or condicion[1] not in operadores:
+                raise ValueError(f"Regla {i}: condición no válida {condicion}")
+            if condicion[1] in OPERADORES_NUMERICOS and not isinstance(condicion[2], (int, float)):
+                raise ValueError(f"Regla {i}: el valor de '{condicion[1]}' debe ser numérico")
+
+
+def cargar_reglas(ruta_json: str) -> List[Dict[str, Any]]:
+    """Lee y valida reglas desde un archivo JSON (lista de reglas)."""
+    with open(ruta_json, 'r', encoding='utf-8') as f:
+        reglas = json.load(f)
+    if not isinstance(reglas, list):
+        raise ValueError("El archivo de reglas debe contener una lista de reglas")
+    validar_reglas(reglas)
+    return reglas
+
+
+def aplicar_reglas(df: pd.DataFrame, reglas: Optional[List[Dict[str, Any]]] = None,
+                   conjuntos: Optional[Dict[str, Set[str]]] = None) -> pd.Series:
+    """
+    Calcula RESULTADO para todas las filas de 'df' de forma vectorizada (una máscara por condición).
+    'conjuntos' da los conjuntos con nombre que usan los operadores 'en'/'no_en'.
+    """
+    reglas = REGLAS_RESULTADO if reglas is None else reglas
+    conjuntos = conjuntos or {}
+    resultado = pd.Series('', index=df.index, dtype=object)
+    pendientes = pd.Series(True, index=df.index)
+    normalizadas: Dict[Any, pd.Series] = {}
+
+    def columna(nombre: str, tipo: str) -> pd.Series:
+        clave = (nombre, tipo)
+        if clave not in normalizadas:
+            serie = df[nombre] if nombre in df.columns else pd.Series('', index=df.index)
+            if tipo == 'numero':
+                normalizadas[clave] = pd.to_numeric(serie, errors='coerce').fillna(0)
+            elif tipo == 'texto':
+                normalizadas[clave] = serie.astype(str).str.strip().str.upper()
+            else:
+                normalizadas[clave] = serie.astype(str).str.strip()
+        return normalizadas[clave]
+
+    for regla in reglas:
+        mascara = pendientes.copy()
+        for nombre, operador, valor in regla['condiciones']:
+            if operador in OPERADORES_TEXTO:
+                iguales = columna(nombre, 'texto') == str(valor).strip().upper()
+                mascara &= iguales if operador == '==' else ~iguales
+            elif operador in OPERADORES_NUMERICOS:
+                numeros = columna(nombre, 'numero')
+                mascara &= {'<': numeros < valor, '<=': numeros <= valor,
+                            '>': numeros > valor, '>=': numeros >= valor}[operador]
+            else:
+                pertenece = columna(nombre, 'clave').isin(conjuntos.get(valor, set()))
+                mascara &= pertenece if operador == 'en' else ~pertenece
+        resultado[mascara] = regla['resultado']
+        pendientes &= ~mascara
+    return resultado
\ No newline at end of file
@@ -0,0 +1,149 @@
+# servicio.py (Servicio HTTP/JSON local para consultar un RUC con navegadores pre-calentados)
+"""
+Uso:
+    python main.py --servicio --clientes CLIENTES.xlsx [--buzon BUZON.xlsx] [--carpeta DIR] [--puerto 8080]
+
+Endpoints:
+    GET /ruc/<ruc>   datos principal + trabajadores parseados y RESULTADO calculado (JSON)
+    GET /salud       estado del pool de navegadores
+"""
+import json
+import os
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+import proceso_datos as logica_datos
+import web_scraping as ws
+import planificador
+
+PATRON_RUC = re.compile(r'^/ruc/(\d{11})/?$')
+
+
+class ServicioConsultaRuc:
+    """Lógica del servicio: cache de HTML, bases de entrada en memoria y cálculo de RESULTADO."""
+    def __init__(self, ruta_base: str, ruta_clientes_activos: Optional[str] = None,
+                 ruta_buzon_eps: Optional[str] = None, ruta_base_bpm: Optional[str] = None,
+                 trabajadores: int = 2,
+                 max_edad_cache_horas: float = 24.0, timeout_segundos: float = 120.0,
+                 planificador_consultas: Optional[planificador.PlanificadorConsultas] = None,
+                 reglas: Optional[List[Dict[str, Any]]] = None,
+                 reciclar_cada: Optional[int] = None, limite_rss_mb: Optional[float] = None):
+        self.ruta_base = ruta_base
+        self.reglas = reglas
+        self.carpeta_html = os.path.join(ruta_base, 'html_consultas')
+        self.max_edad_cache_segundos = max_edad_cache_horas * 3600
+        self.timeout_segundos = timeout_segundos
+        # Bases de entrada en memoria: se releen solo si el archivo cambia (el servicio corre por días)
+        self.ruta_buzon_eps = ruta_buzon_eps
+        self.ruta_clientes_activos = ruta_clientes_activos
+        self.ruta_base_bpm = ruta_base_bpm
+        self._bases_cache = logica_datos.CacheBasesEntrada()
+        self.bases()
+        # Las consultas del servicio entran como INTERACTIVA: si se comparte el planificador
+        # con un lote en curso, se atienden con el siguiente navegador libre
+        self.planificador = planificador_consultas or planificador.PlanificadorConsultas(
+            trabajadores, reciclar_cada=reciclar_cada, limite_rss_mb=limite_rss_mb)
+
+    def bases(self) -> logica_datos.BasesEntrada:
+        """Bases de entrada vigentes (todas opcionales: si un archivo falta o no se puede leer, queda en None)."""
+        return logica_datos.BasesEntrada(
+            buzon=self._bases_cache.obtener(self.ruta_buzon_eps, 'Buzon EPS', logica_datos.COLUMNAS_RUC_BUZON,
+                                            logica_datos.CAMPOS_BUZON, obligatoria=False),
+            clientes=self._bases_cache.obtener(self.ruta_clientes_activos, 'Clientes Activos',
+                                               logica_datos.COLUMNAS_RUC_CLIENTES, logica_datos.CAMPOS_CLIENTES,
+                                               obligatoria=False),
+            bpm=self._bases_cache.obtener(self.ruta_base_bpm, 'Base BPM', logica_datos.COLUMNAS_RUC_BPM,
+                                          logica_datos.CAMPOS_BPM, obligatoria=False),
+        )
+
+    def iniciar(self):
+        print(f"🚀 Pre-calentando {self.planificador.trabajadores} navegador(es)...")
+        self.planificador.iniciar(precalentar=True)
+        print("✅ Pool de navegadores listo.")
+
+    def consultar(self, ruc: str) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        bases = self.bases()
+        es_cliente = bases.clientes is not None and ruc in bases.clientes
+        en_bpm = bases.bpm is not None and ruc in bases.bpm
+        fuente = 'clientes_activos' if es_cliente else 'base_bpm'
+        datos = {'principal': {}, 'trabajadores': []}
+
+        if not (es_cliente or en_bpm):
+            # Los RUCs que ya son clientes o ya se gestionaron en BPM no se consultan en SUNAT (igual que en la GUI)
+            if ws.html_en_cache(ruc, self.ruta_base, self.max_edad_cache_segundos):
+                fuente = 'cache'
+            else:
+                fuente = 'sunat'
+                futuro = self.planificador.consultar(ruc, self.ruta_base, prioridad=planificador.INTERACTIVA)
+                if not futuro.result(timeout=self.timeout_segundos):
+                    raise RuntimeError(f"No se pudo consultar el RUC {ruc} en SUNAT")
+            datos = logica_datos.leer_datos_ruc(ruc, self.carpeta_html)
+
+        # La fila se arma con la misma función que la pestaña VALIDACION FINAL del reporte
+        fila = logica_datos.validacion_final_de_ruc(ruc, datos, bases, self.reglas)
+
+        return {
+            'ruc': ruc,
+            'fuente': fuente,
+            'validacion': fila,
+            'principal': datos['principal'],
+            'trabajadores': datos['trabajadores'],
+            'duracion_s': round(time.perf_counter() - inicio, 3),
+        }
+
+
+def _crear_manejador(servicio: ServicioConsultaRuc):
+    class Manejador(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            print(f"🌐 {self.address_string()} {format % args}")
+
+        def _json(self, codigo: int, cuerpo: Dict[str, Any]):
+            datos = json.dumps(cuerpo, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(codigo)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            ruta = self.path.split('?')[0]
+            if ruta == '/salud':
+                self._json(200, {'estado': 'ok', 'planificador': servicio.planificador.estadisticas()})
+                return
+            coincidencia = PATRON_RUC.match(ruta)
+            if not coincidencia:
+                self._json(404 if not ruta.startswith('/ruc/') else 400,
+                           {'error': 'Use GET /ruc/<ruc de 11 dígitos>'})
+                return
+            try:
+                self._json(200, servicio.consultar(coincidencia.group(1)))
+            except TimeoutError:
+                self._json(504, {'error': 'Tiempo de espera agotado consultando SUNAT'})
+            except Exception as e:
+                self._json(502, {'error': str(e)})
+
+    return Manejador
+
+
+def ejecutar_servicio(ruta_base: str, puerto: int = 8080, host: str = '127.0.0.1',
+                      ruta_clientes_activos: Optional[str] = None, ruta_buzon_eps: Optional[str] = None,
+                      ruta_base_bpm: Optional[str] = None, trabajadores: int = 2,
+                      max_edad_cache_horas: float = 24.0, reglas: Optional[List[Dict[str, Any]]] = None,
+                      reciclar_cada: Optional[int] = None, limite_rss_mb: Optional[float] = None):
+    """Inicia el pool de navegadores y atiende peticiones hasta Ctrl+C."""
+    servicio = ServicioConsultaRuc(ruta_base, ruta_clientes_activos, ruta_buzon_eps, ruta_base_bpm,
+                                   trabajadores, max_edad_cache_horas, reglas=reglas,
+                                   reciclar_cada=reciclar_cada, limite_rss_mb=limite_rss_mb)
+    servicio.iniciar()
+    servidor = ThreadingHTTPServer((host, puerto), _crear_manejador(servicio))
+    print(f"🟢 Servicio de consulta RUC escuchando en http://{host}:{puerto}/ruc/<ruc>")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servicio.planificador.detener()
\ No newline at end of file
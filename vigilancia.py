@@ -0,0 +1,217 @@
+# vigilancia.py (Modo desatendido: vigila una carpeta de entrada de libros Buzon EPS)
+"""
+Cada libro Buzon EPS que aparece en la carpeta de entrada se procesa como un lote con el mismo
+navegador (pre-calentado y persistente), las bases Clientes Activos / BPM en memoria (se recargan
+solo si el archivo cambia) y la cache de HTML de la carpeta de trabajo (solo se reutiliza el HTML
+descargado hace menos de --max-edad-cache-horas). El reporte terminado se
+mueve a la bandeja de salida y el libro de entrada a 'procesados/' (o 'errores/').
+
+El archivo 'estado_vigilancia.json' (en la bandeja de salida) tiene la cola de pendientes, el
+archivo en proceso y el historial con los tiempos de cada archivo.
+
+Uso:
+    python main.py --vigilar ENTRADA --bandeja-salida SALIDA --clientes CLIENTES.xlsx [--bpm BPM.xlsx] [--una-vez]
+"""
+import json
+import os
+import shutil
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import proceso_datos as logica_datos
+import planificador as plan
+import lote
+import instrumentacion
+
+EXTENSIONES_ENTRADA = ('.xlsx', '.xlsm', '.xls')
+ARCHIVO_ESTADO = 'estado_vigilancia.json'
+MAX_HISTORIAL = 200
+
+
+class VigilanteBuzon:
+    """Detecta libros nuevos en la carpeta de entrada y los procesa de a uno, en orden de llegada."""
+    def __init__(self, carpeta_entrada: str, bandeja_salida: str, ruta_clientes_activos: str,
+                 ruta_base_bpm: Optional[str] = None, carpeta_trabajo: Optional[str] = None,
+                 intervalo_segundos: float = 10.0, usar_cache: bool = True,
+                 reglas: Optional[List[Dict[str, Any]]] = None, delta: bool = False,
+                 max_edad_cache_horas: Optional[float] = 24.0,
+                 reciclar_cada: Optional[int] = None, limite_rss_mb: Optional[float] = None):
+        self.carpeta_entrada = carpeta_entrada
+        self.bandeja_salida = bandeja_salida
+        self.ruta_clientes_activos = ruta_clientes_activos
+        self.ruta_base_bpm = ruta_base_bpm
+        # La carpeta de trabajo guarda 'html_consultas' (cache) y las métricas de cada lote
+        self.carpeta_trabajo = carpeta_trabajo or os.path.join(bandeja_salida, 'trabajo')
+        self.intervalo_segundos = intervalo_segundos
+        self.usar_cache = usar_cache
+        # None = sin límite de antigüedad para el HTML en cache
+        self.max_edad_cache_segundos = max_edad_cache_horas * 3600 if max_edad_cache_horas is not None else None
+        self.reglas = reglas
+        self.delta = delta
+        self.carpeta_procesados = os.path.join(carpeta_entrada, 'procesados')
+        self.carpeta_errores = os.path.join(carpeta_entrada, 'errores')
+        self.ruta_estado = os.path.join(bandeja_salida, ARCHIVO_ESTADO)
+        for carpeta in (self.bandeja_salida, self.carpeta_trabajo, self.carpeta_procesados, self.carpeta_errores):
+            os.makedirs(carpeta, exist_ok=True)
+
+        self.pendientes: Deque[Dict[str, Any]] = deque()
+        self.en_proceso: Optional[Dict[str, Any]] = None
+        self.historial: List[Dict[str, Any]] = []
+        self._vistos: Dict[str, Tuple[int, float]] = {}  # ruta -> (tamaño, mtime) de la última revisión
+        self._bases_cache = logica_datos.CacheBasesEntrada()
+        self.planificador = plan.PlanificadorConsultas(trabajadores=1, reciclar_cada=reciclar_cada,
+                                                       limite_rss_mb=limite_rss_mb)
+
+    # --- Bases compartidas en memoria (Clientes Activos y BPM se releen solo si el archivo cambió) ---
+    def _bases_para(self, ruta_buzon: str) -> logica_datos.BasesEntrada:
+        return logica_datos.BasesEntrada(
+            buzon=logica_datos.cargar_base_entrada(ruta_buzon, 'Buzon EPS', logica_datos.COLUMNAS_RUC_BUZON,
+                                                   logica_datos.CAMPOS_BUZON),
+            clientes=self._bases_cache.obtener(self.ruta_clientes_activos, 'Clientes Activos',
+                                           logica_datos.COLUMNAS_RUC_CLIENTES, logica_datos.CAMPOS_CLIENTES, True),
+            bpm=self._bases_cache.obtener(self.ruta_base_bpm, 'Base BPM', logica_datos.COLUMNAS_RUC_BPM,
+                                      logica_datos.CAMPOS_BPM, False),
+        )
+
+    # --- Detección de archivos ---
+    def revisar_entrada(self) -> int:
+        """
+        Encola los libros nuevos de la carpeta de entrada. Un archivo se encola cuando su tamaño y
+        fecha no cambiaron desde la revisión anterior (para no leer uno que se está copiando).
+        Devuelve cuántos se encolaron.
+        """
+        encolados = {item['ruta'] for item in self.pendientes}
+        if self.en_proceso:
+            encolados.add(self.en_proceso['ruta'])
+        actuales = {}
+        nuevos = 0
+        for nombre in sorted(os.listdir(self.carpeta_entrada)):
+            ruta = os.path.join(self.carpeta_entrada, nombre)
+            if (not os.path.isfile(ruta) or nombre.startswith(('~$', '.'))
+                    or not nombre.lower().endswith(EXTENSIONES_ENTRADA)):
+                continue
+            estado = os.stat(ruta)
+            actuales[ruta] = (estado.st_size, estado.st_mtime)
+            if ruta in encolados or self._vistos.get(ruta) != actuales[ruta]:
+                continue
+            self.pendientes.append({'archivo': nombre, 'ruta': ruta, 'detectado': time.time()})
+            nuevos += 1
+            print(f"📨 Nuevo archivo en cola: {nombre} ({len(self.pendientes)} pendientes)")
+        self._vistos = actuales
+        return nuevos
+
+    # --- Procesamiento ---
+    def procesar(self, item: Dict[str, Any]):
+        """Procesa un libro Buzon EPS y mueve el reporte a la bandeja de salida."""
+        nombre_base = os.path.splitext(item['archivo'])[0]
+        ruta_reporte = os.path.join(self.carpeta_trabajo, f"{nombre_base}_reporte.xlsx")
+        item.update({'estado': 'en_proceso', 'inicio': time.time()})
+        self.en_proceso = item
+        self.guardar_estado()
+        print(f"\n▶️ Procesando {item['archivo']} (espera en cola: {item['inicio'] - item['detectado']:.1f}s)")
+        try:
+            inicio_bases = time.perf_counter()
+            bases = self._bases_para(item['ruta'])
+            item['lectura_bases_s'] = round(time.perf_counter() - inicio_bases, 3)
+            rucs_ok = lote.ejecutar_lote(
+                ruta_buzon_eps=item['ruta'],
+                ruta_clientes_activos=self.ruta_clientes_activos,
+                ruta_salida=ruta_reporte,
+                ruta_base_bpm=self.ruta_base_bpm,
+                usar_cache=self.usar_cache,
+                max_edad_cache_segundos=self.max_edad_cache_segundos,
+                planificador=self.planificador,
+                reglas=self.reglas,
+                delta=self.delta,
+                bases=bases
+            )
+            item['rucs_ok'] = len(rucs_ok)
+            item['etapas'] = instrumentacion.resumen()[:8]
+            # Se escribe en la carpeta de trabajo y se mueve al final: en la bandeja solo hay reportes completos
+            ruta_delta = os.path.splitext(ruta_reporte)[0] + '_delta.xlsx'
+            for clave, ruta in (('reporte', ruta_reporte), ('reporte_delta', ruta_delta)):
+                if os.path.isfile(ruta):
+                    destino = os.path.join(self.bandeja_salida, os.path.basename(ruta))
+                    os.replace(ruta, destino)
+                    item[clave] = destino
+            if 'reporte' not in item:
+                raise RuntimeError("No se generó el reporte (ningún RUC se consultó con éxito)")
+            item['estado'] = 'ok'
+            carpeta_destino = self.carpeta_procesados
+        except Exception as e:
+            print(f"❌ Error procesando {item['archivo']}: {e}")
+            item.update({'estado': 'error', 'error': str(e)})
+            carpeta_destino = self.carpeta_errores
+        item['fin'] = time.time()
+        item['espera_s'] = round(item['inicio'] - item['detectado'], 3)
+        item['duracion_s'] = round(item['fin'] - item['inicio'], 3)
+        try:
+            shutil.move(item['ruta'], os.path.join(carpeta_destino, f"{time.strftime('%Y%m%d_%H%M%S')}_{item['archivo']}"))
+        except Exception as e:
+            print(f"⚠️ No se pudo mover {item['archivo']}: {e}")
+        self._vistos.pop(item['ruta'], None)
+        self.en_proceso = None
+        self.historial.append(item)
+        del self.historial[:-MAX_HISTORIAL]
+        self.guardar_estado()
+        print(f"🏁 {item['archivo']}: {item['estado']} en {item['duracion_s']:.1f}s")
+
+    def guardar_estado(self):
+        """Escribe el estado (pendientes, en proceso, historial con tiempos) de forma atómica."""
+        def fecha(segundos):
+            return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(segundos)) if segundos else None
+
+        def legible(item):
+            copia = dict(item)
+            for clave in ('detectado', 'inicio', 'fin'):
+                if clave in copia:
+                    copia[clave] = fecha(copia[clave])
+            return copia
+
+        estado = {
+            'actualizado': fecha(time.time()),
+            'en_proceso': legible(self.en_proceso) if self.en_proceso else None,
+            'pendientes': [legible(item) for item in self.pendientes],
+            'historial': [legible(item) for item in reversed(self.historial)],
+        }
+        try:
+            temporal = self.ruta_estado + '.tmp'
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(estado, f, ensure_ascii=False, indent=2, default=str)
+            os.replace(temporal, self.ruta_estado)
+        except Exception as e:
+            print(f"⚠️ No se pudo escribir el estado de vigilancia: {e}")
+
+    def ejecutar(self, una_vez: bool = False):
+        """
+        Bucle principal: revisa la entrada y procesa la cola hasta Ctrl+C.
+        Con 'una_vez', termina cuando la carpeta de entrada queda vacía.
+        """
+        print(f"👀 Vigilando {self.carpeta_entrada} cada {self.intervalo_segundos:.0f}s; reportes en {self.bandeja_salida}")
+        self.planificador.iniciar(precalentar=True)
+        try:
+            while True:
+                if self.revisar_entrada():
+                    self.guardar_estado()
+                while self.pendientes:
+                    self.procesar(self.pendientes.popleft())
+                if una_vez and not self._vistos:
+                    break
+                time.sleep(self.intervalo_segundos)
+        except KeyboardInterrupt:
+            print("\n🛑 Vigilancia detenida.")
+        finally:
+            self.planificador.detener()
+            self.guardar_estado()
+
+
+def ejecutar_vigilancia(carpeta_entrada: str, bandeja_salida: str, ruta_clientes_activos: str,
+                        ruta_base_bpm: Optional[str] = None, carpeta_trabajo: Optional[str] = None,
+                        intervalo_segundos: float = 10.0, usar_cache: bool = True,
+                        reglas: Optional[List[Dict[str, Any]]] = None, delta: bool = False,
+                        max_edad_cache_horas: Optional[float] = 24.0, una_vez: bool = False,
+                        reciclar_cada: Optional[int] = None, limite_rss_mb: Optional[float] = None):
+    VigilanteBuzon(carpeta_entrada, bandeja_salida, ruta_clientes_activos, ruta_base_bpm, carpeta_trabajo,
+                   intervalo_segundos, usar_cache, reglas, delta, max_edad_cache_horas,
+                   reciclar_cada, limite_rss_mb).ejecutar(una_vez)
\ No newline at end of file
@@ -3,44 +3,200 @@ from playwright.sync_api import sync_playwright, Page, TimeoutError as Playwrigh
 import atexit
 import os
 import time
+from typing import Any, Dict, Optional
+import progreso
+import instrumentacion
+from instrumentacion import medir, registrar
 
-# --- Variables Globales y Funciones de Inicialización/Limpieza (sin cambios) ---
-_playwright = None
-_browser = None
-_page = None
+try:
+    import psutil  # Opcional: lectura de RSS de los procesos del navegador
+except ImportError:
+    psutil = None
 
-def _initialize_browser_edge():
-    """Inicializa Playwright y lanza Microsoft Edge."""
-    global _playwright, _browser, _page
-    if _page:
-        return
+# Configurables por variable de entorno (p.ej. para apuntar al servidor local de benchmarks)
+URL_CONSULTA = os.environ.get("SUNAT_URL_CONSULTA", "https://e-consultaruc.sunat.gob.pe/cl-ti-itmrconsruc/jcrS00Alias")
+CANAL_NAVEGADOR = os.environ.get("SUNAT_CANAL_NAVEGADOR", "msedge")  # Vacío = Chromium de Playwright
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36 Edg/110.0.1587.63'
 
-    print("Iniciando Playwright...")
-    _playwright = sync_playwright().start()
+# Reciclaje del contexto/página para lotes largos (0 desactiva el criterio correspondiente)
+RECICLAR_CADA_N = int(os.environ.get("SUNAT_RECICLAR_CADA", "200"))
+LIMITE_RSS_MB = float(os.environ.get("SUNAT_LIMITE_RSS_MB", "1500"))
+VERIFICAR_MEMORIA_CADA = int(os.environ.get("SUNAT_VERIFICAR_MEMORIA_CADA", "20"))
 
-    print("🚀 Lanzando navegador Microsoft Edge...")
-    try:
-        _browser = _playwright.chromium.launch(
-            channel="msedge",
-            headless=True
-        )
-        context = _browser.new_context(
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/110.0.0.0 Safari/537.36 Edg/110.0.1587.63'
-        )
-        _page = context.new_page()
-        print("✅ Navegador Edge listo.")
-    except Exception as e:
-        print(f"\n❌ ERROR CRÍTICO: No se pudo iniciar Microsoft Edge: {e}")
-        raise SystemExit("Abortando ejecución.")
+
+class SesionNavegador:
+    """
+    Playwright + navegador + contexto + página usados para consultar SUNAT.
+    El contexto y la página se reciclan cada 'reciclar_cada' RUCs o cuando la memoria
+    del navegador supera 'limite_rss_mb', conservando las cookies aún vigentes.
+    None en 'reciclar_cada' o 'limite_rss_mb' usa el valor por defecto (variables SUNAT_*).
+    """
+    def __init__(self, reciclar_cada: Optional[int] = None, limite_rss_mb: Optional[float] = None,
+                 verificar_memoria_cada: int = VERIFICAR_MEMORIA_CADA):
+        self.reciclar_cada = RECICLAR_CADA_N if reciclar_cada is None else reciclar_cada
+        self.limite_rss_mb = LIMITE_RSS_MB if limite_rss_mb is None else limite_rss_mb
+        self.verificar_memoria_cada = verificar_memoria_cada
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.consultas_desde_reciclaje = 0
+        self.reciclajes = 0
+        self.relanzamientos = 0
+
+    def iniciar(self):
+        """Inicializa Playwright y lanza Microsoft Edge (no hace nada si ya está iniciado)."""
+        if self.page:
+            return
+
+        print("Iniciando Playwright...")
+        self.playwright = sync_playwright().start()
+
+        print("🚀 Lanzando navegador Microsoft Edge...")
+        try:
+            with medir('navegador_lanzamiento'):
+                self.browser = self.playwright.chromium.launch(
+                    channel=CANAL_NAVEGADOR or None,
+                    headless=True
+                )
+                self._abrir_contexto()
+            print("✅ Navegador Edge listo.")
+        except Exception as e:
+            print(f"\n❌ ERROR CRÍTICO: No se pudo iniciar Microsoft Edge: {e}")
+            # Liberar Playwright para que un intento posterior (p.ej. en modo vigilancia) empiece limpio
+            self.cerrar()
+            raise SystemExit("Abortando ejecución.")
+
+    def _abrir_contexto(self, estado: Optional[Dict[str, Any]] = None):
+        self.context = self.browser.new_context(user_agent=USER_AGENT, storage_state=estado)
+        self.page = self.context.new_page()
+        self.consultas_desde_reciclaje = 0
+
+    def _estado_vigente(self) -> Optional[Dict[str, Any]]:
+        """Cookies del contexto actual que aún no han expirado (para reutilizarlas al reciclar)."""
+        try:
+            estado = self.context.storage_state()
+        except Exception:
+            return None
+        ahora = time.time()
+        estado['cookies'] = [c for c in estado.get('cookies', []) if c.get('expires', -1) <= 0 or c['expires'] > ahora]
+        return estado
+
+    def medir_memoria(self) -> Dict[str, Optional[float]]:
+        """
+        RSS total de los procesos del navegador (requiere psutil) y heap JS de la página, en MB.
+        Los valores que no se puedan obtener quedan en None.
+        """
+        lectura: Dict[str, Optional[float]] = {'rss_mb': None, 'js_heap_mb': None}
+        if psutil is not None and self.browser:
+            try:
+                cdp = self.browser.new_browser_cdp_session()
+                try:
+                    procesos = cdp.send('SystemInfo.getProcessInfo').get('processInfo', [])
+                finally:
+                    cdp.detach()
+                total = 0
+                for proceso in procesos:
+                    try:
+                        total += psutil.Process(proceso['id']).memory_info().rss
+                    except Exception:
+                        continue
+                lectura['rss_mb'] = round(total / (1024 * 1024), 1)
+            except Exception:
+                pass
+        if self.page:
+            try:
+                heap = self.page.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : null")
+                if heap is not None:
+                    lectura['js_heap_mb'] = round(heap / (1024 * 1024), 1)
+            except Exception:
+                pass
+        return lectura
+
+    def navegador_conectado(self) -> bool:
+        """False si el proceso del navegador terminó (caída de Edge) o aún no se lanzó."""
+        try:
+            return self.browser is not None and self.browser.is_connected()
+        except Exception:
+            return False
+
+    def relanzar(self, motivo: str):
+        """Cierra lo que quede de Playwright y lanza un navegador nuevo (se pierden las cookies)."""
+        print(f"🔁 Relanzando el navegador ({motivo})...")
+        self.cerrar()
+        with medir('navegador_relanzamiento'):
+            self.iniciar()
+        self.relanzamientos += 1
+        instrumentacion.registrar_evento('navegador_relanzado', motivo=motivo, relanzamientos=self.relanzamientos)
+        progreso.emitir('navegador_relanzado', motivo=motivo, relanzamientos=self.relanzamientos)
+
+    def reciclar(self, motivo: str):
+        """Cierra el contexto actual y abre uno nuevo con las cookies vigentes."""
+        if not self.navegador_conectado():
+            # Con el navegador caído no hay contexto que reciclar: se relanza completo
+            self.relanzar(f"navegador desconectado; {motivo}")
+            return
+        print(f"♻️ Reciclando contexto del navegador ({motivo})...")
+        estado = self._estado_vigente()
+        with medir('navegador_reciclaje'):
+            try:
+                self.context.close()
+            except Exception:
+                pass
+            try:
+                self._abrir_contexto(estado)
+            except Exception:
+                # Si las cookies guardadas no son aceptadas, empezar con un contexto limpio
+                self._abrir_contexto()
+        self.reciclajes += 1
+        instrumentacion.registrar_evento('navegador_reciclado', motivo=motivo, reciclajes=self.reciclajes)
+        progreso.emitir('navegador_reciclado', motivo=motivo, reciclajes=self.reciclajes)
+
+    def antes_de_consultar(self):
+        """Inicia el navegador si hace falta y recicla el contexto si corresponde."""
+        self.iniciar()
+        if not self.navegador_conectado():
+            self.relanzar("el proceso del navegador terminó")
+        elif self.page.is_closed():
+            self.reciclar("página cerrada")
+        elif self.reciclar_cada and self.consultas_desde_reciclaje >= self.reciclar_cada:
+            self.reciclar(f"{self.consultas_desde_reciclaje} consultas")
+        elif (self.verificar_memoria_cada and self.consultas_desde_reciclaje
+              and self.consultas_desde_reciclaje % self.verificar_memoria_cada == 0):
+            lectura = self.medir_memoria()
+            instrumentacion.registrar_evento('navegador_memoria', consultas=self.consultas_desde_reciclaje, **lectura)
+            progreso.emitir('navegador_memoria', **lectura)
+            if self.limite_rss_mb and lectura['rss_mb'] is not None and lectura['rss_mb'] > self.limite_rss_mb:
+                self.reciclar(f"RSS {lectura['rss_mb']:.0f} MB > {self.limite_rss_mb:.0f} MB")
+        self.consultas_desde_reciclaje += 1
+
+    def cerrar(self):
+        """Cierra el navegador y Playwright de forma segura."""
+        if self.browser:
+            print("\nCerrando navegador...")
+            try:
+                self.browser.close()
+            except Exception:
+                pass
+        if self.playwright:
+            try:
+                self.playwright.stop()
+            except Exception:
+                pass  # El driver pudo haber terminado junto con el navegador
+            print("Recursos de Playwright liberados.")
+        self.playwright = self.browser = self.context = self.page = None
+
+
+# --- Sesión global usada por defecto (GUI y CLI) ---
+_sesion = SesionNavegador()
+
+def _initialize_browser_edge():
+    """Inicializa Playwright y lanza Microsoft Edge en la sesión global."""
+    _sesion.iniciar()
 
 def _cleanup():
     """Cierra el navegador y Playwright de forma segura."""
-    if _browser:
-        print("\nCerrando navegador...")
-        _browser.close()
-    if _playwright:
-        _playwright.stop()
-    print("Recursos de Playwright liberados.")
+    _sesion.cerrar()
 
 atexit.register(_cleanup)
 
@@ -53,57 +209,99 @@ def guardar_html(ruc: str, html_content: str, ruta_base: str, sufijo: str):
         os.makedirs(directorio_html, exist_ok=True)
         nombre_archivo = f"RUC_{ruc}{sufijo}.html"
         ruta_archivo = os.path.join(directorio_html, nombre_archivo)
-        with open(ruta_archivo, 'w', encoding='utf-8') as f:
+        with medir('guardar_html'), open(ruta_archivo, 'w', encoding='utf-8') as f:
             f.write(html_content)
         print(f"📄 HTML guardado como: {nombre_archivo}")
     except Exception as e:
         print(f"⚠️ ADVERTENCIA: No se pudo guardar el archivo HTML para RUC {ruc} ({sufijo}): {e}")
 
+def html_en_cache(ruc: str, ruta_base: str, max_edad_segundos: Optional[float] = None) -> bool:
+    """
+    Indica si el HTML principal del RUC ya existe en la carpeta 'html_consultas'.
+    Con 'max_edad_segundos', solo cuenta si el archivo es más reciente que esa edad.
+    """
+    if not ruta_base:
+        return False
+    ruta = os.path.join(ruta_base, "html_consultas", f"RUC_{ruc}_principal.html")
+    if not os.path.isfile(ruta):
+        return False
+    if max_edad_segundos is not None:
+        return time.time() - os.path.getmtime(ruta) <= max_edad_segundos
+    return True
+
 # --- Función Principal de Scraping (sin cambios en su lógica interna) ---
-def consultar_y_guardar_todo(ruc: str, ruta_base_guardado: str) -> bool:
+def consultar_y_guardar_todo(ruc: str, ruta_base_guardado: str, usar_cache: bool = False,
+                             sesion: Optional[SesionNavegador] = None,
+                             max_edad_cache_segundos: Optional[float] = None) -> bool:
     """
     Consulta un RUC, guarda el HTML principal y el de trabajadores.
+    Si 'usar_cache' es True y el HTML principal ya fue descargado (hace menos de
+    'max_edad_cache_segundos', si se indica), no se consulta SUNAT.
+    'sesion' permite usar un navegador propio (por defecto, la sesión global).
     Devuelve True si tuvo éxito al obtener el HTML principal, False en caso contrario.
     """
-    _initialize_browser_edge()
-    url_consulta = "https://e-consultaruc.sunat.gob.pe/cl-ti-itmrconsruc/jcrS00Alias"
+    if usar_cache and html_en_cache(ruc, ruta_base_guardado, max_edad_cache_segundos):
+        print(f"♻️ RUC {ruc} ya descargado, se reutiliza el HTML existente.")
+        progreso.emitir('ruc_cache', ruc=ruc)
+        return True
+
+    sesion = sesion or _sesion
+    sesion.antes_de_consultar()
+    page = sesion.page
+    inicio = time.monotonic()
+    progreso.emitir('ruc_inicio', ruc=ruc)
+    url_consulta = URL_CONSULTA
     print(f"🔎 Consultando RUC: {ruc}...")
     max_intentos = 3
 
     for intento in range(max_intentos):
         try:
             # --- FASE 1: OBTENER PÁGINA PRINCIPAL ---
-            _page.goto(url_consulta, wait_until='domcontentloaded', timeout=45000)
-            _page.locator('input#txtRuc').fill(ruc)
-            _page.locator('button#btnAceptar').click()
-            _page.wait_for_selector('div.list-group', timeout=45000)
+            with medir('scraping_goto'):
+                page.goto(url_consulta, wait_until='domcontentloaded', timeout=45000)
+            with medir('scraping_formulario'):
+                page.locator('input#txtRuc').fill(ruc)
+                page.locator('button#btnAceptar').click()
+            with medir('scraping_wait_resultado'):
+                page.wait_for_selector('div.list-group', timeout=45000)
             
-            html_principal = _page.content()
+            html_principal = page.content()
             guardar_html(ruc, html_principal, ruta_base_guardado, "_principal")
 
             # --- FASE 2: OBTENER PÁGINA DE TRABAJADORES ---
             try:
                 print("   Buscando botón de 'Cantidad de Trabajadores'...")
-                boton_trabajadores = _page.locator('button:has-text("Cantidad de Trabajadores")')
-                boton_trabajadores.click()
+                boton_trabajadores = page.locator('button:has-text("Cantidad de Trabajadores")')
+                with medir('scraping_trabajadores_click'):
+                    boton_trabajadores.click()
                 print("   ✅ Clic realizado. Esperando página de trabajadores...")
-                _page.wait_for_load_state('networkidle', timeout=30000)
-                html_trabajadores = _page.content()
+                with medir('scraping_trabajadores_networkidle'):
+                    page.wait_for_load_state('networkidle', timeout=30000)
+                html_trabajadores = page.content()
                 guardar_html(ruc, html_trabajadores, ruta_base_guardado, "_trabajadores")
-                _page.go_back()
+                with medir('scraping_go_back'):
+                    page.go_back()
             except PlaywrightTimeoutError:
                 print("   ⚠️ No se encontró el botón de 'Cantidad de Trabajadores' o la página no cargó.")
             except Exception as e_click:
                 print(f"   ⚠️ Error al obtener datos de trabajadores: {e_click}")
             
+            duracion = time.monotonic() - inicio
+            registrar('scraping_ruc_total', duracion)
+            progreso.emitir('ruc_fin', ruc=ruc, exito=True, duracion=duracion)
             return True # Éxito
 
         except Exception as e:
             print(f"   ⚠️ Falló el intento {intento + 1}: {e}")
             if intento < max_intentos - 1:
                 time.sleep(3)
+                # Si la página se cerró o el navegador cayó, continuar con un contexto (o navegador) nuevo
+                if not sesion.navegador_conectado() or page.is_closed():
+                    sesion.reciclar("página cerrada tras error")
+                    page = sesion.page
             else:
                 print(f"❌ Se superaron los {max_intentos} intentos para el RUC {ruc}.")
+                progreso.emitir('ruc_fin', ruc=ruc, exito=False, duracion=time.monotonic() - inicio)
                 return False # Fracaso
     return False
 